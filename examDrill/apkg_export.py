@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Anki Package (.apkg) Exporter
+
+Writes a deck Anki imports in one step, with no manual media copying:
+
+    anki_import.apkg  (a ZIP)
+        collection.anki2   SQLite collection (schema 11) with one Basic
+                           note and card per drill card
+        media              JSON map {"0": "000123.png", ...}
+        0, 1, 2, ...       the media files, stored uncompressed
+
+Cards are the same dicts org_to_anki.py builds (HTML front/back, tags and
+the ``media`` list from extract_media), so fields render exactly as the
+CSV import would. Notes and cards are inserted with executemany inside a
+single transaction with journaling off; the collection is built in a
+temporary file and removed once it is in the package.
+
+Model and deck ids are derived from their names. Note GUIDs are the
+card's ``guid`` (build_manifest.note_guid: from its :ID: property, else
+its question), the same the CSV carries, so re-importing an updated
+package or CSV updates the existing notes instead of duplicating them.
+
+Cards that carry a ``schedule`` (see scheduling.py) are written as review
+cards with their interval, ease and due day; the rest are new cards.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import date
+from hashlib import sha1
+
+logger = logging.getLogger(__name__)
+
+DECK_NAME = 'Mechanical Engineering Exam'
+MODEL_NAME = 'feDrill Basic'
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+SCHEMA = '''
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+'''
+
+CARD_CSS = '''.card {
+ font-family: arial;
+ font-size: 20px;
+ text-align: left;
+ color: black;
+ background-color: white;
+}
+img { max-width: 100%; }
+'''
+
+
+def stable_id(name):
+    """Positive 48-bit id derived from a name, stable across runs."""
+    return int(sha1(name.encode('utf-8')).hexdigest()[:12], 16)
+
+
+def strip_html(text):
+    """Plain text of a field, as Anki uses for the sort field and checksum."""
+    out = []
+    in_tag = False
+    for ch in text:
+        if ch == '<':
+            in_tag = True
+        elif ch == '>':
+            in_tag = False
+        elif not in_tag:
+            out.append(ch)
+    return ''.join(out).strip()
+
+
+def field_checksum(text):
+    """First 32 bits of the SHA-1 of the stripped sort field."""
+    return int(sha1(strip_html(text).encode('utf-8')).hexdigest()[:8], 16)
+
+
+def _collection_json(model_id, deck_id, now):
+    """The conf, models, decks and dconf JSON columns of the col row."""
+    conf = {
+        'activeDecks': [deck_id], 'curDeck': deck_id, 'newSpread': 0, 'collapseTime': 1200,
+        'timeLim': 0, 'estTimes': True, 'dueCounts': True, 'curModel': str(model_id),
+        'nextPos': 1, 'sortType': 'noteFld', 'sortBackwards': False, 'addToCur': True,
+    }
+    model = {
+        'id': model_id, 'name': MODEL_NAME, 'type': 0, 'mod': now, 'usn': -1, 'sortf': 0,
+        'did': deck_id, 'tags': [], 'vers': [], 'css': CARD_CSS,
+        'latexPre': '\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n'
+                    '\\usepackage{amssymb,amsmath}\n\\pagestyle{empty}\n'
+                    '\\setlength{\\parindent}{0in}\n\\begin{document}\n',
+        'latexPost': '\\end{document}',
+        'flds': [
+            {'name': name, 'ord': i, 'sticky': False, 'rtl': False, 'font': 'Arial', 'size': 20, 'media': []}
+            for i, name in enumerate(('Front', 'Back'))
+        ],
+        'tmpls': [{
+            'name': 'Card 1', 'ord': 0, 'did': None, 'bqfmt': '', 'bafmt': '',
+            'qfmt': '{{Front}}', 'afmt': '{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}',
+        }],
+        'req': [[0, 'all', [0]]],
+    }
+    deck_template = {
+        'collapsed': False, 'conf': 1, 'desc': '', 'dyn': 0, 'extendNew': 10, 'extendRev': 50,
+        'lrnToday': [0, 0], 'newToday': [0, 0], 'revToday': [0, 0], 'timeToday': [0, 0],
+        'mod': now, 'usn': -1,
+    }
+    decks = {
+        '1': dict(deck_template, id=1, name='Default'),
+        str(deck_id): dict(deck_template, id=deck_id, name=DECK_NAME),
+    }
+    dconf = {'1': {
+        'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0, 'maxTaken': 60, 'autoplay': True,
+        'timer': 0, 'replayq': True, 'dyn': False,
+        'new': {'delays': [1, 10], 'ints': [1, 4, 7], 'initialFactor': 2500, 'order': 1,
+                'perDay': 20, 'bury': True, 'separate': True},
+        'rev': {'perDay': 100, 'ease4': 1.3, 'fuzz': 0.05, 'maxIvl': 36500, 'bury': True,
+                'minSpace': 1, 'ivlFct': 1},
+        'lapse': {'delays': [10], 'mult': 0, 'minInt': 1, 'leechFails': 8, 'leechAction': 0},
+    }}
+    return (json.dumps(conf), json.dumps({str(model_id): model}),
+            json.dumps(decks), json.dumps(dconf))
+
+
+def build_collection(db_path, cards):
+    """Create the SQLite collection for ``cards`` at ``db_path``."""
+    now = int(time.time())
+    now_ms = now * 1000
+    crt = now - now % 86400
+    model_id = stable_id(MODEL_NAME)
+    deck_id = stable_id(DECK_NAME)
+
+    note_rows = []
+    card_rows = []
+    for position, card in enumerate(cards):
+        note_id = now_ms + position
+        tags = ' ' + ' '.join(t for t in card['tags'].split(',') if t) + ' '
+        note_rows.append((
+            note_id, card['guid'], model_id, now, -1, tags,
+            card['front'] + '\x1f' + card['back'], strip_html(card['front']),
+            field_checksum(card['front']), 0, '',
+        ))
+        schedule = card.get('schedule')
+        if schedule and not schedule['new']:
+            # Review cards keep their org-drill state; due is days since crt
+            due_day = date.fromisoformat(schedule['due']).toordinal() - EPOCH_ORDINAL - crt // 86400
+            card_rows.append((note_id, note_id, deck_id, 0, now, -1, 2, 2, due_day,
+                              max(1, round(schedule['interval'])), int(schedule['ease'] * 1000),
+                              0, 0, 0, 0, 0, 0, ''))
+        else:
+            # New cards, introduced in source order
+            card_rows.append((note_id, note_id, deck_id, 0, now, -1, 0, 0, position + 1,
+                              0, 0, 0, 0, 0, 0, 0, 0, ''))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA)
+        with conn:
+            conf, models, decks, dconf = _collection_json(model_id, deck_id, now)
+            conn.execute('INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, ?)',
+                         (crt, now_ms, now_ms, conf, models, decks, dconf, '{}'))
+            conn.executemany('INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', note_rows)
+            conn.executemany('INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             card_rows)
+    finally:
+        conn.close()
+    return len(note_rows)
+
+
+def media_sources(cards, source_image_dir, image_reference_map=None):
+    """Map each referenced media filename to the file holding its bytes."""
+    image_reference_map = image_reference_map or {}
+    sources = {}
+    missing = set()
+    for card in cards:
+        for filename in card['media']:
+            if filename in sources or filename in missing:
+                continue
+            reference_info = image_reference_map.get(os.path.splitext(filename)[0])
+            if reference_info:
+                sources[filename] = reference_info['stored_path']
+            elif os.path.exists(os.path.join(source_image_dir, filename)):
+                sources[filename] = os.path.join(source_image_dir, filename)
+            else:
+                missing.add(filename)
+    return sources, missing
+
+
+def write_apkg(cards, output_dir, source_image_dir, image_reference_map=None):
+    """Write anki_import.apkg with the collection and every referenced image."""
+    apkg_path = os.path.join(output_dir, 'anki_import.apkg')
+    sources, missing = media_sources(cards, source_image_dir, image_reference_map)
+    for filename in sorted(missing):
+        logger.warning("%s not found, left out of the package", filename)
+
+    fd, db_path = tempfile.mkstemp(suffix='.anki2', dir=output_dir)
+    os.close(fd)
+    os.unlink(db_path)
+    try:
+        note_count = build_collection(db_path, cards)
+
+        media_map = {}
+        with zipfile.ZipFile(apkg_path, 'w') as apkg:
+            apkg.write(db_path, 'collection.anki2', compress_type=zipfile.ZIP_DEFLATED)
+            for number, filename in enumerate(sorted(sources)):
+                media_map[str(number)] = filename
+                info = zipfile.ZipInfo(str(number))
+                info.compress_type = zipfile.ZIP_STORED
+                info.file_size = os.path.getsize(sources[filename])
+                with open(sources[filename], 'rb') as src, apkg.open(info, 'w') as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            apkg.writestr('media', json.dumps(media_map), compress_type=zipfile.ZIP_DEFLATED)
+    finally:
+        if os.path.exists(db_path):
+            os.unlink(db_path)
+
+    logger.info("Anki package created: %s (%s notes, %s media files)", apkg_path, note_count, len(media_map))
+    return apkg_path
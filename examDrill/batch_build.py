@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Batch Deck Builder
+
+Converts many org-drill files in one run with a ProcessPoolExecutor, one
+org_to_deck build per input, each into its own subdirectory of the output
+root that mirrors the input's path:
+
+    exam_drill.org                        -> <root>/exam_drill/
+    unit_Conversions/unit_conversions.org -> <root>/unit_Conversions/unit_conversions/
+
+Inputs are a single .org path, a glob, or a list file (anything else)
+with one path or glob per line, relative to the list file; blank lines
+and ``#`` comments are ignored.
+
+All workers share one image hash cache: the parent loads it once, every
+worker starts from that snapshot and returns only the entries it added,
+and the parent merges and saves them once at the end. Worker output is
+captured and logged in input order, and batch_summary.txt is written in
+input order too, so the result does not depend on scheduling.
+
+Every other build option (--split, --schedule, --dedup, --handbook, ...)
+is passed to each input's build_deck unchanged; --diff without a manifest
+compares each input against its own output subdirectory.
+"""
+
+import contextlib
+import glob
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import blob_store
+from hash_cache import default_cache_path, load_hash_cache, save_hash_cache
+from profiling import setup_logging
+
+logger = logging.getLogger(__name__)
+
+GLOB_CHARS = '*?['
+
+_worker_cache = None
+
+
+def expand_inputs(spec):
+    """Resolve a glob or list file into a sorted, de-duplicated list of inputs."""
+    if any(c in spec for c in GLOB_CHARS) or spec.endswith('.org'):
+        patterns = [spec]
+    else:
+        base = os.path.dirname(spec)
+        with open(spec, 'r', encoding='utf-8') as f:
+            patterns = [os.path.join(base, line.strip()) for line in f
+                        if line.strip() and not line.lstrip().startswith('#')]
+
+    inputs = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches and os.path.exists(pattern):
+            matches = [pattern]
+        inputs.update(os.path.normpath(m) for m in matches if os.path.isfile(m))
+    return sorted(inputs)
+
+
+def output_dir_for(input_file, common_root, output_root):
+    """Per-input output directory, mirroring the input's path below ``common_root``."""
+    relative = os.path.relpath(os.path.abspath(input_file), common_root)
+    return os.path.join(output_root, os.path.splitext(relative)[0])
+
+
+def _init_worker(cache_snapshot):
+    """Give each worker process its own copy of the shared hash cache, and log to its stdout."""
+    global _worker_cache
+    _worker_cache = cache_snapshot
+    setup_logging()
+
+
+def _build_one(input_file, output_dir, emitters, options):
+    """Worker: build one deck, returning its summary, captured log and new cache entries."""
+    import org_to_deck
+
+    if options.get('diff_against') == '':
+        options = dict(options, diff_against=output_dir)
+    before = dict(_worker_cache)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            summary = org_to_deck.build_deck(input_file, output_dir, emitters, _worker_cache, **options)
+        except Exception as e:
+            logger.error("Error building deck: %s", e)
+            summary = {'input': input_file, 'output_dir': output_dir, 'error': str(e)}
+
+    new_entries = {key: entry for key, entry in _worker_cache.items() if before.get(key) != entry}
+    return summary, log.getvalue(), new_entries
+
+
+def write_batch_summary(summaries, output_root):
+    """Write batch_summary.txt listing every input in order."""
+    summary_path = os.path.join(output_root, 'batch_summary.txt')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        f.write('# Batch Build Summary\n\n')
+        total_cards = sum(s.get('cards', 0) for s in summaries)
+        failed = [s for s in summaries if s.get('error')]
+        f.write(f'Inputs: {len(summaries)}  Cards: {total_cards}  Failed: {len(failed)}\n\n')
+
+        for s in summaries:
+            f.write(f'## {s["input"]}\n\n')
+            f.write(f'Output: {os.path.relpath(s["output_dir"], output_root)}\n')
+            if s.get('error'):
+                f.write(f'ERROR: {s["error"]}\n\n')
+                continue
+            added, changed, removed = s['changes']
+            f.write(f'Cards: {s["cards"]}  Images: {s["images"]}\n')
+            f.write(f'Changes: {added} added, {changed} changed, {removed} removed\n')
+            f.write(f'Emitted: {", ".join(s["emitted"]) or "-"}\n')
+            f.write(f'Skipped: {", ".join(s["skipped"]) or "-"}\n\n')
+    return summary_path
+
+
+def run_batch(spec, output_root, emitters, jobs=None, **options):
+    """Convert every input matched by ``spec`` in parallel; return the summaries in input order.
+
+    ``options`` are build_deck keyword arguments shared by every input; a
+    ``diff_against`` of '' means each input's own output directory.
+    """
+    inputs = expand_inputs(spec)
+    if not inputs:
+        raise ValueError(f"no input files match {spec}")
+    os.makedirs(output_root, exist_ok=True)
+
+    common_root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in inputs])
+    cache_path = default_cache_path(blob_store.default_store_dir())
+    hash_cache = load_hash_cache(cache_path)
+
+    logger.info("Batch converting %s file(s) into %s", len(inputs), output_root)
+    summaries = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(hash_cache,)) as pool:
+        futures = [pool.submit(_build_one, p, output_dir_for(p, common_root, output_root), emitters, options)
+                   for p in inputs]
+        # Collected in submission order, so logs and summary are deterministic
+        for future in futures:
+            summary, log, new_entries = future.result()
+            hash_cache.update(new_entries)
+            logger.info("--- %s -> %s ---", summary['input'], summary['output_dir'])
+            if log:
+                logger.info('%s', log.rstrip('\n'))
+            summaries.append(summary)
+
+    save_hash_cache(hash_cache, cache_path)
+    summary_path = write_batch_summary(summaries, output_root)
+
+    total_cards = sum(s.get('cards', 0) for s in summaries)
+    failed = sum(1 for s in summaries if s.get('error'))
+    logger.info("Batch complete: %s file(s), %s cards, %s failed", len(summaries), total_cards, failed)
+    logger.info("Summary written to: %s", summary_path)
+    return summaries
@@ -0,0 +1,8 @@
+"""
+Benchmarks for the examDrill converters.
+
+    corpus.py         seeded synthetic org-drill corpus and image generator
+    harness.py        per-stage timing and memory profiling, JSON results,
+                      regression comparison between two result files
+    bench_markup.py   fused markup transformer vs the old re.sub chains
+"""
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Markup Transformer Microbenchmark
+
+Times the fused single-pass transformer in markup.py against the sequential
+re.sub chains that process_content / process_latex_for_xml used before it,
+over every front and back field of an org-drill file.
+
+Before timing, it checks that the fused transformer leaves no \( \) \[ \]
+math delimiters in a field where the old chain rendered them all, and
+renders REGRESSION_FIELDS (math inside emphasis) as expected. On any
+mismatch it exits with status 1.
+
+Usage:
+    python benchmarks/bench_markup.py [input.org] [repeats]
+"""
+
+import os
+import re
+import sys
+import time
+import xml.sax.saxutils as saxutils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markup import render_markup
+from org_parser import iter_drill_cards
+
+DEFAULT_INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'exam_drill.org')
+
+MATH_DELIMITERS = ('\\(', '\\)', '\\[', '\\]')
+
+# (field, dialect, expected rendering); math inside emphasis used to come out raw,
+# and ***...*** other than a single choice kept its outer asterisks
+REGRESSION_FIELDS = [
+    ('***The answer is \\(A\\), \\(B\\), and \\(C\\).***', 'xml',
+     '<b>The answer is <b>A</b>, <b>B</b>, and <b>C</b>.</b>'),
+    ('***The answer is \\(A\\), \\(B\\), and \\(C\\).***', 'html',
+     '<strong>The answer is $A$, $B$, and $C$.</strong>'),
+    ('***The answer is 482 kg/s.***', 'xml', '<b>The answer is 482 kg/s.</b>'),
+    ('***The answer is 482 kg/s.***', 'html', '<strong>The answer is 482 kg/s.</strong>'),
+    ('*G1\\(s\\)*', 'xml', '<b>G1<tex>s</tex></b>'),
+    ('*G1\\(s\\)*', 'html', '<em>G1$s$</em>'),
+]
+
+
+def legacy_process_content(text):
+    """The ten-pass CSV chain as it was before markup.py."""
+    text = re.sub(r'\\\((.+?)\\\)', r'$\1$', text)
+    text = re.sub(r'\\\[(.+?)\\\]', r'$$\1$$', text)
+    text = re.sub(r'\\(\((.+?)\))', r'$\2$', text)
+    text = re.sub(r'\\\(([A-D])\\\)', r'($\1$)', text)
+    text = re.sub(r'\\([\(\)])', r'\1', text)
+    text = re.sub(r'\[\[\.\/images\/(\d+\.png)\]\]', r'<img src="\1">', text)
+    text = re.sub(r'\*([^*]+)\*', r'<em>\1</em>', text)
+    text = re.sub(r'\*\*([^*]+):\s*\*\*', r'<strong>\1:</strong> ', text)
+    text = re.sub(r'\*\*\*The answer is \\?\(([A-D])\)\\?\.\*\*\*', r'<strong>The answer is (\1).</strong>', text)
+    text = text.replace('\n', '<br>')
+    return text
+
+
+def legacy_process_latex_for_xml(text):
+    """The eight-pass XML chain as it was before markup.py."""
+    text = saxutils.escape(text)
+    text = re.sub(r'\\[(]([A-D])\\[)]', r'<b>\1</b>', text)
+    text = re.sub(r'\$([A-D])\$', r'<b>\1</b>', text)
+    text = re.sub(r'\\[(](.*?)\\[)]', r'<tex>\1</tex>', text)
+    text = re.sub(r'\$(.*?)\$', r'<tex>\1</tex>', text)
+    text = re.sub(r'\*([a-zA-Z0-9]+)\*', r'<b>\1</b>', text)
+    text = text.replace('\n\n', '<br></br><br></br>')
+    text = text.replace('\n', '<br></br>')
+    text = re.sub(r'\[\[\.?\/?(images\/)?(\d+)\.png\]\]', r'<img id="\2.png" />', text)
+    return text
+
+
+def load_fields(path):
+    """Return every raw question and answer field in the file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        fields = []
+        for card in iter_drill_cards(f):
+            fields.append(card['question'])
+            fields.append(card['answer'])
+    return fields
+
+
+def has_raw_math(text):
+    return any(delimiter in text for delimiter in MATH_DELIMITERS)
+
+
+def check_equivalence(fields):
+    """Return a description of every field the fused transformer renders worse than the chain."""
+    problems = []
+    for field, dialect, expected in REGRESSION_FIELDS:
+        rendered = render_markup(field, dialect)
+        if rendered != expected:
+            problems.append(f"{dialect}: {field!r} rendered as {rendered!r}, expected {expected!r}")
+    for dialect, legacy in (('html', legacy_process_content), ('xml', legacy_process_latex_for_xml)):
+        for field in fields:
+            if has_raw_math(render_markup(field, dialect)) and not has_raw_math(legacy(field)):
+                problems.append(f"{dialect}: raw math left in {field[:80]!r}")
+    return problems
+
+
+def best_time(func, fields, repeats):
+    """Best wall time in seconds of running func over all fields."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for field in fields:
+            func(field)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    input_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INPUT
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    fields = load_fields(input_file)
+    total_chars = sum(len(field) for field in fields)
+    print(f"{len(fields)} fields, {total_chars} characters from {input_file}")
+
+    problems = check_equivalence(fields)
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"Equivalence: {len(REGRESSION_FIELDS)} regression fields and every field render their math")
+    print(f"Best of {repeats} runs:\n")
+
+    for dialect, legacy in (('html', legacy_process_content), ('xml', legacy_process_latex_for_xml)):
+        old = best_time(legacy, fields, repeats)
+        new = best_time(lambda text: render_markup(text, dialect), fields, repeats)
+        print(f"{dialect:>4}: chain {old * 1000:8.2f} ms   fused {new * 1000:8.2f} ms   speedup {old / new:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Synthetic Org-drill Corpus Generator
+
+Writes a seeded org-drill file shaped like exam_drill.org, at any size,
+plus a directory of small generated PNG diagrams for it to link:
+
+    - ``*** N :drill:`` cards under ``** Exam K`` sections, each with a
+      :PROPERTIES: drawer (ID, and DRILL_* review state on some cards)
+    - four \\(A\\)-\\(D\\) choices, inline and display math at a
+      configurable density, *emphasis*, **Step:** headings and the
+      ***The answer is \\(X\\).*** line
+    - ``[[./images/NNNNNN.png]]`` links at a configurable density
+    - a configurable share of malformed cards: headlines without a
+      number or without a space after the stars, cards with no ``****``
+      answer, unterminated drawers and stray ``**`` emphasis lines
+
+The same seed and options always give the same bytes. Images are plain
+zlib-compressed greyscale PNGs written without Pillow.
+
+Usage:
+    python benchmarks/corpus.py out_dir [--cards 10000] [--seed 1] [--latex 0.5] [--images 0.3] [--malformed 0.02]
+"""
+
+import argparse
+import os
+import random
+import struct
+import uuid
+import zlib
+
+DEFAULT_CARDS = 10000
+DEFAULT_SEED = 1
+DEFAULT_LATEX = 0.5
+DEFAULT_IMAGES = 0.3
+DEFAULT_MALFORMED = 0.02
+DEFAULT_IMAGE_POOL = 200
+CARDS_PER_SECTION = 100
+
+WORDS = ('the', 'a', 'of', 'beam', 'load', 'pressure', 'flow', 'rate', 'pipe', 'heat', 'transfer', 'is',
+         'most', 'nearly', 'velocity', 'stress', 'shaft', 'torque', 'gear', 'pump', 'efficiency', 'fluid',
+         'temperature', 'steel', 'line', 'slope', 'volume', 'energy', 'power', 'given', 'at', 'with', 'and')
+SYMBOLS = ('x', 'y', 'm', 'P', 'Q', 'T', 'v', '\\Delta h', '\\sigma', '\\tau', '\\omega', '\\rho', '\\pi')
+OPERATORS = ('+', '-', '=', '/', '\\cdot', '^2', '_1')
+CHOICES = 'ABCD'
+
+
+def sentence(rng, latex, shortest=6, longest=16):
+    """One sentence of prose with inline math at density ``latex``."""
+    words = []
+    for _ in range(rng.randint(shortest, longest)):
+        if rng.random() < latex * 0.3:
+            terms = [rng.choice(SYMBOLS) for _ in range(rng.randint(1, 3))]
+            words.append('\\(' + f' {rng.choice(OPERATORS)} '.join(terms) + '\\)')
+        elif rng.random() < 0.1:
+            words.append(f'*{rng.choice(SYMBOLS[:7])}*')
+        else:
+            words.append(rng.choice(WORDS))
+    return ' '.join(words).capitalize() + '.'
+
+
+def image_link(rng, pool):
+    return f'[[./images/{rng.randrange(pool):06d}.png]]'
+
+
+def card_lines(rng, number, latex, images, pool, malformed):
+    """Lines of one card; ``malformed`` picks one of the broken shapes."""
+    kind = rng.randrange(5) if malformed else None
+    if kind == 0:
+        headline = '*** :drill:'
+    elif kind == 1:
+        headline = f'***{number} :drill:'
+    else:
+        headline = f'*** {number}'.ljust(70) + ':drill:'
+    lines = [headline, ':PROPERTIES:', f':ID:       {uuid.UUID(int=rng.getrandbits(128), version=4)}']
+    if rng.random() < 0.2:
+        lines += [f':DRILL_LAST_INTERVAL: {rng.uniform(1, 60):.4f}', f':DRILL_REPEATS_SINCE_FAIL: {rng.randint(1, 6)}',
+                  f':DRILL_TOTAL_REPEATS: {rng.randint(1, 10)}', ':DRILL_FAILURE_COUNT: 0',
+                  f':DRILL_AVERAGE_QUALITY: {rng.uniform(2.5, 5):.3f}', f':DRILL_EASE: {rng.uniform(1.3, 2.8):.3f}',
+                  f':DRILL_LAST_QUALITY: {rng.randint(3, 5)}',
+                  f':DRILL_LAST_REVIEWED: [2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)} Mon 10:00]']
+    if kind != 3:
+        lines.append(':END:')
+    lines += ['', sentence(rng, latex)]
+    if rng.random() < images:
+        lines.append(image_link(rng, pool))
+    lines.append('')
+    for choice in CHOICES:
+        lines += [f'\\({choice}\\)', '', sentence(rng, latex, 1, 4), '']
+    if kind == 4:
+        lines += ['**', '']
+    if kind == 2:
+        return lines
+    lines += ['**** ', '']
+    for step in range(rng.randint(1, 4)):
+        lines.append(f'**Step {step + 1}: **' if rng.random() < 0.3 else sentence(rng, latex))
+        if rng.random() < latex * 0.4:
+            lines.append('\\[' + ' '.join(rng.choice(SYMBOLS + OPERATORS) for _ in range(7)) + '\\]')
+        if rng.random() < images:
+            lines.append(image_link(rng, pool) + '  ')
+    lines += [f'***The answer is \\({rng.choice(CHOICES)}\\).***', '']
+    return lines
+
+
+def write_corpus(path, cards=DEFAULT_CARDS, seed=DEFAULT_SEED, latex=DEFAULT_LATEX, images=DEFAULT_IMAGES,
+                 malformed=DEFAULT_MALFORMED, image_pool=DEFAULT_IMAGE_POOL):
+    """Write a synthetic org-drill file of ``cards`` cards; return the number of malformed ones."""
+    rng = random.Random(seed)
+    broken = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for number in range(cards):
+            if number % CARDS_PER_SECTION == 0:
+                f.write(f'** Exam {number // CARDS_PER_SECTION + 1}\n:PROPERTIES:\n:END:\n\n')
+            bad = rng.random() < malformed
+            broken += bad
+            f.write('\n'.join(card_lines(rng, number, latex, images, image_pool, bad)) + '\n')
+    return broken
+
+
+def png_bytes(width, height, rows):
+    """A greyscale 8-bit PNG of ``rows`` (bytes of length ``width``)."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    raw = b''.join(b'\0' + row for row in rows)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b''))
+
+
+def write_images(image_dir, count=DEFAULT_IMAGE_POOL, seed=DEFAULT_SEED):
+    """Write ``count`` distinct small diagrams named 000000.png, 000001.png, ..."""
+    os.makedirs(image_dir, exist_ok=True)
+    rng = random.Random(seed)
+    for index in range(count):
+        width, height = rng.randint(120, 480), rng.randint(40, 200)
+        # White background with a few dark strokes, like the scanned diagrams
+        rows = []
+        for _ in range(height):
+            row = bytearray(b'\xff' * width)
+            for _ in range(rng.randint(0, 3)):
+                start = rng.randrange(width)
+                length = min(rng.randint(1, 40), width - start)
+                row[start:start + length] = b'\x20' * length
+            rows.append(bytes(row))
+        with open(os.path.join(image_dir, f'{index:06d}.png'), 'wb') as f:
+            f.write(png_bytes(width, height, rows))
+
+
+def make_corpus(output_dir, cards=DEFAULT_CARDS, seed=DEFAULT_SEED, latex=DEFAULT_LATEX, images=DEFAULT_IMAGES,
+                malformed=DEFAULT_MALFORMED, image_pool=DEFAULT_IMAGE_POOL):
+    """Write corpus_<cards>.org and images/ into ``output_dir``; return the org path.
+
+    Images are written only when the directory does not have them yet.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    image_dir = os.path.join(output_dir, 'images')
+    if not os.path.exists(os.path.join(image_dir, f'{image_pool - 1:06d}.png')):
+        write_images(image_dir, image_pool, seed)
+    path = os.path.join(output_dir, f'corpus_{cards}.org')
+    write_corpus(path, cards, seed, latex, images, malformed, image_pool)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic org-drill corpus with images.")
+    parser.add_argument('output_dir', help="directory for corpus_N.org and images/")
+    parser.add_argument('--cards', type=int, default=DEFAULT_CARDS, help=f"number of cards (default {DEFAULT_CARDS})")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help=f"random seed (default {DEFAULT_SEED})")
+    parser.add_argument('--latex', type=float, default=DEFAULT_LATEX,
+                        help=f"LaTeX density, 0-1 (default {DEFAULT_LATEX})")
+    parser.add_argument('--images', type=float, default=DEFAULT_IMAGES,
+                        help=f"chance of an image link per paragraph (default {DEFAULT_IMAGES})")
+    parser.add_argument('--malformed', type=float, default=DEFAULT_MALFORMED,
+                        help=f"share of malformed cards (default {DEFAULT_MALFORMED})")
+    parser.add_argument('--image-pool', type=int, default=DEFAULT_IMAGE_POOL,
+                        help=f"number of distinct images (default {DEFAULT_IMAGE_POOL})")
+    args = parser.parse_args()
+
+    path = make_corpus(args.output_dir, args.cards, args.seed, args.latex, args.images, args.malformed,
+                       args.image_pool)
+    print(f"Wrote {path} ({os.path.getsize(path)} bytes) and {args.image_pool} images")
+
+
+if __name__ == "__main__":
+    main()
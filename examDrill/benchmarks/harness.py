@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Converter Benchmark Harness
+
+Times and memory-profiles each converter stage on synthetic corpora (see
+corpus.py), one stage at a time:
+
+    extract_drill_cards       org_to_anki.extract_drill_cards (CSV cards)
+    extract_drill_cards_xml   org_to_anki_xml.extract_drill_cards
+    process_content           every front and back field, CSV dialect
+    process_latex_for_xml     every front and back field, XML dialect
+    create_anki_xml           anki_import.xml from the XML cards
+    process_images            process_images_for_anki into an empty store
+    process_images_cached     the same against a populated store and hash cache
+    stream_anki_zip           the AnkiApp ZIP from the XML cards and blobs
+
+Each stage runs ``repeats`` times for wall time (best and median), then
+once more under tracemalloc for its peak Python heap allocation. Setup
+(reading the corpus, extracting the cards a stage consumes, making a
+fresh output directory) is never timed.
+
+Results are written as JSON together with the git commit they were taken
+at, and ``compare`` flags every stage that got slower or hungrier between
+two result files, exiting non-zero if any did:
+
+    python benchmarks/harness.py run --cards 1000,10000 --output base.json
+    (change something)
+    python benchmarks/harness.py run --cards 1000,10000 --output head.json
+    python benchmarks/harness.py compare base.json head.json [--threshold 0.1]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import org_to_anki
+import org_to_anki_xml
+from corpus import (DEFAULT_IMAGE_POOL, DEFAULT_IMAGES, DEFAULT_LATEX, DEFAULT_MALFORMED, DEFAULT_SEED,
+                    make_corpus)
+from hash_cache import load_hash_cache
+
+RESULTS_VERSION = 1
+DEFAULT_SIZES = '1000,10000'
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 0.10
+# Differences below this many seconds are timer noise, not regressions
+MIN_DELTA = 0.002
+
+
+def quiet(func, *args, **kwargs):
+    """Call ``func`` with stdout discarded (the converters print per card)."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return func(*args, **kwargs)
+
+
+def bench_extract(ctx, workdir):
+    quiet(org_to_anki.extract_drill_cards, ctx['org_content'])
+
+
+def bench_extract_xml(ctx, workdir):
+    quiet(org_to_anki_xml.extract_drill_cards, ctx['org_content'])
+
+
+def bench_process_content(ctx, workdir):
+    for field in ctx['fields']:
+        org_to_anki.process_content(field)
+
+
+def bench_process_latex(ctx, workdir):
+    for field in ctx['fields']:
+        org_to_anki_xml.process_latex_for_xml(field)
+
+
+def bench_create_xml(ctx, workdir):
+    org_to_anki_xml.create_anki_xml(ctx['xml_cards'], workdir)
+
+
+def bench_images(ctx, workdir):
+    quiet(org_to_anki_xml.process_images_for_anki, ctx['xml_cards'], ctx['image_dir'], workdir,
+          os.path.join(workdir, 'store'), None, {}, link_blobs=False)
+
+
+def bench_images_cached(ctx, workdir):
+    quiet(org_to_anki_xml.process_images_for_anki, ctx['xml_cards'], ctx['image_dir'], workdir,
+          ctx['store_dir'], None, ctx['hash_cache'], link_blobs=False)
+
+
+def bench_zip(ctx, workdir):
+    quiet(org_to_anki_xml.stream_anki_zip, ctx['xml_cards'], workdir, ctx['image_reference_map'])
+
+
+STAGES = {
+    'extract_drill_cards': bench_extract,
+    'extract_drill_cards_xml': bench_extract_xml,
+    'process_content': bench_process_content,
+    'process_latex_for_xml': bench_process_latex,
+    'create_anki_xml': bench_create_xml,
+    'process_images': bench_images,
+    'process_images_cached': bench_images_cached,
+    'stream_anki_zip': bench_zip,
+}
+
+
+def load_context(org_path, scratch):
+    """Everything the stages consume, prepared once per corpus."""
+    with open(org_path, 'r', encoding='utf-8') as f:
+        org_content = f.read()
+    xml_cards = quiet(org_to_anki_xml.extract_drill_cards, org_content)
+    image_dir = os.path.join(os.path.dirname(org_path), 'images')
+    store_dir = os.path.join(scratch, 'store')
+    hash_cache = load_hash_cache(os.path.join(store_dir, 'hash_cache.json'))
+    image_reference_map = quiet(org_to_anki_xml.process_images_for_anki, xml_cards, image_dir, scratch,
+                                store_dir, None, hash_cache, link_blobs=False)
+    return {
+        'org_content': org_content,
+        'xml_cards': xml_cards,
+        'fields': [field for card in xml_cards for field in (card['original_front'], card['original_back'])],
+        'image_dir': image_dir,
+        'store_dir': store_dir,
+        'hash_cache': hash_cache,
+        'image_reference_map': image_reference_map,
+    }
+
+
+def measure(stage, ctx, scratch, repeats):
+    """(wall times in seconds, peak traced bytes) of one stage."""
+    times = []
+    for run in range(repeats + 1):
+        workdir = tempfile.mkdtemp(dir=scratch)
+        try:
+            if run < repeats:
+                start = time.perf_counter()
+                stage(ctx, workdir)
+                times.append(time.perf_counter() - start)
+            else:
+                tracemalloc.start()
+                try:
+                    stage(ctx, workdir)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return times, peak
+
+
+def git_revision():
+    """(commit, dirty) of the working tree, or (None, None) outside git."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_benchmarks(sizes, stages, repeats, corpus_dir, corpus_options):
+    """Run ``stages`` on a corpus of each size; return the results document."""
+    commit, dirty = git_revision()
+    document = {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeats': repeats,
+        'corpus': corpus_options,
+        'results': [],
+    }
+    for size in sizes:
+        org_path = make_corpus(corpus_dir, size, **corpus_options)
+        scratch = tempfile.mkdtemp(prefix='bench-')
+        try:
+            ctx = load_context(org_path, scratch)
+            print(f"\n{size} cards ({len(ctx['xml_cards'])} with answers, "
+                  f"{len(ctx['image_reference_map'])} images), {os.path.getsize(org_path)} bytes")
+            for name in stages:
+                times, peak = measure(STAGES[name], ctx, scratch, repeats)
+                result = {'cards': size, 'stage': name, 'best': min(times),
+                          'median': statistics.median(times), 'peak_bytes': peak}
+                document['results'].append(result)
+                print(f"  {name:<24} best {result['best'] * 1000:9.1f} ms   "
+                      f"median {result['median'] * 1000:9.1f} ms   peak {peak / 1024 / 1024:8.1f} MiB")
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return document
+
+
+def compare(base, head, threshold=DEFAULT_THRESHOLD, memory_threshold=DEFAULT_THRESHOLD):
+    """Rows of (cards, stage, base best, head best, time ratio, memory ratio, regressed)."""
+    base_results = {(r['cards'], r['stage']): r for r in base['results']}
+    rows = []
+    for result in head['results']:
+        old = base_results.get((result['cards'], result['stage']))
+        if old is None:
+            continue
+        time_ratio = result['best'] / old['best'] if old['best'] else 1.0
+        memory_ratio = result['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else 1.0
+        slower = time_ratio > 1 + threshold and result['best'] - old['best'] > MIN_DELTA
+        hungrier = memory_ratio > 1 + memory_threshold
+        rows.append((result['cards'], result['stage'], old['best'], result['best'], time_ratio, memory_ratio,
+                     slower or hungrier))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the converter stages on synthetic corpora.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="run the benchmarks and write JSON results")
+    run.add_argument('--cards', default=DEFAULT_SIZES,
+                     help=f"comma-separated corpus sizes (default {DEFAULT_SIZES})")
+    run.add_argument('--stages', default=','.join(STAGES), help="comma-separated stages (default: all)")
+    run.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                     help=f"timed runs per stage (default {DEFAULT_REPEATS})")
+    run.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'examdrill-bench-corpus'),
+                     help="where corpora and their images are generated")
+    run.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run.add_argument('--latex', type=float, default=DEFAULT_LATEX, help="LaTeX density, 0-1")
+    run.add_argument('--images', type=float, default=DEFAULT_IMAGES, help="image link density, 0-1")
+    run.add_argument('--malformed', type=float, default=DEFAULT_MALFORMED, help="share of malformed cards")
+    run.add_argument('--image-pool', type=int, default=DEFAULT_IMAGE_POOL, help="number of distinct images")
+    run.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+    cmp = commands.add_parser('compare', help="flag regressions between two result files")
+    cmp.add_argument('base', help="results of the earlier commit")
+    cmp.add_argument('head', help="results of the later commit")
+    cmp.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                     help=f"allowed relative slowdown (default {DEFAULT_THRESHOLD})")
+    cmp.add_argument('--memory-threshold', type=float, default=DEFAULT_THRESHOLD,
+                     help=f"allowed relative growth of peak memory (default {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        stages = [name.strip() for name in args.stages.split(',') if name.strip()]
+        unknown = [name for name in stages if name not in STAGES]
+        if unknown:
+            print(f"Error: unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGES)}")
+            sys.exit(1)
+        sizes = [int(size) for size in args.cards.split(',')]
+        corpus_options = {'seed': args.seed, 'latex': args.latex, 'images': args.images,
+                          'malformed': args.malformed, 'image_pool': args.image_pool}
+        document = run_benchmarks(sizes, stages, args.repeats, args.corpus_dir, corpus_options)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=1)
+        print(f"\nResults written to: {args.output}")
+        return
+
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.head, 'r', encoding='utf-8') as f:
+        head = json.load(f)
+    if base.get('corpus') != head.get('corpus'):
+        print("Warning: the two runs used different corpus options")
+    print(f"base {(base.get('commit') or '?')[:10]}  head {(head.get('commit') or '?')[:10]}"
+          f"{' (dirty)' if head.get('dirty') else ''}\n")
+    rows = compare(base, head, args.threshold, args.memory_threshold)
+    for cards, stage, old, new, time_ratio, memory_ratio, regressed in rows:
+        print(f"{cards:>7} {stage:<24} {old * 1000:9.1f} -> {new * 1000:9.1f} ms  x{time_ratio:5.2f}  "
+              f"mem x{memory_ratio:5.2f}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(row[-1] for row in rows)
+    print(f"\n{len(rows)} stage(s) compared, {regressions} regression(s)")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Content-addressed Blob Store
+
+Holds each unique image exactly once, keyed by its SHA-256 digest, in a
+store shared by every output set and every run:
+
+    <store>/ab/ab3f...e9    (two-character fan-out, bare hex digest)
+
+Output directories never receive their own copies; files are materialized
+from the store as hardlinks, falling back to a reflink (copy-on-write clone)
+and only then to a byte copy when the filesystem allows neither.
+
+The store location is, in order of preference, the explicit argument, the
+FEDRILL_BLOB_STORE environment variable, or ~/.cache/feDrill/blobs.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+
+from hash_cache import file_sha256
+
+# ioctl request number for FICLONE on Linux (fcntl.FICLONE on Python 3.12+)
+FICLONE = 0x40049409
+
+
+def default_store_dir():
+    """Return the shared store directory used when none is given."""
+    env_dir = os.environ.get('FEDRILL_BLOB_STORE')
+    if env_dir:
+        return env_dir
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'feDrill', 'blobs')
+
+
+def blob_path(store_dir, hash_id):
+    """Path of the blob with the given hex digest inside the store."""
+    return os.path.join(store_dir, hash_id[:2], hash_id)
+
+
+def put_file(store_dir, source_path, cache=None):
+    """Add a file to the store unless identical content is already there.
+
+    The digest comes from the hash cache when the file is unchanged, so a
+    warm store costs one stat() per file. New content is copied with
+    shutil.copyfile, which uses sendfile() on Linux.
+
+    Returns (hash_id, stored_path, added) where ``added`` is False when the
+    store already held identical content and nothing was written.
+    """
+    hash_id = file_sha256(source_path, cache)
+    stored_path = blob_path(store_dir, hash_id)
+    if os.path.exists(stored_path):
+        return hash_id, stored_path, False
+
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(stored_path), prefix='.incoming-')
+    os.close(fd)
+    try:
+        shutil.copyfile(source_path, temp_path)
+        # Blobs are shared through hardlinks, so keep them read-only
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, stored_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return hash_id, stored_path, True
+
+
+def _reflink(source_path, target_path):
+    """Clone a file with FICLONE; raises OSError where unsupported."""
+    import fcntl
+    request = getattr(fcntl, 'FICLONE', FICLONE)
+    with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), request, src.fileno())
+
+
+def materialize(stored_path, target_path):
+    """Make ``target_path`` hold the blob's bytes as cheaply as possible.
+
+    Returns the method used: 'existing', 'hardlink', 'reflink' or 'copy'.
+    """
+    if os.path.exists(target_path):
+        if os.path.samefile(stored_path, target_path):
+            return 'existing'
+        os.unlink(target_path)
+
+    try:
+        os.link(stored_path, target_path)
+        return 'hardlink'
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+
+    try:
+        _reflink(stored_path, target_path)
+        return 'reflink'
+    except (OSError, ImportError):
+        if os.path.exists(target_path):
+            os.unlink(target_path)
+
+    shutil.copyfile(stored_path, target_path)
+    return 'copy'
+
+
+def new_size_stats():
+    """Counters collected while images are stored and materialized."""
+    return {
+        'referenced_files': 0,
+        'referenced_bytes': 0,
+        'unique_blobs': 0,
+        'unique_bytes': 0,
+        'bytes_added_to_store': 0,
+        'bytes_copied': 0,
+        'methods': {},
+    }
+
+
+def record_materialized(stats, method, size):
+    """Count one materialized output file by method."""
+    stats['methods'][method] = stats['methods'].get(method, 0) + 1
+    if method == 'copy':
+        stats['bytes_copied'] += size
+
+
+def write_size_report(stats, output_dir, legacy_copies=4):
+    """Write blob_report.txt comparing the store with the old copy scheme.
+
+    The previous converter wrote every image ``legacy_copies`` times (three
+    names in blobs/ plus preview_images/) and zipped three of them.
+    """
+    report_path = os.path.join(output_dir, 'blob_report.txt')
+    referenced = stats['referenced_bytes']
+    unique = stats['unique_bytes']
+    legacy_disk = referenced * legacy_copies
+    legacy_zip = referenced * (legacy_copies - 1)
+    copied = stats['bytes_copied']
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write('# Blob Storage Report\n\n')
+        f.write(f'Referenced image files: {stats["referenced_files"]} ({referenced} bytes)\n')
+        f.write(f'Unique blobs:           {stats["unique_blobs"]} ({unique} bytes)\n')
+        f.write(f'Newly added to store:   {stats["bytes_added_to_store"]} bytes\n\n')
+
+        f.write('## Materialized outputs\n\n')
+        for method in sorted(stats['methods']):
+            f.write(f'- {method}: {stats["methods"][method]}\n')
+        f.write('\n')
+
+        f.write('## Savings versus per-output copies\n\n')
+        f.write(f'Previous scheme on disk: {legacy_disk} bytes\n')
+        f.write(f'Previous scheme in ZIP:  {legacy_zip} bytes\n')
+        f.write(f'Now in ZIP:              {unique} bytes (saved {legacy_zip - unique})\n')
+        f.write(f'Now on disk:             {copied} bytes outside the store (saved {legacy_disk - copied})\n')
+
+    return report_path
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Incremental Build Manifest
+
+Records what a converter produced so the next run can skip work:
+
+    - every card, keyed by its org :ID: property (falling back to its
+      problem number), with hashes of its source text, processed front,
+      processed back and referenced media, plus the processed card itself
+    - every output file, with a digest of the inputs it was written from
+
+A rerun reuses the processed card when the source hash is unchanged,
+rewrites an output only when its input digest differs (or the file is
+gone), and reports which cards were added, changed or removed.
+
+The manifest lives in the output directory as build_manifest.json, with
+one section per converter so both can share a directory. A fingerprint of
+the converter code is part of every section, so editing the transformer
+invalidates the cached cards.
+"""
+
+import importlib
+import json
+import logging
+import os
+from hashlib import sha1, sha256
+
+MANIFEST_NAME = 'build_manifest.json'
+MANIFEST_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text):
+    """Hex SHA-256 of a string."""
+    return sha256(text.encode('utf-8')).hexdigest()
+
+
+def inputs_digest(value):
+    """Stable digest of any JSON-serializable value."""
+    return text_hash(json.dumps(value, sort_keys=True, separators=(',', ':')))
+
+
+def code_fingerprint(*module_names):
+    """Digest of the source files of the given modules, importing any not loaded yet.
+
+    List every module whose code shapes an output, or a change to it is
+    served from the stale outputs as "Unchanged".
+    """
+    h = sha256()
+    for name in module_names:
+        path = getattr(importlib.import_module(name), '__file__', None)
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def card_key(card):
+    """Stable identity of a processed card: its :ID: property, else its number."""
+    return card.get('org_id') or f'number:{card["id"]}'
+
+
+def note_guid(org_id, question):
+    """Anki note GUID: from the card's :ID: property, else from its question text.
+
+    Exporters write it so that re-importing an updated deck updates the
+    existing notes instead of adding duplicates.
+    """
+    key = org_id or f'question:{question}'
+    return sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def source_hash(parsed, card_num):
+    """Digest of everything in the org source that feeds a processed card."""
+    return inputs_digest([card_num, parsed['title'], parsed['tags'], parsed['question'], parsed['answer']])
+
+
+def load_manifest(output_dir, converter, fingerprint):
+    """Return the previous manifest section for a converter, or an empty one.
+
+    A ``fingerprint`` of None accepts a section written by any code version.
+    """
+    empty = {'fingerprint': fingerprint, 'cards': {}, 'order': [], 'outputs': {}}
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return empty
+
+    section = data.get('converters', {}).get(converter) if data.get('version') == MANIFEST_VERSION else None
+    if not section or (fingerprint is not None and section.get('fingerprint') != fingerprint):
+        return empty
+    return section
+
+
+def new_manifest(fingerprint):
+    """Start the manifest section for the current run."""
+    return {'fingerprint': fingerprint, 'cards': {}, 'order': [], 'outputs': {}}
+
+
+def save_manifest(manifest, output_dir, converter):
+    """Write the manifest section, keeping other converters' sections."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MANIFEST_VERSION:
+            data = {}
+    except (OSError, ValueError):
+        data = {}
+
+    data['version'] = MANIFEST_VERSION
+    data.setdefault('converters', {})[converter] = manifest
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+    return path
+
+
+def cached_card(previous, key, src_hash):
+    """Return a copy of the previously processed card if its source is unchanged."""
+    entry = previous['cards'].get(key)
+    if entry and entry['source_hash'] == src_hash:
+        return dict(entry['card'])
+    return None
+
+
+def record_card(manifest, card, media_hashes):
+    """Add a processed card and the hashes describing it to the manifest."""
+    key = card_key(card)
+    if key in manifest['cards']:
+        # Duplicate :ID: in the source; keep both under distinct keys
+        key = f'{key}#{len(manifest["order"])}'
+    manifest['order'].append(key)
+    manifest['cards'][key] = {
+        'source_hash': card['source_hash'],
+        'front_hash': text_hash(card['front']),
+        'back_hash': text_hash(card['back']),
+        'media_hash': inputs_digest(sorted(media_hashes)),
+        'card': card,
+    }
+    return key
+
+
+def diff_cards(previous, manifest):
+    """Return (added, changed, removed) card keys between two manifests."""
+    old_cards = previous['cards']
+    new_cards = manifest['cards']
+
+    added = [key for key in manifest['order'] if key not in old_cards]
+    removed = [key for key in previous['order'] if key not in new_cards]
+    changed = []
+    for key in manifest['order']:
+        old = old_cards.get(key)
+        if old is None:
+            continue
+        new = new_cards[key]
+        if (old['front_hash'], old['back_hash'], old['media_hash']) != (new['front_hash'], new['back_hash'], new['media_hash']):
+            changed.append(key)
+    return added, changed, removed
+
+
+def print_change_summary(previous, manifest, added, changed, removed):
+    """Log how the deck changed since the previous build."""
+    if not previous['order']:
+        logger.info("Full build: %s cards (no previous manifest)", len(manifest['order']))
+        return
+
+    unchanged = len(manifest['order']) - len(added) - len(changed)
+    logger.info("Card changes since last build: %s added, %s changed, %s removed, %s unchanged",
+                len(added), len(changed), len(removed), unchanged)
+    for label, keys, cards in (('+', added, manifest['cards']), ('~', changed, manifest['cards']),
+                               ('-', removed, previous['cards'])):
+        for key in keys:
+            logger.info("  %s card %s (%s)", label, cards[key]['card']['id'], key)
+
+
+def output_is_current(previous, name, digest, paths):
+    """True when ``name`` was last written from the same inputs and still exists."""
+    return previous['outputs'].get(name) == digest and all(os.path.exists(p) for p in paths)
+
+
+def mark_output(manifest, name, digest):
+    """Record the input digest an output was written from."""
+    manifest['outputs'][name] = digest
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Compiled Card Cache
+
+A compact binary file of processed cards (the shared card model of
+org_to_deck.load_deck, with its pre-rendered fields) that readers mmap
+and index into instead of re-parsing and re-rendering the org source.
+Fetching card N or the card with :ID: X reads that one record only.
+
+Layout (little-endian):
+
+    header     magic, version, card count, dialect bits, index size,
+               SHA-256 of the source text, code fingerprint, index offset
+    offsets    count + 1 uint64 record offsets (record i is
+               offsets[i]:offsets[i + 1])
+    records    per card, FIELDS in order, each a uint32 byte length and
+               UTF-8 bytes; NULL_LENGTH marks a missing value (no :ID:)
+    index      (uint64 key hash, uint32 position) pairs sorted by hash,
+               one per :ID: and one per "number:N" (build_manifest.card_key)
+
+Lists (images, media) are newline-joined, the review state is JSON. The
+header's source hash and code fingerprint invalidate the file: is_current
+says whether it still matches an org file and the parser/renderer code.
+
+org_to_deck.build_deck writes cards.bin to its output directory and
+loads the cards from it while the source is unchanged; other tools open
+it directly:
+
+    cache = open_cache('anki_output/cards.bin')
+    card = find_card(cache, '726d5265-f3d5-45b9-9865-d2baab52fd01')
+    card = read_card(cache, 41)
+    close_cache(cache)
+
+Usage:
+    python card_cache.py compile exam_drill.org [cards.bin]
+    python card_cache.py [-v] get cards.bin 41|<org ID>|number:12
+"""
+
+import argparse
+import functools
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from hashlib import blake2b, sha256
+
+from build_manifest import card_key, code_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'cards.bin'
+MAGIC = b'FDCARDS\0'
+CACHE_VERSION = 1
+
+HEADER = struct.Struct('<8sIIII32s32sQ')
+OFFSET = struct.Struct('<Q')
+LENGTH = struct.Struct('<I')
+INDEX_ENTRY = struct.Struct('<QI')
+NULL_LENGTH = 0xFFFFFFFF
+
+FIELDS = ('id', 'org_id', 'source_hash', 'line', 'question', 'answer', 'tags',
+          'front_images', 'back_images', 'media', 'review',
+          'html_front', 'html_back', 'xml_front', 'xml_back')
+LIST_FIELDS = ('front_images', 'back_images', 'media')
+DIALECTS = ('html', 'xml')
+
+
+def source_digest(org_content):
+    """Raw SHA-256 of an org file's text."""
+    return sha256(org_content.encode('utf-8')).digest()
+
+
+@functools.lru_cache(maxsize=None)
+def cache_fingerprint():
+    """Raw digest of the code that shapes the cached cards."""
+    import org_to_deck  # noqa: F401 -- fingerprinted below
+    return bytes.fromhex(code_fingerprint('markup', 'org_parser', 'org_to_deck', __name__))
+
+
+def key_hash(key):
+    """64-bit hash of an index key."""
+    return int.from_bytes(blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _field_values(card):
+    values = []
+    for name in FIELDS:
+        dialect, _, side = name.partition('_')
+        if dialect in DIALECTS and side in ('front', 'back'):
+            rendered = card.get(dialect)
+            values.append(rendered[side == 'back'] if rendered else None)
+        elif name in LIST_FIELDS:
+            values.append('\n'.join(card[name]))
+        elif name == 'review':
+            values.append(json.dumps(card.get('review'), sort_keys=True))
+        elif name == 'line':
+            values.append(str(card.get('line', 0)))
+        else:
+            values.append(card[name])
+    return values
+
+
+def encode_card(card):
+    """One card as its record bytes."""
+    parts = []
+    for value in _field_values(card):
+        if value is None:
+            parts.append(LENGTH.pack(NULL_LENGTH))
+        else:
+            data = value.encode('utf-8')
+            parts.append(LENGTH.pack(len(data)))
+            parts.append(data)
+    return b''.join(parts)
+
+
+def write_cache(cache_path, cards, org_content):
+    """Compile ``cards`` (parsed from ``org_content``) into ``cache_path``.
+
+    The file is written next to its target and renamed into place, so
+    readers holding the old file keep a consistent view.
+    """
+    dialect_bits = 0
+    for bit, dialect in enumerate(DIALECTS):
+        if cards and all(dialect in card for card in cards):
+            dialect_bits |= 1 << bit
+
+    records = [encode_card(card) for card in cards]
+    offsets = []
+    position = HEADER.size + OFFSET.size * (len(cards) + 1)
+    for record in records:
+        offsets.append(position)
+        position += len(record)
+    offsets.append(position)
+
+    index = sorted({(key_hash(key), i) for i, card in enumerate(cards)
+                    for key in {card_key(card), f'number:{card["id"]}'}})
+
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, CACHE_VERSION, len(cards), dialect_bits, len(index),
+                            source_digest(org_content), cache_fingerprint(), position))
+        f.write(b''.join(OFFSET.pack(offset) for offset in offsets))
+        f.writelines(records)
+        f.write(b''.join(INDEX_ENTRY.pack(h, i) for h, i in index))
+    os.replace(temp_path, cache_path)
+    return cache_path
+
+
+def open_cache(cache_path):
+    """Map a cache file; return a cache dict, or None if it is missing or not a cache."""
+    try:
+        f = open(cache_path, 'rb')
+    except OSError:
+        return None
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:  # empty file
+        f.close()
+        return None
+    f.close()
+    if len(mm) < HEADER.size:
+        mm.close()
+        return None
+    magic, version, count, dialect_bits, index_count, digest, fingerprint, index_at = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != CACHE_VERSION:
+        mm.close()
+        return None
+    return {
+        'mm': mm,
+        'count': count,
+        'dialects': [d for bit, d in enumerate(DIALECTS) if dialect_bits & (1 << bit)],
+        'source_digest': digest,
+        'fingerprint': fingerprint,
+        'index_at': index_at,
+        'index_count': index_count,
+    }
+
+
+def close_cache(cache):
+    cache['mm'].close()
+
+
+def is_current(cache, org_content, dialects=()):
+    """True when ``cache`` was compiled from ``org_content`` by the current code with ``dialects``."""
+    return (cache['source_digest'] == source_digest(org_content)
+            and cache['fingerprint'] == cache_fingerprint()
+            and set(dialects) <= set(cache['dialects']))
+
+
+def read_card(cache, position):
+    """Card at ``position`` (0-based, in source order), decoded from its record only."""
+    if not 0 <= position < cache['count']:
+        raise IndexError(f"card {position} out of range (0-{cache['count'] - 1})")
+    mm = cache['mm']
+    start, = OFFSET.unpack_from(mm, HEADER.size + OFFSET.size * position)
+    values = {}
+    for name in FIELDS:
+        length, = LENGTH.unpack_from(mm, start)
+        start += LENGTH.size
+        if length == NULL_LENGTH:
+            values[name] = None
+            continue
+        values[name] = mm[start:start + length].decode('utf-8')
+        start += length
+
+    card = {
+        'id': values['id'],
+        'org_id': values['org_id'],
+        'source_hash': values['source_hash'],
+        'question': values['question'],
+        'answer': values['answer'],
+        'tags': values['tags'],
+        'front_images': values['front_images'].split('\n') if values['front_images'] else [],
+        'back_images': values['back_images'].split('\n') if values['back_images'] else [],
+        'media': values['media'].split('\n') if values['media'] else [],
+        'line': int(values['line']),
+        'review': json.loads(values['review']),
+    }
+    for dialect in cache['dialects']:
+        card[dialect] = (values[f'{dialect}_front'], values[f'{dialect}_back'])
+    return card
+
+
+def find_card(cache, key):
+    """Card whose :ID: (or "number:N") is ``key``, or None; a binary search of the index."""
+    mm, wanted = cache['mm'], key_hash(key)
+    low, high = 0, cache['index_count']
+    while low < high:
+        middle = (low + high) // 2
+        if INDEX_ENTRY.unpack_from(mm, cache['index_at'] + INDEX_ENTRY.size * middle)[0] < wanted:
+            low = middle + 1
+        else:
+            high = middle
+    # Equal hashes are adjacent; the stored card settles a collision
+    while low < cache['index_count']:
+        entry_hash, position = INDEX_ENTRY.unpack_from(mm, cache['index_at'] + INDEX_ENTRY.size * low)
+        if entry_hash != wanted:
+            break
+        card = read_card(cache, position)
+        if key in (card_key(card), f'number:{card["id"]}'):
+            return card
+        low += 1
+    return None
+
+
+def iter_cards(cache):
+    """Every card in source order."""
+    for position in range(cache['count']):
+        yield read_card(cache, position)
+
+
+def load_current(cache_path, org_content, dialects=()):
+    """All cards from ``cache_path`` if it matches ``org_content``, else None."""
+    cache = open_cache(cache_path)
+    if cache is None:
+        return None
+    try:
+        if not is_current(cache, org_content, dialects):
+            return None
+        return list(iter_cards(cache))
+    finally:
+        close_cache(cache)
+
+
+def main():
+    from profiling import setup_logging
+
+    parser = argparse.ArgumentParser(description="Compile org-drill cards to a memory-mappable cache and read it.")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="also log the read time of 'get'")
+    commands = parser.add_subparsers(dest='command', required=True)
+    compile_command = commands.add_parser('compile', help="parse and render an org file into a cache")
+    compile_command.add_argument('input_file', help="org-drill file")
+    compile_command.add_argument('cache', nargs='?', default=CACHE_NAME, help=f"cache file (default {CACHE_NAME})")
+    get = commands.add_parser('get', help="print one card")
+    get.add_argument('cache', help="cache file")
+    get.add_argument('card', help="position in the deck, :ID: property or number:N")
+    args = parser.parse_args()
+    setup_logging(args.verbose)
+
+    if args.command == 'compile':
+        import org_to_deck
+        if not os.path.exists(args.input_file):
+            logger.error("Error: Input file %s not found", args.input_file)
+            sys.exit(1)
+        with open(args.input_file, 'r', encoding='utf-8') as f:
+            org_content = f.read()
+        cards = org_to_deck.load_deck(org_content, DIALECTS)
+        write_cache(args.cache, cards, org_content)
+        logger.info("Compiled %s cards to %s (%s bytes)", len(cards), args.cache, os.path.getsize(args.cache))
+        return
+
+    start = time.perf_counter()
+    cache = open_cache(args.cache)
+    if cache is None:
+        logger.error("Error: %s is not a card cache", args.cache)
+        sys.exit(1)
+    try:
+        card = read_card(cache, int(args.card)) if args.card.isdigit() else find_card(cache, args.card)
+    except IndexError as e:
+        logger.error("Error: %s", e)
+        sys.exit(1)
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        close_cache(cache)
+    if card is None:
+        logger.error("Error: no card %s in %s", args.card, args.cache)
+        sys.exit(1)
+    print(json.dumps(card, indent=1, ensure_ascii=False))
+    logger.debug("Read in %.2f ms (%s cards in cache)", elapsed, cache['count'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Structural Deck Linter
+
+Checks a generated AnkiApp deck card by card instead of only asking
+whether the XML is well-formed:
+
+    malformed         the XML (or one card's XML) does not parse
+    missing-blob      an <img id> names a hash with no blob in the package
+    missing-image     an <img id> still names a source image (NAME.png)
+                      that was never found in the image directory
+    unused-blob       a blob in the package that no card references
+    diagnostic-card   the TEST card / TEST_HASH image older builds added
+    tex               nested or empty <tex>, or unbalanced braces or
+                      \\left/\\right inside it
+    unrendered-math   \\( \\) \\[ \\] left in the text outside <tex>
+    tag-characters    characters other than letters, digits and _ . : -
+                      in the comma-separated tags attribute
+    empty-field       a card without a Front or Back, or an empty Front
+
+Findings carry the card number (from its Problem_N tag or the card
+itself) and its line in the org source when known.
+
+A finished .xml or .zip is read with ElementTree.iterparse and every card
+element is cleared once checked, so memory stays flat however many cards
+the deck has; only the set of blob names is kept. During emission
+lint_cards checks the rendered card stream instead, one card at a time,
+which also pins a parse error to its card.
+
+Usage:
+    python deck_lint.py anki_output/anki_import.zip [--org exam_drill.org]
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import zipfile
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+REPORT_NAME = 'lint_report.txt'
+XML_NAME = 'anki_import.xml'
+DIAGNOSTIC_HASH = 'TEST_HASH'
+DIAGNOSTIC_TAG = 'TEST'
+TAGS_RE = re.compile(r'^[\w.:-]+(?:,[\w.:-]+)*$')
+PROBLEM_TAG_RE = re.compile(r'(?:^|,)Problem_([^,]+)')
+SOURCE_IMAGE_RE = re.compile(r'\.(?:png|svg)$')
+MATH_DELIMITERS = ('\\(', '\\)', '\\[', '\\]')
+SHOWN_FINDINGS = 10
+
+
+def finding(severity, code, message, card=None, line=None):
+    return {'severity': severity, 'code': code, 'message': message, 'card': card, 'line': line}
+
+
+def format_finding(item):
+    where = ''
+    if item['card'] is not None:
+        where = f"card {item['card']}" + (f" (line {item['line']})" if item['line'] else '') + ': '
+    return f"{item['severity']} {item['code']}: {where}{item['message']}"
+
+
+def _text_outside_tex(element, in_tex=False):
+    """Text and tails of ``element``'s subtree that are not inside a <tex>."""
+    inside = in_tex or element.tag == 'tex'
+    if element.text and not inside:
+        yield element.text
+    for child in element:
+        yield from _text_outside_tex(child, inside)
+        if child.tail and not inside:
+            yield child.tail
+
+
+def _check_tex(tex, report):
+    if tex.find('.//tex') is not None:
+        report('error', 'tex', "nested <tex>")
+    text = ''.join(tex.itertext())
+    if not text.strip():
+        report('warning', 'tex', "empty <tex>")
+        return
+    unescaped = text.replace('\\{', '').replace('\\}', '')
+    depth = 0
+    for char in unescaped:
+        depth += (char == '{') - (char == '}')
+        if depth < 0:
+            break
+    if depth:
+        report('error', 'tex', f"unbalanced braces in <tex>{text[:60]}</tex>")
+    if len(re.findall(r'\\left\b', text)) != len(re.findall(r'\\right\b', text)):
+        report('error', 'tex', f"unbalanced \\left/\\right in <tex>{text[:60]}</tex>")
+
+
+def check_card(element, blobs=None, references=None, card=None, line=None):
+    """Findings for one <card> element.
+
+    ``blobs`` is the set of blob names in the package (None skips the media
+    checks); image ids the card references are added to ``references``.
+    """
+    findings = []
+    tags = element.get('tags', '')
+    number = card
+    if number is None:
+        match = PROBLEM_TAG_RE.search(tags)
+        number = match.group(1) if match else None
+
+    def report(severity, code, message):
+        findings.append(finding(severity, code, message, number, line))
+
+    if tags == DIAGNOSTIC_TAG:
+        report('warning', 'diagnostic-card', "hardcoded TEST card in the deck")
+    elif not TAGS_RE.match(tags):
+        report('warning', 'tag-characters', f"tags {tags!r} have characters AnkiApp may split or drop")
+
+    fields = {field.get('name'): field for field in element.iter('rich-text')}
+    for name in ('Front', 'Back'):
+        if name not in fields:
+            report('error', 'empty-field', f"no {name} field")
+    front = fields.get('Front')
+    if front is not None and not ''.join(front.itertext()).strip() and front.find('.//img') is None:
+        report('error', 'empty-field', "empty Front")
+
+    for field in fields.values():
+        for tex in field.iter('tex'):
+            _check_tex(tex, report)
+        text = ''.join(_text_outside_tex(field))
+        for delimiter in MATH_DELIMITERS:
+            if delimiter in text:
+                report('warning', 'unrendered-math', f"{delimiter} left outside <tex> in {field.get('name')}")
+                break
+        for img in field.iter('img'):
+            image_id = img.get('id', '')
+            if image_id == DIAGNOSTIC_HASH:
+                if tags != DIAGNOSTIC_TAG:
+                    report('warning', 'diagnostic-card', f"{DIAGNOSTIC_HASH} image reference")
+                continue
+            if references is not None:
+                references.add(image_id)
+            if blobs is None:
+                continue
+            if SOURCE_IMAGE_RE.search(image_id):
+                report('error', 'missing-image', f"image {image_id} was not found, so it has no blob")
+            elif image_id not in blobs:
+                report('error', 'missing-blob', f"<img id=\"{image_id}\"> has no blob in the package")
+    return findings
+
+
+def lint_cards(cards, image_reference_map):
+    """Lint the rendered card stream as org_to_anki_xml writes it; return findings."""
+    from org_to_anki_xml import card_xml
+    blobs = {info['hash_id'] for info in image_reference_map.values()}
+    findings = []
+    for card in cards:
+        try:
+            element = ElementTree.fromstring(card_xml(card, image_reference_map))
+        except ElementTree.ParseError as e:
+            findings.append(finding('error', 'malformed', str(e), card['id'], card.get('line')))
+            continue
+        findings.extend(check_card(element, blobs, None, card['id'], card.get('line')))
+    return findings
+
+
+def lint_xml(path, blobs=None, card_lines=None):
+    """Lint a deck .xml or .zip by streaming it; return findings.
+
+    For a ZIP the blob set is read from its blobs/ entries and unused blobs
+    are reported too. ``card_lines`` maps card numbers to org source lines.
+    """
+    card_lines = card_lines or {}
+    archive = None
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        blobs = {name[len('blobs/'):] for name in archive.namelist() if name.startswith('blobs/')}
+        stream = archive.open(XML_NAME)
+    else:
+        stream = open(path, 'rb')
+
+    findings = []
+    references = set()
+    cards_parent = None
+    try:
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == 'cards':
+                    cards_parent = element
+                continue
+            if element.tag != 'card':
+                continue
+            match = PROBLEM_TAG_RE.search(element.get('tags', ''))
+            number = match.group(1) if match else None
+            findings.extend(check_card(element, blobs, references, number, card_lines.get(number)))
+            # Drop the checked card so the tree never holds more than one
+            element.clear()
+            if cards_parent is not None:
+                cards_parent.remove(element)
+    except ElementTree.ParseError as e:
+        line, column = e.position
+        findings.append(finding('error', 'malformed', f"{path}: line {line}, column {column}: {e}"))
+    except KeyError:
+        findings.append(finding('error', 'malformed', f"{path}: no {XML_NAME} in the package"))
+    finally:
+        stream.close()
+        if archive is not None:
+            archive.close()
+
+    if archive is not None:
+        for name in sorted(blobs - references):
+            findings.append(finding('warning', 'unused-blob', f"blob {name} is not referenced by any card"))
+    return findings
+
+
+def summarize(findings):
+    """One-line summary: 'N errors, M warnings'."""
+    errors = sum(1 for item in findings if item['severity'] == 'error')
+    return f"{errors} errors, {len(findings) - errors} warnings"
+
+
+def write_report(findings, output_dir):
+    """Write lint_report.txt with every finding; return its path."""
+    report_path = os.path.join(output_dir, REPORT_NAME)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("# Deck Lint Report\n\n")
+        f.write(f"{summarize(findings)}\n\n")
+        for item in findings:
+            f.write(format_finding(item) + '\n')
+    return report_path
+
+
+def log_findings(findings, report_path=None):
+    """Log the summary and the first findings."""
+    errors = [item for item in findings if item['severity'] == 'error']
+    log = logger.warning if errors else logger.info
+    if report_path:
+        log("Deck lint: %s (%s)", summarize(findings), report_path)
+    else:
+        log("Deck lint: %s", summarize(findings))
+    for item in (errors or findings)[:SHOWN_FINDINGS]:
+        log("- %s", format_finding(item))
+
+
+def org_card_lines(org_path):
+    """{card number: headline line} for an org-drill file, read as a stream."""
+    from org_parser import card_number, iter_drill_cards
+    with open(org_path, 'r', encoding='utf-8') as f:
+        return {card_number(card, index): card['line'] for index, card in enumerate(iter_drill_cards(f))}
+
+
+def main():
+    from profiling import setup_logging
+    parser = argparse.ArgumentParser(description="Lint a generated AnkiApp deck (.xml or .zip).")
+    parser.add_argument('deck', help="anki_import.zip or anki_import.xml")
+    parser.add_argument('--org', default=None, help="org-drill source, for card line numbers")
+    args = parser.parse_args()
+    setup_logging()
+
+    if not os.path.exists(args.deck):
+        logger.error("%s not found", args.deck)
+        sys.exit(1)
+    findings = lint_xml(args.deck, card_lines=org_card_lines(args.org) if args.org else None)
+    for item in findings:
+        logger.info('%s', format_finding(item))
+    logger.info('%s', summarize(findings))
+    if any(item['severity'] == 'error' for item in findings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
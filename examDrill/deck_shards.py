@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Size-bounded AnkiApp Deck Shards
+
+Splits one deck into several AnkiApp packages (set1/, set2/, ... in the
+output directory), so no single ZIP is too big to import on a phone. A
+split spec is a comma-separated list of:
+
+    heading      keep the cards of each org heading (``** Exam 1``) together
+    cards=N      at most N cards per package
+    bytes=SIZE   at most SIZE bytes per package (K, M or G suffix)
+
+``heading`` alone gives one package per heading; with a budget, whole
+headings are packed into packages up to the budget, and a heading larger
+than the budget is cut between its cards. A budget alone fills packages in
+card order.
+
+Every package carries each blob its cards reference, so a diagram used by
+cards in two packages is stored in both. While packing, a card's byte cost
+counts only the blobs its package does not hold yet, so cards sharing
+diagrams stay together when the budget allows; a card bigger than the
+budget on its own gets a package to itself.
+
+Packages are built concurrently, each from only its cards and blobs.
+shards.json lists every package with its cards (number and :ID:), its
+headings, its blobs and estimated size, plus the blobs stored in more
+than one package.
+
+Usage:
+    python org_to_deck.py exam_drill.org anki_output --emit xml --split heading,bytes=25M
+    python org_to_anki_xml.py exam_drill.org anki_output --split cards=150
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from build_manifest import card_key
+from org_parser import section_headings
+
+logger = logging.getLogger(__name__)
+
+SHARD_MANIFEST = 'shards.json'
+SHARD_PREFIX = 'set'
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# Per-card XML markup around the two fields
+CARD_OVERHEAD = 120
+# Local and central directory headers of a blobs/<sha256> ZIP entry
+BLOB_OVERHEAD = 256
+
+
+def parse_size(value):
+    """'25M' (or 25600K, 26214400) to a byte count."""
+    value = value.strip().upper().rstrip('B')
+    scale = SIZE_UNITS.get(value[-1:], 1)
+    number = value[:-1] if value[-1:] in SIZE_UNITS else value
+    try:
+        size = int(float(number) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size {value!r} is not a number with an optional K, M or G")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"size {value!r} must be positive")
+    return size
+
+
+def parse_split(value):
+    """Parse 'heading,cards=N,bytes=SIZE' into a split spec dict."""
+    spec = {'heading': False, 'cards': None, 'bytes': None}
+    for item in value.split(','):
+        name, sep, amount = (part.strip() for part in item.partition('='))
+        if name == 'heading' and not sep:
+            spec['heading'] = True
+        elif name == 'cards' and sep:
+            if not amount.isdigit() or int(amount) < 1:
+                raise argparse.ArgumentTypeError(f"cards={amount} is not a positive count")
+            spec['cards'] = int(amount)
+        elif name == 'bytes' and sep:
+            spec['bytes'] = parse_size(amount)
+        else:
+            raise argparse.ArgumentTypeError(
+                f"split entry {item!r} is not heading, cards=N or bytes=SIZE")
+    return spec
+
+
+def card_headings(cards, org_content):
+    """Title of the heading each card is filed under ('' before the first heading)."""
+    headings = section_headings(org_content.splitlines())
+    lines = [line_no for line_no, _, _ in headings]
+    titles = []
+    for card in cards:
+        at = bisect.bisect_left(lines, card.get('line', 0))
+        titles.append(headings[at - 1][2] if at else '')
+    return titles
+
+
+def card_blobs(card, image_reference_map):
+    """Blob hashes the card's XML fields reference."""
+    from org_to_anki_xml import IMG_ID_RE
+    hashes = set()
+    for field in (card['front'], card['back']):
+        for name in IMG_ID_RE.findall(field):
+            reference_info = image_reference_map.get(name)
+            if reference_info is not None:
+                hashes.add(reference_info['hash_id'])
+    return hashes
+
+
+def _units(cards, headings, spec):
+    """Runs of card positions that are packed as a whole."""
+    if not spec['heading']:
+        return [[position] for position in range(len(cards))]
+    units = []
+    for position, heading in enumerate(headings):
+        if units and headings[units[-1][-1]] == heading:
+            units[-1].append(position)
+        else:
+            units.append([position])
+    return units
+
+
+def plan_shards(cards, spec, image_reference_map, headings=None):
+    """Assign the cards to packages; return a list of shard dicts in card order.
+
+    Each shard has its ``name`` (set1, set2, ...), card ``positions``,
+    ``headings``, ``blobs`` ({hash: size in the ZIP}) and ``bytes`` (XML
+    text plus blobs, an upper bound on the ZIP size since the XML is
+    deflated).
+    """
+    headings = headings or [''] * len(cards)
+    blob_sizes = {}
+    for reference_info in image_reference_map.values():
+        if reference_info['hash_id'] not in blob_sizes:
+            blob_sizes[reference_info['hash_id']] = (os.path.getsize(reference_info['stored_path'])
+                                                     + BLOB_OVERHEAD)
+    text_sizes = [len(card['front'].encode('utf-8')) + len(card['back'].encode('utf-8')) + CARD_OVERHEAD
+                  for card in cards]
+    references = [card_blobs(card, image_reference_map) for card in cards]
+
+    def cost(positions, blobs):
+        new_blobs = set().union(*(references[p] for p in positions)) - blobs.keys()
+        return sum(text_sizes[p] for p in positions) + sum(blob_sizes[h] for h in new_blobs)
+
+    def fits(shard, positions):
+        if not shard['positions']:
+            return within_budget(positions)
+        if spec['cards'] and len(shard['positions']) + len(positions) > spec['cards']:
+            return False
+        return not spec['bytes'] or shard['bytes'] + cost(positions, shard['blobs']) <= spec['bytes']
+
+    def within_budget(positions):
+        return ((not spec['cards'] or len(positions) <= spec['cards'])
+                and (not spec['bytes'] or cost(positions, {}) <= spec['bytes']))
+
+    def add(shard, positions):
+        shard['bytes'] += cost(positions, shard['blobs'])
+        for p in positions:
+            shard['positions'].append(p)
+            for hash_id in references[p]:
+                shard['blobs'][hash_id] = blob_sizes[hash_id]
+            if headings[p] not in shard['headings']:
+                shard['headings'].append(headings[p])
+
+    def new_shard():
+        shards.append({'name': f'{SHARD_PREFIX}{len(shards) + 1}', 'positions': [], 'headings': [],
+                       'blobs': {}, 'bytes': 0})
+        return shards[-1]
+
+    shards = []
+    budgeted = spec['cards'] or spec['bytes']
+    shard = None
+    for unit in _units(cards, headings, spec):
+        if shard is not None and budgeted and fits(shard, unit):
+            add(shard, unit)
+        elif not budgeted or within_budget(unit):
+            shard = new_shard()
+            add(shard, unit)
+        else:
+            # A heading (or card) bigger than the budget: cut it between its cards
+            for position in unit:
+                if shard is None or (shard['positions'] and not fits(shard, [position])):
+                    shard = new_shard()
+                add(shard, [position])
+    for shard in shards:
+        if spec['bytes'] and shard['bytes'] > spec['bytes']:
+            logger.warning("%s is %s bytes, over the %s byte budget (a single card with its images)",
+                           shard['name'], shard['bytes'], spec['bytes'])
+    return shards
+
+
+def shard_reference_map(shard, image_reference_map):
+    """The entries of ``image_reference_map`` whose blobs the shard carries."""
+    return {base: info for base, info in image_reference_map.items() if info['hash_id'] in shard['blobs']}
+
+
+def build_shard(cards, shard, output_dir, image_reference_map):
+    """Write one package into ``output_dir``/<shard name>; return (path, is_valid, message)."""
+    import org_to_anki_xml
+    shard_dir = os.path.join(output_dir, shard['name'])
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_cards = [cards[p] for p in shard['positions']]
+    shard_map = shard_reference_map(shard, image_reference_map)
+    # A package has either a ZIP or a bare XML; drop whichever a previous build left
+    for stale in ('anki_import.zip', 'anki_import.xml'):
+        stale_path = os.path.join(shard_dir, stale)
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    if shard_map:
+        return org_to_anki_xml.stream_anki_zip(shard_cards, shard_dir, shard_map)
+    xml_path = org_to_anki_xml.create_anki_xml(shard_cards, shard_dir)
+    return (xml_path,) + org_to_anki_xml.validate_xml(xml_path)
+
+
+def remove_stale_shards(output_dir, names):
+    """Delete package directories a previous split listed but this one does not."""
+    try:
+        with open(os.path.join(output_dir, SHARD_MANIFEST), 'r', encoding='utf-8') as f:
+            previous = [shard['name'] for shard in json.load(f)['shards']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return
+    for name in previous:
+        if name not in names and name.startswith(SHARD_PREFIX):
+            shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+
+
+def shared_blobs(shards):
+    """{hash: [package names]} for the blobs stored in more than one package."""
+    holders = {}
+    for shard in shards:
+        for hash_id in shard['blobs']:
+            holders.setdefault(hash_id, []).append(shard['name'])
+    return {hash_id: names for hash_id, names in sorted(holders.items()) if len(names) > 1}
+
+
+def write_shard_manifest(cards, shards, output_dir, spec, paths):
+    """Write shards.json: which cards and blobs landed in which package."""
+    manifest = {
+        'spec': spec,
+        'shards': [{
+            'name': shard['name'],
+            'path': os.path.relpath(path, output_dir),
+            'headings': shard['headings'],
+            'cards': [{'number': cards[p]['id'], 'key': card_key(cards[p])} for p in shard['positions']],
+            'blobs': sorted(shard['blobs']),
+            'blob_bytes': sum(shard['blobs'].values()),
+            'estimated_bytes': shard['bytes'],
+            'zip_bytes': os.path.getsize(path),
+        } for shard, path in zip(shards, paths)],
+        'shared_blobs': shared_blobs(shards),
+    }
+    manifest_path = os.path.join(output_dir, SHARD_MANIFEST)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest_path
+
+
+def write_shards(cards, output_dir, image_reference_map, spec, org_content=None):
+    """Split the deck by ``spec`` and build every package concurrently.
+
+    ``cards`` are XML-rendered cards (front, back, tags, id; line and
+    org_id for headings and the manifest). Returns (package paths,
+    shards.json path, all packages valid, first validation message).
+    """
+    from org_to_anki_xml import image_worker_count
+    headings = card_headings(cards, org_content) if spec['heading'] and org_content is not None else None
+    shards = plan_shards(cards, spec, image_reference_map, headings)
+    remove_stale_shards(output_dir, {shard['name'] for shard in shards})
+
+    with ThreadPoolExecutor(max_workers=min(len(shards), image_worker_count()) or 1) as pool:
+        results = list(pool.map(lambda shard: build_shard(cards, shard, output_dir, image_reference_map),
+                                shards))
+    paths = [path for path, _, _ in results]
+    invalid = [(shard['name'], message) for shard, (_, is_valid, message) in zip(shards, results) if not is_valid]
+
+    manifest_path = write_shard_manifest(cards, shards, output_dir, spec, paths)
+    logger.info("Split %s cards into %s packages (%s blobs stored in more than one): %s",
+                len(cards), len(shards), len(shared_blobs(shards)), manifest_path)
+    for shard, path in zip(shards, paths):
+        logger.info("- %s: %s cards, %s blobs, %.1f KiB", shard['name'], len(shard['positions']),
+                    len(shard['blobs']), os.path.getsize(path) / 1024)
+    if invalid:
+        return paths, manifest_path, False, '; '.join(f'{name}: {message}' for name, message in invalid)
+    return paths, manifest_path, True, "XML is well-formed"
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate Card Detection
+
+Finds cards whose questions are the same up to whitespace, markup,
+numbering and small edits, across one or more org-drill files, without
+comparing every pair:
+
+    1. normalize the question (lowercase, no markup or image links,
+       whitespace collapsed) and cut it into character shingles
+    2. compute a MinHash signature per card (NUM_PERM multiply-shift
+       hash functions over the CRC-32 of each shingle)
+    3. split signatures into bands; cards sharing any band bucket are
+       candidates. The band count is the smallest that makes a pair at
+       the threshold a candidate with TARGET_RECALL probability
+    4. keep candidates whose exact shingle Jaccard similarity is at least
+       the threshold, and join them into clusters
+
+Signatures and band buckets are computed with numpy when it is installed
+and in plain Python otherwise; both give the same results.
+
+org_to_deck.py uses this with --dedup report|drop|merge: clusters are
+written to duplicates_report.txt, drop keeps the first card of each
+cluster and merge also gives it the Problem_N tags of the others.
+--dedup-against names decks whose cards are already exported, so their
+duplicates are dropped from this one.
+
+Usage:
+    python dedup.py exam_drill.org exam_drill_2.org [--threshold 0.8] [--report duplicates_report.txt]
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import re
+import sys
+import zlib
+from collections import defaultdict
+
+from markup import IMAGE_RE
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+DEFAULT_THRESHOLD = 0.8
+# Chance that a pair at exactly the threshold becomes a candidate
+TARGET_RECALL = 0.99
+SEED = 1
+
+MASK64 = (1 << 64) - 1
+NUMPY_BATCH = 8192
+MAX_HASH = (1 << 32) - 1
+
+MARKUP_RE = re.compile(r'[*\\]')
+SPACE_RE = re.compile(r'\s+')
+SNIPPET_LENGTH = 80
+
+
+def normalize(text):
+    """Question text reduced to what matters for duplicate detection."""
+    text = IMAGE_RE.sub(' image ', text)
+    text = MARKUP_RE.sub('', text).lower()
+    return SPACE_RE.sub(' ', text).strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """CRC-32 hashes of the ``size``-byte shingles of normalized text."""
+    data = text.encode('utf-8')
+    if len(data) <= size:
+        return {zlib.crc32(data)}
+    crc32 = zlib.crc32
+    return {crc32(data[i:i + size]) for i in range(len(data) - size + 1)}
+
+
+def hash_params(num_perm=NUM_PERM, seed=SEED):
+    """Odd 64-bit multipliers and offsets, one pair per hash function."""
+    rng = random.Random(seed)
+    return [(rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(num_perm)]
+
+
+def _signatures_python(shingle_sets, params):
+    signatures = []
+    for values in shingle_sets:
+        signatures.append(tuple(min(((a * x + b) & MASK64) >> 32 for x in values) if values else MAX_HASH
+                                for a, b in params))
+    return signatures
+
+
+def _signatures_numpy(shingle_sets, params, np):
+    a = np.array([p[0] for p in params], dtype=np.uint64)
+    b = np.array([p[1] for p in params], dtype=np.uint64)
+    signatures = np.full((len(shingle_sets), len(params)), MAX_HASH, dtype=np.uint64)
+
+    # Hash many cards' shingles in one product, then take each card's
+    # minimum with reduceat; batches keep the product to ~NUMPY_BATCH rows
+    start = 0
+    while start < len(shingle_sets):
+        end, rows = start, 0
+        while end < len(shingle_sets) and (rows < NUMPY_BATCH or end == start):
+            rows += len(shingle_sets[end])
+            end += 1
+        batch = shingle_sets[start:end]
+        lengths = np.array([len(values) for values in batch], dtype=np.int64)
+        values = np.fromiter(itertools.chain.from_iterable(batch), dtype=np.uint64, count=rows)
+        if rows:
+            with np.errstate(over='ignore'):
+                # uint64 arithmetic wraps, which is the mod 2**64 of multiply-shift
+                # One row per hash function, so each card's shingles are contiguous
+                hashed = np.multiply.outer(a, values)
+                hashed += b[:, None]
+                hashed >>= np.uint64(32)
+            nonempty = lengths > 0
+            offsets = (np.cumsum(lengths) - lengths)[nonempty]
+            signatures[start:end][nonempty] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+    return [tuple(row) for row in signatures.tolist()]
+
+
+def minhash_signatures(shingle_sets, num_perm=NUM_PERM, seed=SEED):
+    """One MinHash signature (tuple of ints) per shingle set."""
+    params = hash_params(num_perm, seed)
+    try:
+        import numpy as np
+    except ImportError:
+        return _signatures_python(shingle_sets, params)
+    return _signatures_numpy(shingle_sets, params, np)
+
+
+def choose_bands(threshold, num_perm=NUM_PERM, recall=TARGET_RECALL):
+    """Fewest bands (so fewest false candidates) that still reach ``recall`` at ``threshold``."""
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands == 0 and 1 - (1 - threshold ** (num_perm // bands)) ** bands >= recall:
+            return bands
+    return num_perm
+
+
+def _add_pairs(pairs, members):
+    members = sorted(members)
+    for i, first in enumerate(members):
+        for second in members[i + 1:]:
+            pairs.add((first, second))
+
+
+def _lsh_python(signatures, bands, rows):
+    pairs = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        for index, signature in enumerate(signatures):
+            buckets[signature[band * rows:(band + 1) * rows]].append(index)
+        for members in buckets.values():
+            if len(members) > 1:
+                _add_pairs(pairs, members)
+    return pairs
+
+
+def _lsh_numpy(signatures, bands, rows, np):
+    matrix = np.array(signatures, dtype=np.uint64)
+    pairs = set()
+    for band in range(bands):
+        # Each card's band as one opaque key; equal keys sort next to each other
+        keys = np.ascontiguousarray(matrix[:, band * rows:(band + 1) * rows]).view(f'V{8 * rows}').ravel()
+        order = np.argsort(keys, kind='stable')
+        ordered = keys[order]
+        run = []
+        for i in np.flatnonzero(ordered[1:] == ordered[:-1]).tolist():
+            if run and run[-1] == i:
+                run.append(i + 1)
+                continue
+            if run:
+                _add_pairs(pairs, order[run].tolist())
+            run = [i, i + 1]
+        if run:
+            _add_pairs(pairs, order[run].tolist())
+    return pairs
+
+
+def lsh_candidates(signatures, bands):
+    """Index pairs (i, j), i < j, that share at least one band bucket."""
+    if not signatures:
+        return set()
+    rows = len(signatures[0]) // bands
+    try:
+        import numpy as np
+    except ImportError:
+        return _lsh_python(signatures, bands, rows)
+    return _lsh_numpy(signatures, bands, rows, np)
+
+
+def jaccard(a, b):
+    """Exact Jaccard similarity of two sets."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def find_clusters(texts, threshold=DEFAULT_THRESHOLD):
+    """Group near-duplicate texts; return a list of (indices, similarity) clusters.
+
+    ``similarity`` is the lowest verified pair similarity that joined the
+    cluster. Clusters and their members are in input order.
+    """
+    shingle_sets = [shingles(normalize(text)) for text in texts]
+    signatures = minhash_signatures(shingle_sets)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    lowest = {}
+    for first, second in sorted(lsh_candidates(signatures, choose_bands(threshold))):
+        similarity = jaccard(shingle_sets[first], shingle_sets[second])
+        if similarity < threshold:
+            continue
+        root_a, root_b = find(first), find(second)
+        root = min(root_a, root_b)
+        joined = min([similarity] + [lowest.pop(r) for r in (root_a, root_b) if r in lowest])
+        parent[root_a] = parent[root_b] = root
+        lowest[root] = joined
+
+    groups = defaultdict(list)
+    for index in range(len(texts)):
+        groups[find(index)].append(index)
+    return [(members, lowest[root]) for root, members in sorted(groups.items()) if len(members) > 1]
+
+
+def dedup_cards(cards, mode='report', threshold=DEFAULT_THRESHOLD, reference=()):
+    """Find duplicate clusters among shared cards and apply ``mode``.
+
+    'report' leaves the cards alone, 'drop' keeps the first card of each
+    cluster, 'merge' keeps it and adds the other cards' tags. Cards from
+    ``reference`` (e.g. an already exported deck) are clustered too but
+    never kept: a cluster that contains one drops all of ``cards`` in it.
+    Returns (kept cards, clusters as lists of cards with similarity).
+    """
+    pool = list(reference) + list(cards)
+    clusters = find_clusters([card['question'] for card in pool], threshold)
+    result = [([pool[i] for i in members], similarity) for members, similarity in clusters]
+    if mode == 'report':
+        return cards, result
+
+    offset = len(reference)
+    dropped = set()
+    for members, _ in clusters:
+        if members[0] < offset:
+            dropped.update(i - offset for i in members if i >= offset)
+            continue
+        keeper = pool[members[0]]
+        dropped.update(i - offset for i in members[1:])
+        if mode == 'merge':
+            tags = keeper['tags'].split(',')
+            for index in members[1:]:
+                tags.extend(t for t in pool[index]['tags'].split(',') if t not in tags)
+            keeper['tags'] = ','.join(tags)
+    return [card for index, card in enumerate(cards) if index not in dropped], result
+
+
+def snippet(text):
+    """Short one-line preview of a question."""
+    text = normalize(text)
+    return text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 3] + '...'
+
+
+def card_label(card):
+    """Problem_N, prefixed with the card's file when it has a ``source``."""
+    if card.get('source'):
+        return f"{os.path.basename(card['source'])} Problem_{card['id']}"
+    return f"Problem_{card['id']}"
+
+
+def write_report(clusters, report_path, threshold=DEFAULT_THRESHOLD):
+    """Write the duplicate clusters found by dedup_cards."""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write('# Duplicate Card Report\n\n')
+        duplicates = sum(len(members) - 1 for members, _ in clusters)
+        f.write(f'Threshold: {threshold}  Clusters: {len(clusters)}  Duplicate cards: {duplicates}\n\n')
+        for number, (members, similarity) in enumerate(clusters, 1):
+            f.write(f'## Cluster {number} (similarity >= {similarity:.2f})\n\n')
+            for card in members:
+                f.write(f'- {card_label(card)}: {snippet(card["question"])}\n')
+            f.write('\n')
+    return report_path
+
+
+def main():
+    from profiling import setup_logging
+    parser = argparse.ArgumentParser(description="Report near-duplicate cards across org-drill files.")
+    parser.add_argument('inputs', nargs='+', help="org-drill files")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"minimum shingle Jaccard similarity (default {DEFAULT_THRESHOLD})")
+    parser.add_argument('--report', default='duplicates_report.txt', help="report file to write")
+    args = parser.parse_args()
+    setup_logging()
+
+    import org_to_deck
+
+    cards = []
+    for input_file in args.inputs:
+        if not os.path.exists(input_file):
+            logger.error("Input file %s not found", input_file)
+            sys.exit(1)
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for card in org_to_deck.load_deck(f.read()):
+                card['source'] = input_file
+                cards.append(card)
+
+    _, clusters = dedup_cards(cards, 'report', args.threshold)
+    write_report(clusters, args.report, args.threshold)
+    duplicates = sum(len(members) - 1 for members, _ in clusters)
+    logger.info("%s cards, %s duplicate clusters, %s duplicate cards", len(cards), len(clusters), duplicates)
+    logger.info("Report written to: %s", args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+NCEES Handbook Cross-references
+
+Tags every card with the FE Reference Handbook sections its text
+mentions ("See the *NCEES Handbook*, Mathematics section.", "Moment of
+Inertia", ...), built from the handbook extracts in studyMaterials/:
+
+    extracted_headings.org   sections (``* Mathematics [0/117]``) and
+                             their headings (``** TODO Taylor's Series``)
+    output.txt               the handbook text, one form feed per page;
+                             its Contents gives each section's first page
+                             and a heading's page is where its line first
+                             appears within its section's pages
+
+The terms are the section titles plus the headings that read like key
+terms: two to six words, with lowercase letters, found under one section
+only (table captions such as "Symbol" or "Units" repeat everywhere).
+They are compiled once into an Aho-Corasick automaton, so each card is
+tagged in a single scan of its text whatever the number of terms: the
+cost is linear in the card text plus the matches. Text and terms are
+lowercased and every run of other characters becomes one space, so
+matches ignore case, punctuation, emphasis and line breaks, and only
+whole words match. A match inside a longer one (Equivalent Circuit in
+Thevenin Equivalent Circuit) is dropped.
+
+Each tagged card gets ``Handbook_<Section>`` tags (so every exporter
+carries them) and ``card['handbook']``, a list of anchors with section,
+heading (None for a section mention) and printed page.
+
+Usage:
+    python org_to_deck.py exam_drill.org anki_output --handbook [studyMaterials]
+    python handbook_index.py exam_drill.org [--handbook studyMaterials]
+"""
+
+import argparse
+import functools
+import logging
+import os
+import re
+import sys
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HANDBOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'studyMaterials')
+HEADINGS_NAME = 'extracted_headings.org'
+TEXT_NAME = 'output.txt'
+REPORT_NAME = 'handbook_report.txt'
+TAG_PREFIX = 'Handbook_'
+MAX_TERM_WORDS = 6
+
+OUTLINE_RE = re.compile(r'^(\*+)\s+(?:(?:TODO|DONE)\s+)?(?:\[#\w\]\s+)?(.*?)\s*(?:\[\d+/\d+\])?\s*$')
+CONTENTS_RE = re.compile(r'^(.*?)\s*\.{3,}\s*(\d+)\s*$')
+SEPARATOR_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase words separated by single spaces."""
+    return ' '.join(SEPARATOR_RE.sub(' ', text.lower()).split())
+
+
+def read_outline(headings_path):
+    """[(section, heading)] from extracted_headings.org; heading is None for a section."""
+    outline = []
+    section = None
+    with open(headings_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = OUTLINE_RE.match(line.rstrip('\n'))
+            if not match:
+                continue
+            if len(match.group(1)) == 1:
+                section = match.group(2)
+                outline.append((section, None))
+            elif section is not None:
+                outline.append((section, match.group(2)))
+    return outline
+
+
+def read_pages(text_path):
+    """({section: first page}, {normalized line: [pages]}) from the handbook text."""
+    with open(text_path, 'r', encoding='utf-8') as f:
+        chunks = f.read().split('\f')
+    section_pages = {}
+    line_pages = {}
+    for chunk in chunks:
+        lines = [line.strip() for line in chunk.splitlines() if line.strip()]
+        for line in lines:
+            contents = CONTENTS_RE.match(line)
+            if contents:
+                section_pages.setdefault(normalize(contents.group(1)), int(contents.group(2)))
+        # The printed page number closes the page
+        if not lines or not lines[-1].isdigit():
+            continue
+        page = int(lines[-1])
+        for line in lines[:-1]:
+            line_pages.setdefault(normalize(line), []).append(page)
+    return section_pages, line_pages
+
+
+def select_terms(outline, section_pages, line_pages):
+    """{normalized term: anchor} for the section titles and the key-term headings."""
+    sections = [section for section, heading in outline if heading is None]
+    starts = sorted((section_pages.get(normalize(s), 0), normalize(s)) for s in sections)
+    ranges = {}
+    for i, (start, key) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else float('inf')
+        ranges[key] = (start, end)
+
+    homes = {}
+    for section, heading in outline:
+        if heading is not None:
+            homes.setdefault(normalize(heading), set()).add(section)
+
+    terms = {}
+    for section in sections:
+        terms[normalize(section)] = {'section': section, 'heading': None,
+                                     'page': section_pages.get(normalize(section))}
+    for section, heading in outline:
+        if heading is None:
+            continue
+        key = normalize(heading)
+        words = key.split()
+        if (key in terms or len(homes[key]) > 1 or not 2 <= len(words) <= MAX_TERM_WORDS
+                or sum(1 for w in words if re.search('[a-z]{3}', w)) < 2 or not re.search('[a-z]', heading)):
+            continue
+        start, end = ranges.get(normalize(section), (0, float('inf')))
+        pages = [page for page in line_pages.get(key, []) if start <= page < end]
+        terms[key] = {'section': section, 'heading': heading, 'page': pages[0] if pages else None}
+    return terms
+
+
+def build_automaton(terms):
+    """Compile terms into an Aho-Corasick automaton.
+
+    States are list indices: ``goto`` holds each state's transitions,
+    ``fail`` its failure link and ``out`` the terms ending there (its own
+    and those reached through failure links).
+    """
+    goto, fail, out = [{}], [0], [[]]
+    for term in terms:
+        state = 0
+        for char in term:
+            if char not in goto[state]:
+                goto.append({})
+                fail.append(0)
+                out.append([])
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        out[state].append(term)
+
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, child in goto[state].items():
+            queue.append(child)
+            link = fail[state]
+            while link and char not in goto[link]:
+                link = fail[link]
+            fail[child] = goto[link].get(char, 0)
+            out[child] = out[child] + out[fail[child]]
+    return {'goto': goto, 'fail': fail, 'out': out}
+
+
+def scan(automaton, text):
+    """(start, end, term) for every whole-word term in normalized ``text``, in one pass."""
+    goto, fail, out = automaton['goto'], automaton['fail'], automaton['out']
+    matches = []
+    state = 0
+    for end, char in enumerate(text, 1):
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        if out[state] and (end == len(text) or text[end] == ' '):
+            for term in out[state]:
+                start = end - len(term)
+                if start == 0 or text[start - 1] == ' ':
+                    matches.append((start, end, term))
+    return matches
+
+
+def outermost(matches):
+    """Drop matches lying inside a longer match."""
+    kept = []
+    for start, end, term in sorted(matches, key=lambda m: (m[0], -m[1])):
+        if kept and start >= kept[-1][0] and end <= kept[-1][1]:
+            continue
+        kept.append((start, end, term))
+    return kept
+
+
+@functools.lru_cache(maxsize=None)
+def _load(headings_path, text_path, stamps):
+    section_pages, line_pages = read_pages(text_path)
+    terms = select_terms(read_outline(headings_path), section_pages, line_pages)
+    return {'terms': terms, 'automaton': build_automaton(terms)}
+
+
+def load_handbook(handbook_dir=DEFAULT_HANDBOOK_DIR):
+    """The compiled index of ``handbook_dir``; rebuilt only when its files change."""
+    headings_path = os.path.join(handbook_dir, HEADINGS_NAME)
+    text_path = os.path.join(handbook_dir, TEXT_NAME)
+    stamps = tuple(os.stat(path).st_mtime_ns for path in (headings_path, text_path))
+    return _load(headings_path, text_path, stamps)
+
+
+def section_tag(section):
+    return TAG_PREFIX + re.sub(r'\W+', '_', section).strip('_')
+
+
+def card_anchors(index, text):
+    """Handbook anchors mentioned in ``text``, in order of first mention."""
+    anchors = []
+    seen = set()
+    for _, _, term in outermost(scan(index['automaton'], normalize(text))):
+        if term not in seen:
+            seen.add(term)
+            anchors.append(index['terms'][term])
+    return anchors
+
+
+def tag_cards(cards, index):
+    """Add Handbook_<Section> tags and ``handbook`` anchors to every card; return tagged count."""
+    tagged = 0
+    for card in cards:
+        anchors = card_anchors(index, card['question'] + '\n' + card['answer'])
+        card['handbook'] = anchors
+        tags = card['tags'].split(',')
+        for anchor in anchors:
+            tag = section_tag(anchor['section'])
+            if tag not in tags:
+                tags.append(tag)
+        card['tags'] = ','.join(tags)
+        tagged += bool(anchors)
+    return tagged
+
+
+def format_anchor(anchor):
+    name = anchor['section'] if anchor['heading'] is None else f"{anchor['section']}: {anchor['heading']}"
+    return name + (f" (p. {anchor['page']})" if anchor['page'] else '')
+
+
+def write_report(cards, report_path):
+    """Write the handbook references of every card."""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("# NCEES Handbook Cross-references\n\n")
+        for card in cards:
+            if card.get('handbook'):
+                f.write(f"Problem {card['id']}: {'; '.join(format_anchor(a) for a in card['handbook'])}\n")
+    return report_path
+
+
+def main():
+    from profiling import setup_logging
+    parser = argparse.ArgumentParser(description="List the NCEES Handbook sections each card mentions.")
+    parser.add_argument('input_file', help="org-drill file")
+    parser.add_argument('--handbook', default=DEFAULT_HANDBOOK_DIR,
+                        help="directory with extracted_headings.org and output.txt")
+    args = parser.parse_args()
+    setup_logging()
+
+    import org_to_deck
+    if not os.path.exists(args.input_file):
+        logger.error("Input file %s not found", args.input_file)
+        sys.exit(1)
+    index = load_handbook(args.handbook)
+    with open(args.input_file, 'r', encoding='utf-8') as f:
+        cards = org_to_deck.load_deck(f.read())
+    tagged = tag_cards(cards, index)
+    for card in cards:
+        if card['handbook']:
+            logger.info("Problem %s: %s", card['id'], '; '.join(format_anchor(a) for a in card['handbook']))
+    logger.info("%s of %s cards reference the handbook (%s terms)", tagged, len(cards), len(index['terms']))
+
+
+if __name__ == "__main__":
+    main()
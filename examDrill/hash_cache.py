@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Persistent File Hash Cache
+
+Remembers the SHA-256 of every file that has been hashed, keyed by its
+absolute path and validated against (size, mtime_ns, inode). Unchanged
+files are never read again, so a warm rebuild over the images/ directory
+costs one stat() per image.
+
+The cache is a small JSON file that lives next to the blob store by
+default. Saving merges with whatever is on disk, under an flock on a
+sidecar .lock file, so several converters (or batch workers) can share
+one cache file without dropping each other's entries.
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+from hashlib import sha256
+
+CACHE_VERSION = 1
+READ_SIZE = 1024 * 1024
+
+_lock = threading.Lock()
+
+
+def default_cache_path(store_dir):
+    """Location of the hash cache that belongs to a blob store."""
+    return os.path.join(store_dir, 'hash_cache.json')
+
+
+def load_hash_cache(cache_path):
+    """Load the cache from disk, returning an empty one if missing or stale."""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('entries', {})
+
+
+@contextlib.contextmanager
+def _file_lock(lock_path):
+    """Hold an exclusive flock on ``lock_path``; a no-op where fcntl is missing."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_hash_cache(cache, cache_path):
+    """Atomically write the cache, merged with entries saved by others."""
+    directory = os.path.dirname(cache_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    # Another process must not replace the file between our load and replace
+    with _file_lock(cache_path + '.lock'):
+        merged = load_hash_cache(cache_path)
+        with _lock:
+            merged.update(cache)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.hash_cache-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': merged}, f, separators=(',', ':'), sort_keys=True)
+        os.replace(temp_path, cache_path)
+    return cache_path
+
+
+def _hash_file(path):
+    """SHA-256 of a file read in large chunks."""
+    h = sha256()
+    with open(path, 'rb', buffering=0) as f:
+        buffer = bytearray(READ_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def file_sha256(path, cache=None):
+    """Return the hex SHA-256 of ``path``, using and updating ``cache``."""
+    if cache is None:
+        return _hash_file(path)
+
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    entry = cache.get(key)
+    if entry is not None and entry[:3] == signature:
+        return entry[3]
+
+    hash_id = _hash_file(key)
+    with _lock:
+        cache[key] = signature + [hash_id]
+    return hash_id
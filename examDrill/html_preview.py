@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Paginated Offline HTML Preview
+
+Replaces the single preview.html that loaded MathJax from a CDN and
+typeset every card at once. The preview is now an index plus pages of
+PAGE_SIZE cards each:
+
+    preview.html               index with links to every page
+    preview/page-0001.html     cards 1-50, with previous/next links
+    preview/pages.json         digest of each page, for incremental rebuilds
+    preview/mathjax/           local MathJax copy, when one is available
+    preview_images/            images, linked in by copy_images_for_preview
+
+Images carry ``loading="lazy"`` and the width and height read from their
+PNG (or SVG) header, so pages do not reflow while they load. Math that
+was pre-rendered by --render-math is shown as its cached image; any other
+math is typeset by MathJax, one card at a time as it scrolls into view.
+
+Nothing is loaded from the network. MathJax is taken from FEDRILL_MATHJAX
+(a MathJax 2 directory with MathJax.js, or a MathJax 3 directory with
+tex-svg.js / tex-chtml.js) or from the usual system locations, and is
+linked into the preview once. Without it, math is shown as source.
+
+A page is only rewritten when the digest of its cards, image sizes and
+page links changes.
+"""
+
+import json
+import os
+import re
+import shutil
+import struct
+from html import escape
+
+import blob_store
+import handbook_index
+from build_manifest import inputs_digest
+from markup import IMAGE_RE, find_math
+
+PAGE_SIZE = 50
+PAGES_DIR = 'preview'
+PAGES_INDEX = 'pages.json'
+PAGE_VERSION = 1
+
+MATHJAX_ENV = 'FEDRILL_MATHJAX'
+MATHJAX_DIRS = (
+    '/usr/share/javascript/mathjax',
+    '/usr/share/nodejs/mathjax-full/es5',
+    '/usr/share/mathjax',
+)
+# Preferred entry script in a MathJax directory, MathJax 3 first
+MATHJAX_ENTRIES = ('tex-svg.js', 'tex-chtml.js', 'MathJax.js')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+SVG_SIZE_RE = re.compile(r'<svg\b[^>]*?\swidth="([\d.]+)(?:px|pt)?"[^>]*?\sheight="([\d.]+)(?:px|pt)?"')
+
+STYLE = '''    <style>
+        body { font-family: 'Helvetica', sans-serif; margin: 20px; background: #f5f5f5; }
+        .card { border: 1px solid #ccc; margin: 15px 0; padding: 15px; background: white; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .card-header { background: #2c3e50; color: white; padding: 10px; margin: -15px -15px 15px; }
+        .question { margin-bottom: 20px; }
+        .handbook { font-size: 0.9em; color: #555; margin-bottom: 15px; }
+        .answer { background: #f9f9f9; padding: 15px; border-left: 4px solid #2980b9; }
+        img { max-width: 100%; height: auto; border: 1px solid #ddd; }
+        img.math { border: 0; vertical-align: middle; }
+        hr { border: 0; height: 1px; background: #ddd; margin: 20px 0; }
+        .nav { margin: 10px 0; }
+        .note { color: #7f8c8d; font-style: italic; }
+    </style>
+'''
+
+# MathJax is told not to typeset on load; each card with math is typeset
+# when it first comes near the viewport
+LAZY_TYPESET = '''    <script>
+    (function () {
+        function typeset(el) {
+            if (window.MathJax && MathJax.typesetPromise) { MathJax.typesetPromise([el]); }
+            else if (window.MathJax && MathJax.Hub) { MathJax.Hub.Queue(['Typeset', MathJax.Hub, el]); }
+        }
+        function start() {
+            var cards = document.querySelectorAll('.card.has-math');
+            if (!('IntersectionObserver' in window)) { cards.forEach(typeset); return; }
+            var observer = new IntersectionObserver(function (entries) {
+                entries.forEach(function (entry) {
+                    if (entry.isIntersecting) { observer.unobserve(entry.target); typeset(entry.target); }
+                });
+            }, {rootMargin: '300px'});
+            cards.forEach(function (card) { observer.observe(card); });
+        }
+        window.addEventListener('load', function () {
+            if (window.MathJax && MathJax.startup && MathJax.startup.promise) { MathJax.startup.promise.then(start); }
+            else { start(); }
+        });
+    })();
+    </script>
+'''
+
+
+def png_size(path):
+    """(width, height) from a PNG's IHDR chunk, or None."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+def svg_size(path):
+    """(width, height) from the root element of an SVG, or None."""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            head = f.read(4096)
+    except OSError:
+        return None
+    match = SVG_SIZE_RE.search(head)
+    if not match:
+        return None
+    return tuple(round(float(v)) for v in match.groups())
+
+
+def image_size(path):
+    """Intrinsic size of a preview image, read from its header only."""
+    return svg_size(path) if path.lower().endswith('.svg') else png_size(path)
+
+
+def find_mathjax():
+    """(directory, entry script) of a local MathJax, or None."""
+    candidates = [os.environ[MATHJAX_ENV]] if os.environ.get(MATHJAX_ENV) else list(MATHJAX_DIRS)
+    for directory in candidates:
+        for entry in MATHJAX_ENTRIES:
+            if os.path.isfile(os.path.join(directory, entry)):
+                return directory, entry
+    return None
+
+
+def vendor_mathjax(pages_dir):
+    """Link a local MathJax into ``pages_dir``; return its entry script or None."""
+    found = find_mathjax()
+    if found is None:
+        return None
+    source_dir, entry = found
+    target_dir = os.path.join(pages_dir, 'mathjax')
+    if not os.path.isfile(os.path.join(target_dir, entry)):
+        shutil.copytree(source_dir, target_dir, copy_function=blob_store.materialize, dirs_exist_ok=True)
+    return entry
+
+
+def mathjax_head(entry):
+    """Config and script tags for the vendored MathJax (relative to a page)."""
+    if entry is None:
+        return ''
+    if entry == 'MathJax.js':
+        return ('    <script type="text/x-mathjax-config">\n'
+                '        MathJax.Hub.Config({skipStartupTypeset: true,\n'
+                "            tex2jax: {inlineMath: [['$','$'], ['\\\\(','\\\\)']]}});\n"
+                '    </script>\n'
+                '    <script src="mathjax/MathJax.js?config=TeX-AMS_HTML"></script>\n')
+    return ('    <script>\n'
+            "        window.MathJax = {tex: {inlineMath: [['$','$'], ['\\\\(','\\\\)']]},\n"
+            '                          startup: {typeset: false}};\n'
+            '    </script>\n'
+            f'    <script src="mathjax/{entry}"></script>\n')
+
+
+def img_tag(filename, alt, sizes, css_class=None):
+    """Lazy <img> into preview_images with its intrinsic size when known."""
+    size = sizes.get(filename)
+    attrs = f' width="{size[0]}" height="{size[1]}"' if size else ''
+    if css_class:
+        attrs += f' class="{css_class}"'
+    return f'<img src="../preview_images/{filename}" alt="{alt}" loading="lazy"{attrs}>'
+
+
+def field_html(text, alt, sizes, math_images):
+    """Preview HTML of one raw card field; returns (html, has_math)."""
+    for fragment in find_math(text):
+        name = (math_images or {}).get(fragment)
+        if name:
+            text = text.replace(fragment, img_tag(name, 'math', sizes, 'math'))
+    has_math = bool(find_math(text))
+    text = IMAGE_RE.sub(lambda m: img_tag(m.group(1), alt, sizes), text)
+    return text.replace('\n\n', '<br><br>'), has_math
+
+
+def page_name(number):
+    """File name of a page, numbered from 1."""
+    return f'page-{number:04d}.html'
+
+
+def card_images(card):
+    """Every preview image a card shows, including math renders."""
+    return card['front_images'] + card['back_images'] + sorted((card.get('math_images') or {}).values())
+
+
+def write_page(path, number, page_count, cards, mathjax_entry):
+    """Write one page of cards."""
+    first, last = cards[0]['id'], cards[-1]['id']
+    nav = ['<a href="../preview.html">Index</a>']
+    if number > 1:
+        nav.append(f'<a href="{page_name(number - 1)}">&larr; Previous</a>')
+    if number < page_count:
+        nav.append(f'<a href="{page_name(number + 1)}">Next &rarr;</a>')
+    nav_html = '<div class="nav">' + ' | '.join(nav) + f' &nbsp; Page {number} of {page_count}</div>\n'
+
+    # Pages whose math is all pre-rendered do not load MathJax at all
+    if not any(card['has_math'] for card in cards):
+        mathjax_entry = None
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="utf-8">\n')
+        f.write(f'    <title>Engineering Exam Cards Preview - Problems {first}-{last}</title>\n')
+        f.write(STYLE)
+        f.write(mathjax_head(mathjax_entry))
+        f.write('</head>\n<body>\n')
+        f.write(f'    <h1>Problems {first}-{last}</h1>\n')
+        f.write(nav_html)
+        if mathjax_entry is None and any(c['has_math'] for c in cards):
+            f.write('<p class="note">No local MathJax found; math is shown as source '
+                    f'(set {MATHJAX_ENV} or use --render-math).</p>\n')
+
+        for card in cards:
+            css = 'card has-math' if card['has_math'] else 'card'
+            f.write(f'<div class="{css}">')
+            f.write(f'<div class="card-header"><h3>Problem {card["id"]}</h3></div>')
+            if card.get('handbook'):
+                f.write(f'<div class="handbook">NCEES Handbook: {escape("; ".join(card["handbook"]))}</div>')
+            f.write(f'<div class="question"><strong>Question:</strong><br>{card["front"]}</div><hr>')
+            f.write(f'<div class="answer"><strong>Solution:</strong><br>{card["back"]}</div>')
+            f.write('</div>\n')
+
+        f.write(nav_html)
+        if mathjax_entry is not None:
+            f.write(LAZY_TYPESET)
+        f.write('</body></html>\n')
+
+
+def write_index(path, pages):
+    """Write preview.html linking every page with its problem range."""
+    total = sum(len(cards) for cards in pages)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="utf-8">\n')
+        f.write('    <title>Engineering Exam Cards Preview</title>\n')
+        f.write(STYLE)
+        f.write('</head>\n<body>\n')
+        f.write('    <h1>Mechanical Engineering Exam Flashcards</h1>\n')
+        f.write(f'    <p>Preview of {total} converted flashcards in {len(pages)} pages</p>\n    <ul>\n')
+        for number, cards in enumerate(pages, 1):
+            f.write(f'        <li><a href="{PAGES_DIR}/{page_name(number)}">'
+                    f'Problems {cards[0]["id"]}-{cards[-1]["id"]}</a> ({len(cards)} cards)</li>\n')
+        f.write('    </ul>\n</body></html>\n')
+
+
+def load_page_digests(pages_dir):
+    """Digests of the pages written last time, by file name."""
+    try:
+        with open(os.path.join(pages_dir, PAGES_INDEX), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get('pages', {}) if data.get('version') == PAGE_VERSION else {}
+
+
+def write_preview(cards, output_dir, page_size=PAGE_SIZE):
+    """Write the index and every changed page; return (index_path, stats).
+
+    Images must already be in ``output_dir/preview_images`` so their sizes
+    can be read.
+    """
+    pages_dir = os.path.join(output_dir, PAGES_DIR)
+    images_dir = os.path.join(output_dir, 'preview_images')
+    os.makedirs(pages_dir, exist_ok=True)
+    mathjax_entry = vendor_mathjax(pages_dir)
+
+    sizes = {}
+    for card in cards:
+        for filename in card_images(card):
+            if filename not in sizes:
+                sizes[filename] = image_size(os.path.join(images_dir, filename))
+
+    page_cards = []
+    for card in cards:
+        front, front_math = field_html(card['original_front'], 'Question diagram', sizes, card.get('math_images'))
+        back, back_math = field_html(card['original_back'], 'Solution diagram', sizes, card.get('math_images'))
+        page_cards.append({'id': card['id'], 'front': front, 'back': back, 'has_math': front_math or back_math})
+        if card.get('handbook'):
+            page_cards[-1]['handbook'] = [handbook_index.format_anchor(anchor) for anchor in card['handbook']]
+    pages = [page_cards[i:i + page_size] for i in range(0, len(page_cards), page_size)]
+
+    previous = load_page_digests(pages_dir)
+    digests = {}
+    stats = {'pages': len(pages), 'written': 0, 'unchanged': 0, 'mathjax': mathjax_entry}
+    for number, cards_on_page in enumerate(pages, 1):
+        name = page_name(number)
+        path = os.path.join(pages_dir, name)
+        digests[name] = inputs_digest([PAGE_VERSION, number, len(pages), mathjax_entry, cards_on_page])
+        if previous.get(name) == digests[name] and os.path.exists(path):
+            stats['unchanged'] += 1
+            continue
+        write_page(path, number, len(pages), cards_on_page, mathjax_entry)
+        stats['written'] += 1
+
+    # Pages past the new end are left over from a larger deck
+    for name in set(previous) - set(digests):
+        stale = os.path.join(pages_dir, name)
+        if os.path.exists(stale):
+            os.unlink(stale)
+
+    with open(os.path.join(pages_dir, PAGES_INDEX), 'w', encoding='utf-8') as f:
+        json.dump({'version': PAGE_VERSION, 'pages': digests}, f, indent=1, sort_keys=True)
+
+    index_path = os.path.join(output_dir, 'preview.html')
+    write_index(index_path, pages)
+    return index_path, stats
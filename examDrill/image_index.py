@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Perceptual Image Index
+
+Finds diagrams that look the same even when their bytes differ: copies
+saved under another number, re-encoded PNGs, resized renders, and (with
+--polarity) dark-theme recolors of the same figure.
+
+Each raster image gets two 64-bit perceptual hashes, computed for whole
+batches at once with numpy:
+
+    dHash   sign of the horizontal gradient of a 9x8 grayscale thumbnail
+    pHash   sign, against the median, of the 8x8 lowest-frequency DCT
+            coefficients (DC excluded) of a 32x32 grayscale thumbnail
+
+Two images match when both hashes are within ``distance`` bits of each
+other. Candidates come from a BK-tree over the pHashes, so a search
+visits only the part of the tree the triangle inequality allows instead
+of every pair. With ``polarity`` the tree is also searched with the
+complement of each hash, since inverting the gray levels flips (nearly)
+every bit; that is what recoloring black-on-white to light-on-dark does.
+The tree keeps the raw hashes, so near-matches still match.
+
+Hashes are kept in ``<blob store>/image_index.json`` keyed by the file's
+SHA-256, so only images never seen before are decoded (in a process
+pool); byte-identical files always match. SVGs and other files Pillow
+cannot read are matched by content only.
+
+org_to_deck.py --collapse-images uses this to point visually identical
+diagrams of the same pixel size at one blob. Hash matches are confirmed
+at full resolution first: on the exam images a diagram with one label
+removed is within 4 bits of the original.
+
+Requirements (optional, only for this tool):
+    - numpy
+    - Pillow
+
+Usage:
+    python image_index.py images/ [images_backup/ ...] [--distance 4] [--polarity] [--report image_duplicates.txt]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import blob_store
+from hash_cache import default_cache_path, file_sha256, load_hash_cache, save_hash_cache
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_DISTANCE = 4
+DHASH_SIZE = 8
+PHASH_SIZE = 32
+PHASH_LOW = 8
+MASK64 = (1 << 64) - 1
+
+# --collapse-images: at most this share of pixels may differ by more than
+# PIXEL_THRESHOLD gray levels
+COLLAPSE_TOLERANCE = 0.001
+PIXEL_THRESHOLD = 32
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg')
+
+_index_lock = threading.Lock()
+
+
+def index_path(store_dir):
+    """Location of the content hash -> perceptual hash index."""
+    return os.path.join(store_dir, 'image_index.json')
+
+
+def load_index(store_dir):
+    """Load the image index, or an empty one."""
+    try:
+        with open(index_path(store_dir), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get('entries', {}) if data.get('version') == INDEX_VERSION else {}
+
+
+def save_index(index, store_dir):
+    """Atomically write the index, merged with entries saved by others."""
+    with _index_lock:
+        merged = load_index(store_dir)
+        merged.update(index)
+        fd, temp_path = tempfile.mkstemp(dir=store_dir, prefix='.image_index-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'entries': merged}, f, separators=(',', ':'), sort_keys=True)
+        os.replace(temp_path, index_path(store_dir))
+
+
+def _thumbnails(path):
+    """Worker: (width, height, dHash thumbnail, pHash thumbnail) or None.
+
+    Transparent areas are laid on white first, so a diagram with an alpha
+    channel hashes like its flattened copy.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            size = image.size
+            if image.mode in ('RGBA', 'LA', 'P') or 'transparency' in image.info:
+                rgba = image.convert('RGBA')
+                flat = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+                flat.alpha_composite(rgba)
+                gray = flat.convert('L')
+            else:
+                gray = image.convert('L')
+    except (OSError, ValueError):
+        return None
+    small = gray.resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR).tobytes()
+    square = gray.resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR).tobytes()
+    return size[0], size[1], small, square
+
+
+def dct_matrix(n, np):
+    """Orthonormal DCT-II matrix, so the 2-D DCT of X is D @ X @ D.T."""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _pack(bits, np):
+    """Rows of 64 booleans to Python ints, first bit most significant."""
+    return [int(v) for v in np.packbits(bits, axis=1).view('>u8').ravel()]
+
+
+def dhash_batch(thumbnails, np):
+    """dHashes of an (N, 8, 9) array of grayscale thumbnails."""
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    return _pack(bits.reshape(len(thumbnails), -1), np)
+
+
+def phash_batch(thumbnails, np):
+    """pHashes of an (N, 32, 32) array of grayscale thumbnails."""
+    dct = dct_matrix(PHASH_SIZE, np)
+    coefficients = dct @ thumbnails.astype(np.float64) @ dct.T
+    low = coefficients[:, :PHASH_LOW, :PHASH_LOW].reshape(len(thumbnails), -1)
+    median = np.median(low[:, 1:], axis=1)
+    return _pack(low > median[:, None], np)
+
+
+def hash_files(paths, store_dir=None, cache=None, jobs=None):
+    """Index entries for ``paths``: {path: entry}, plus stats.
+
+    An entry is {'sha256', 'width', 'height', 'dhash', 'phash'}; the size
+    and hashes are None for files that cannot be decoded as raster images.
+    """
+    store_dir = store_dir or blob_store.default_store_dir()
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_index(store_dir)
+
+    digests = {path: file_sha256(path, cache) for path in paths}
+    misses = {}
+    for path, digest in sorted(digests.items()):
+        if digest not in index and digest not in misses.values():
+            misses[path] = digest
+
+    stats = {'images': len(paths), 'cached': len(paths) - len(misses), 'hashed': 0, 'undecodable': 0}
+    new_entries = {}
+    raster = [p for p in misses if not p.lower().endswith('.svg')]
+    for path in misses:
+        if path not in raster:
+            new_entries[misses[path]] = None
+            stats['undecodable'] += 1
+
+    if raster:
+        try:
+            import numpy as np
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError("image indexing needs numpy and Pillow (pip install numpy pillow)")
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            thumbnails = list(pool.map(_thumbnails, raster, chunksize=16))
+        decoded = [(path, t) for path, t in zip(raster, thumbnails) if t is not None]
+        for path, t in zip(raster, thumbnails):
+            if t is None:
+                new_entries[misses[path]] = None
+                stats['undecodable'] += 1
+
+        if decoded:
+            small = np.frombuffer(b''.join(t[2] for _, t in decoded), dtype=np.uint8).reshape(
+                len(decoded), DHASH_SIZE, DHASH_SIZE + 1)
+            square = np.frombuffer(b''.join(t[3] for _, t in decoded), dtype=np.uint8).reshape(
+                len(decoded), PHASH_SIZE, PHASH_SIZE)
+            for (path, t), dhash, phash in zip(decoded, dhash_batch(small, np), phash_batch(square, np)):
+                new_entries[misses[path]] = [t[0], t[1], f'{dhash:016x}', f'{phash:016x}']
+            stats['hashed'] = len(decoded)
+
+    if new_entries:
+        index.update(new_entries)
+        save_index(new_entries, store_dir)
+
+    entries = {}
+    for path, digest in digests.items():
+        values = index.get(digest)
+        width, height, dhash, phash = values if values else (None, None, None, None)
+        entries[path] = {'sha256': digest, 'width': width, 'height': height,
+                         'dhash': int(dhash, 16) if dhash else None, 'phash': int(phash, 16) if phash else None}
+    return entries, stats
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count('1')
+
+
+def bk_insert(tree, key, item):
+    """Add ``item`` under hash ``key`` to a BK-tree ([key, items, children]); return the tree."""
+    if tree is None:
+        return [key, [item], {}]
+    node = tree
+    while True:
+        distance = hamming(key, node[0])
+        if distance == 0:
+            node[1].append(item)
+            return tree
+        child = node[2].get(distance)
+        if child is None:
+            node[2][distance] = [key, [item], {}]
+            return tree
+        node = child
+
+
+def bk_search(tree, key, radius):
+    """Items whose keys are within ``radius`` bits of ``key``."""
+    found = []
+    stack = [tree] if tree is not None else []
+    while stack:
+        node = stack.pop()
+        distance = hamming(key, node[0])
+        if distance <= radius:
+            found.extend(node[1])
+        # Only children at |d - distance| <= radius can hold a match
+        for child_distance, child in node[2].items():
+            if distance - radius <= child_distance <= distance + radius:
+                stack.append(child)
+    return found
+
+
+def find_groups(entries, distance=DEFAULT_DISTANCE, polarity=False, same_size=False):
+    """Group names whose images match; return sorted lists of two or more names.
+
+    ``entries`` maps a name to a hash_files entry. Byte-identical files
+    always match; raster images also match when both perceptual hashes
+    are within ``distance`` bits (and, with ``same_size``, have the same
+    pixel size).
+    """
+    names = sorted(entries)
+    parent = {name: name for name in names}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    by_content = {}
+    for name in names:
+        first = by_content.setdefault(entries[name]['sha256'], name)
+        union(first, name)
+
+    tree = None
+    for name in names:
+        if entries[name]['phash'] is not None:
+            tree = bk_insert(tree, entries[name]['phash'], name)
+
+    # An inverted image matches on the complement of both of its hashes
+    inversions = (0, MASK64) if polarity else (0,)
+    for name in names:
+        entry = entries[name]
+        if entry['phash'] is None:
+            continue
+        for inversion in inversions:
+            for other in bk_search(tree, entry['phash'] ^ inversion, distance):
+                if other <= name:
+                    continue
+                candidate = entries[other]
+                if same_size and (candidate['width'], candidate['height']) != (entry['width'], entry['height']):
+                    continue
+                if hamming(candidate['dhash'], entry['dhash'] ^ inversion) <= distance:
+                    union(name, other)
+
+    groups = {}
+    for name in names:
+        groups.setdefault(find(name), []).append(name)
+    return [members for _, members in sorted(groups.items()) if len(members) > 1]
+
+
+def pixels_match(path_a, path_b, tolerance=COLLAPSE_TOLERANCE):
+    """Whether two same-size images differ in at most ``tolerance`` of their pixels.
+
+    Perceptual hashes also match a diagram with one label removed, so a
+    collapse is only made after this full-resolution check.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path_a) as a, Image.open(path_b) as b:
+        if a.size != b.size:
+            return False
+        gray_a = np.asarray(a.convert('L'), dtype=np.int16)
+        gray_b = np.asarray(b.convert('L'), dtype=np.int16)
+    differing = np.count_nonzero(np.abs(gray_a - gray_b) > PIXEL_THRESHOLD)
+    return differing <= tolerance * gray_a.size
+
+
+def collapse_reference_map(image_reference_map, distance=DEFAULT_DISTANCE, store_dir=None, cache=None):
+    """Point visually identical images of the same size at one blob.
+
+    Within each group the image whose name sorts first is kept; the others
+    take its hash and stored path once pixels_match confirms them.
+    Returns (new map, stats).
+    """
+    store_dir = store_dir or blob_store.default_store_dir()
+    paths = {base: info['stored_path'] for base, info in image_reference_map.items()}
+    by_path, hash_stats = hash_files(sorted(set(paths.values())), store_dir, cache)
+    groups = find_groups({base: by_path[path] for base, path in paths.items()}, distance, same_size=True)
+
+    collapsed = dict(image_reference_map)
+    stats = {'groups': 0, 'collapsed': 0, 'rejected': 0, 'hashed': hash_stats['hashed']}
+    for members in groups:
+        keeper = image_reference_map[members[0]]
+        changed = []
+        for base in members[1:]:
+            info = image_reference_map[base]
+            if info['hash_id'] == keeper['hash_id']:
+                continue
+            if pixels_match(keeper['stored_path'], info['stored_path']):
+                changed.append(base)
+            else:
+                stats['rejected'] += 1
+        if not changed:
+            continue
+        stats['groups'] += 1
+        for base in changed:
+            collapsed[base] = dict(image_reference_map[base], hash_id=keeper['hash_id'],
+                                   stored_path=keeper['stored_path'])
+            stats['collapsed'] += 1
+    return collapsed, stats
+
+
+def write_report(groups, entries, report_path, distance, polarity):
+    """Write the groups of matching images."""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write('# Image Duplicate Report\n\n')
+        f.write(f'Distance: {distance} bits  Polarity: {"yes" if polarity else "no"}\n')
+        f.write(f'Images: {len(entries)}  Groups: {len(groups)}  '
+                f'Redundant images: {sum(len(g) - 1 for g in groups)}\n\n')
+        for number, members in enumerate(groups, 1):
+            identical = len({entries[m]['sha256'] for m in members}) == 1
+            f.write(f'## Group {number} ({"byte-identical" if identical else "visually matching"})\n\n')
+            for name in members:
+                entry = entries[name]
+                size = f'{entry["width"]}x{entry["height"]}' if entry['width'] else 'not raster'
+                f.write(f'- {name} ({size}, sha256 {entry["sha256"][:12]})\n')
+            f.write('\n')
+    return report_path
+
+
+def main():
+    from profiling import setup_logging
+    parser = argparse.ArgumentParser(description="Find duplicate and near-duplicate images by perceptual hash.")
+    parser.add_argument('dirs', nargs='+', help="directories of images")
+    parser.add_argument('--distance', type=int, default=DEFAULT_DISTANCE,
+                        help=f"maximum differing bits per 64-bit hash (default {DEFAULT_DISTANCE})")
+    parser.add_argument('--polarity', action='store_true',
+                        help="also match images whose gray levels are inverted (dark-theme recolors)")
+    parser.add_argument('--report', default='image_duplicates.txt', help="report file to write")
+    args = parser.parse_args()
+    setup_logging()
+
+    paths = []
+    for directory in args.dirs:
+        if not os.path.isdir(directory):
+            logger.error("%s is not a directory", directory)
+            sys.exit(1)
+        paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                     if name.lower().endswith(IMAGE_EXTENSIONS))
+
+    store_dir = blob_store.default_store_dir()
+    cache_path = default_cache_path(store_dir)
+    cache = load_hash_cache(cache_path)
+    try:
+        entries, stats = hash_files(paths, store_dir, cache)
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+    save_hash_cache(cache, cache_path)
+
+    groups = find_groups(entries, args.distance, args.polarity)
+    write_report(groups, entries, args.report, args.distance, args.polarity)
+    logger.info("Indexed %s images (%s cached, %s hashed, %s not raster)",
+                stats['images'], stats['cached'], stats['hashed'], stats['undecodable'])
+    logger.info("%s groups, %s redundant images", len(groups), sum(len(g) - 1 for g in groups))
+    logger.info("Report written to: %s", args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+LaTeX Fragment Render Cache
+
+Pre-renders the math in card fields to images so clients show a picture
+instead of typesetting every formula on every view. A render is named
+``fedrill-ltx_<sha1>.svg``, where the SHA-1 covers the LaTeX document
+template and the fragment source including its delimiters, so changing
+the template renders everything again.
+
+Org's own ``ltximg/org-ltximg_*`` previews cannot be reused: org hashes
+a printed list of Emacs settings (LaTeX header, packages, preview
+options, colours) along with the fragment, which cannot be rebuilt
+outside Emacs.
+
+Every render lives once in a shared cache, ``<blob store>/ltximg/``,
+hardlinked from the blob store. Only misses are rendered, in a thread
+pool, with latex + dvisvgm from the local TeX installation (RENDERERS).
+Tests pass the private ``stub`` renderer instead, which writes a
+placeholder SVG with the source text into ``<blob store>/ltximg-stub/``;
+it is not offered on the command line, so no deck ships placeholders.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import xml.sax.saxutils as saxutils
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+
+import blob_store
+from markup import find_math
+
+logger = logging.getLogger(__name__)
+
+RENDER_PREFIX = 'fedrill-ltx_'
+RENDER_EXTENSIONS = ('.svg', '.png')
+
+LATEX_DOCUMENT = r'''\documentclass{article}
+\usepackage[usenames]{color}
+\usepackage{amsmath,amssymb}
+\pagestyle{empty}
+\begin{document}
+%s
+\end{document}
+'''
+
+
+def latex_cache_dir(store_dir=None, renderer='latex'):
+    """The shared render cache inside the blob store.
+
+    Stub renders get their own directory so they never stand in for real ones.
+    """
+    name = 'ltximg-stub' if renderer == 'stub' else 'ltximg'
+    return os.path.join(store_dir or blob_store.default_store_dir(), name)
+
+
+def fragment_name(fragment):
+    """Render file stem for a fragment: fedrill-ltx_<sha1 of template and fragment>."""
+    return RENDER_PREFIX + sha1((LATEX_DOCUMENT + fragment).encode('utf-8')).hexdigest()
+
+
+def find_cached(cache_dir, stem):
+    """Path of an existing render for ``stem`` in the cache, or None."""
+    for ext in RENDER_EXTENSIONS:
+        path = os.path.join(cache_dir, stem + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def render_stub(fragment, out_dir, stem):
+    """Placeholder renderer: an SVG that shows the fragment source."""
+    path = os.path.join(out_dir, stem + '.svg')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="20">'
+                '<text x="0" y="15" font-family="monospace" font-size="12">%s</text></svg>\n'
+                % (8 * len(fragment), saxutils.escape(fragment)))
+    return path
+
+
+def render_latex(fragment, out_dir, stem):
+    """Render with latex + dvisvgm; raises RuntimeError when either fails."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        tex_path = os.path.join(work_dir, 'fragment.tex')
+        with open(tex_path, 'w', encoding='utf-8') as f:
+            f.write(LATEX_DOCUMENT % fragment)
+        for command in (['latex', '-interaction', 'nonstopmode', '-halt-on-error', 'fragment.tex'],
+                        ['dvisvgm', '--no-fonts', '--exact-bbox', '-o', 'fragment.svg', 'fragment.dvi']):
+            result = subprocess.run(command, cwd=work_dir, capture_output=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"{command[0]} failed on {fragment!r}")
+        path = os.path.join(out_dir, stem + '.svg')
+        shutil.move(os.path.join(work_dir, 'fragment.svg'), path)
+    return path
+
+
+# Renderers offered to users; _RENDERERS also holds the test-only stub
+RENDERERS = ('latex',)
+_RENDERERS = {
+    'latex': render_latex,
+    'stub': render_stub,
+}
+
+
+def renderer_available(name):
+    """Whether the named renderer can run on this machine."""
+    if name == 'latex':
+        return bool(shutil.which('latex') and shutil.which('dvisvgm'))
+    return name in _RENDERERS
+
+
+def collect_fragments(texts):
+    """Unique math fragments (with delimiters) across ``texts``, in first-seen order."""
+    fragments = {}
+    for text in texts:
+        for fragment in find_math(text):
+            fragments.setdefault(fragment, None)
+    return list(fragments)
+
+
+def render_fragments(fragments, renderer='latex', store_dir=None, workers=None):
+    """Map every fragment to a cached render, rendering only the misses.
+
+    Returns (math_images, stats): ``math_images`` maps fragment source to
+    the render path in the cache; fragments that failed to render are left
+    out, so they stay as math in the card.
+    """
+    store_dir = store_dir or blob_store.default_store_dir()
+    cache_dir = latex_cache_dir(store_dir, renderer)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    math_images = {}
+    misses = []
+    for fragment in fragments:
+        stem = fragment_name(fragment)
+        cached = find_cached(cache_dir, stem)
+        if cached:
+            math_images[fragment] = cached
+        else:
+            misses.append((fragment, stem))
+
+    stats = {'fragments': len(fragments), 'hits': len(math_images), 'rendered': 0, 'failed': 0}
+    if misses and not renderer_available(renderer):
+        logger.warning("LaTeX renderer '%s' is not available; %s fragments left as math", renderer, len(misses))
+        stats['failed'] = len(misses)
+        return math_images, stats
+
+    render = _RENDERERS[renderer]
+
+    def render_one(item):
+        fragment, stem = item
+        try:
+            path = render(fragment, cache_dir, stem)
+        except (OSError, RuntimeError) as e:
+            logger.warning("%s", e)
+            return fragment, None
+        # Keep the render itself in the blob store; the cache entry links to it
+        _, stored_path, _ = blob_store.put_file(store_dir, path)
+        blob_store.materialize(stored_path, path)
+        return fragment, path
+
+    # Renderers spend their time in subprocesses, so threads are enough
+    with ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 1) * 2)) as pool:
+        for fragment, path in pool.map(render_one, misses):
+            if path is None:
+                stats['failed'] += 1
+            else:
+                math_images[fragment] = path
+                stats['rendered'] += 1
+    return math_images, stats
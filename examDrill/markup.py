@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Fused Org Markup Transformer
+
+Converts the body text of an org-drill card into either of the two
+dialects the converters produce, in a single scan of the field:
+
+    - 'html': Anki CSV fields (``$...$`` math, ``<em>``, ``<br>``, ``<img src>``)
+    - 'xml':  AnkiApp rich-text (``<tex>``, ``<b>``, ``<br></br>``, ``<img id>``)
+
+The field is tokenized once by one compiled alternation into answer-marker,
+bold, step-heading, image-link, math, emphasis and escaped-character
+tokens; everything between tokens is plain text, and since no token spans
+a line the newline rewrite is a plain ``str.replace`` on the result.
+Generated markup is never scanned again, so e.g. ``*...*`` emphasis can
+no longer match inside output of an earlier rewrite.
+"""
+
+import re
+import xml.sax.saxutils as saxutils
+
+# Image links as written by the org exports: [[./images/000123.png]]
+IMAGE_PATTERN = r'\[\[\.?/?(?:images/)?([\w-]+\.png)\]\]'
+IMAGE_RE = re.compile(IMAGE_PATTERN)
+
+# Every token starts with one of these characters; the leading lookahead
+# lets the scanner skip plain text without trying each alternative
+TOKEN_RE = re.compile(
+    r'(?=[*\[\\$])(?:'
+    # ***The answer is \(A\).***
+    r'(?P<answer>\*\*\*The answer is \\?\(?(?P<choice>[A-D])\\?\)?\.\*\*\*)'
+    # ***The answer is \(A\) and \(C\).*** and any other ***...***
+    r'|(?P<bold>\*\*\*(?P<bold_text>[^*\n]+?)\*\*\*)'
+    # **step 1: **
+    r'|(?P<strong>\*\*(?P<strong_text>[^*\n]+?):\s*\*\*)'
+    r'|(?P<image>\[\[\.?/?(?:images/)?(?P<image_name>[\w-]+\.png)\]\])'
+    # \[...\] and \(...\)
+    r'|(?P<display>\\\[(?P<display_text>.+?)\\\])'
+    r'|(?P<inline>\\\((?P<inline_text>.+?)\\\))'
+    # $...$ using org's rules, so "$25 and $30" stays currency
+    r'|(?P<dollar>\$(?<![\w$]\$)(?P<dollar_text>[^\s$](?:[^$\n]*?[^\s$])?)\$(?![\w$]))'
+    r'|(?P<emphasis>\*(?P<emphasis_text>[^*\n]+)\*)'
+    # Unpaired \( \) and pandoc-escaped \* \+ are literal characters
+    r'|(?P<escaped>\\(?P<escaped_char>[()*+]))'
+    r')'
+)
+
+# Only emphasis is recognised inside math fragments
+MATH_EMPHASIS_RE = re.compile(r'\*([^*\n]+)\*')
+
+CHOICES = frozenset('ABCD')
+
+MATH_GROUPS = frozenset(('inline', 'display', 'dollar'))
+
+
+DIALECTS = {
+    'html': {
+        'escape': None,
+        'newline': '<br>',
+        'emphasis': '<em>{}</em>',
+        'bold': '<strong>{}</strong>',
+        'math_emphasis': r'<em>\1</em>',
+        'strong': '<strong>{}:</strong> ',
+        'answer': '<strong>The answer is ({}).</strong>',
+        'choice': '${}$',
+        'inline': '${}$',
+        'display': '$${}$$',
+        'image': '<img src="{}">',
+    },
+    'xml': {
+        'escape': saxutils.escape,
+        'newline': '<br></br>',
+        'emphasis': '<b>{}</b>',
+        'bold': '<b>{}</b>',
+        'math_emphasis': r'<b>\1</b>',
+        'strong': '<b>{}:</b> ',
+        'answer': '<b>The answer is ({}).</b>',
+        'choice': '<b>{}</b>',
+        'inline': '<tex>{}</tex>',
+        'display': '<tex>{}</tex>',
+        'image': '<img id="{}" />',
+    },
+}
+
+
+def _render_math(body, style, display):
+    """Render a math fragment, keeping emphasis inside it."""
+    if body in CHOICES:
+        return style['choice'].format(body)
+    if '*' in body:
+        body = MATH_EMPHASIS_RE.sub(style['math_emphasis'], body)
+    template = style['display'] if display else style['inline']
+    return template.format(body)
+
+
+def _make_replacer(style, math_images=None):
+    """Build the per-token callback for one dialect.
+
+    Emphasis and bold text is tokenized again with the same callback, so
+    math, escapes and images inside ``*...*`` and ``***...***`` are
+    rendered too. ``math_images``
+    maps math fragment source to a pre-rendered image to show instead.
+    """
+    emphasis = style['emphasis'].format
+    bold = style['bold'].format
+    strong = style['strong'].format
+    answer = style['answer'].format
+    image = style['image'].format
+
+    handlers = {
+        'emphasis': lambda m: emphasis(TOKEN_RE.sub(replace, m.group('emphasis_text'))),
+        'bold': lambda m: bold(TOKEN_RE.sub(replace, m.group('bold_text'))),
+        'image': lambda m: image(m.group('image_name')),
+        'inline': lambda m: _render_math(m.group('inline_text'), style, False),
+        'dollar': lambda m: _render_math(m.group('dollar_text'), style, False),
+        'display': lambda m: _render_math(m.group('display_text'), style, True),
+        'escaped': lambda m: m.group('escaped_char'),
+        'strong': lambda m: strong(m.group('strong_text')),
+        'answer': lambda m: answer(m.group('choice')),
+    }
+
+    def replace(match):
+        if math_images and match.lastgroup in MATH_GROUPS:
+            name = math_images.get(match.group(0))
+            if name is not None:
+                return image(name)
+        return handlers[match.lastgroup](match)
+
+    return replace
+
+
+_REPLACERS = {name: _make_replacer(style) for name, style in DIALECTS.items()}
+
+
+def render_markup(text, dialect='html', math_images=None):
+    """Transform one card field into the given dialect in a single pass.
+
+    ``math_images`` optionally maps math fragment source (with delimiters,
+    as find_math returns it) to an image filename to show instead.
+    """
+    style = DIALECTS[dialect]
+    replace = _REPLACERS[dialect]
+    if style['escape'] is not None:
+        # None of &, < or > take part in org markup, so escaping up front
+        # cannot change how the field tokenizes
+        if math_images:
+            math_images = {style['escape'](k): v for k, v in math_images.items()}
+        text = style['escape'](text)
+    if math_images:
+        replace = _make_replacer(style, math_images)
+    text = TOKEN_RE.sub(replace, text)
+    return text.replace('\n', style['newline'])
+
+
+def find_math(text):
+    """Return math fragments (with delimiters) in order, skipping (A)-(D) choices.
+
+    Fragments inside ``*...*`` emphasis and ``***...***`` bold are
+    included, as render_markup renders them too.
+    """
+    fragments = []
+    for match in TOKEN_RE.finditer(text):
+        group = match.lastgroup
+        if group == 'emphasis' or group == 'bold':
+            fragments.extend(find_math(match.group(group + '_text')))
+        elif group in MATH_GROUPS and match.group(group + '_text') not in CHOICES:
+            fragments.append(match.group(0))
+    return fragments
+
+
+def find_images(text):
+    """Return image filenames referenced by org links, in order of appearance."""
+    return IMAGE_RE.findall(text)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Streaming Org-drill Parser
+
+Line-oriented, single-pass tokenizer for org-drill files shared by the
+CSV and XML converters. Every line is looked at exactly once, so parsing
+runs in time linear in the size of the file, and cards are yielded as
+soon as the next sibling headline (or EOF) closes them.
+
+Understood structure:
+    - headlines (``*** TODO 12    :drill:``) with level, TODO keyword and tags
+    - planning lines (SCHEDULED/DEADLINE/CLOSED) directly under a headline
+    - drawers (``:PROPERTIES:`` ... ``:END:``) directly under a headline
+    - the ``****`` answer separator (any child headline of the card)
+    - ``# comment`` lines, which are dropped
+
+Usage:
+    from org_parser import iter_drill_cards
+    with open('exam_drill.org', encoding='utf-8') as f:
+        for card in iter_drill_cards(f):
+            print(card['title'], card['line'])
+"""
+
+import re
+
+TODO_KEYWORDS = ('TODO', 'DONE')
+
+# A headline is one or more stars followed by whitespace (or end of line);
+# "**step 1:" or "***The answer" in card bodies are emphasis, not headlines
+HEADLINE_RE = re.compile(r'^(\*+)(?:[ \t]+(.*?))?[ \t]*$')
+TAGS_RE = re.compile(r'(?:^|[ \t]+)(:[\w@#%:]+:)$')
+PLANNING_RE = re.compile(r'^\s*(SCHEDULED|DEADLINE|CLOSED):\s*(.*?)\s*$')
+DRAWER_START_RE = re.compile(r'^\s*:([\w-]+):\s*$')
+DRAWER_END_RE = re.compile(r'^\s*:END:\s*$', re.IGNORECASE)
+PROPERTY_RE = re.compile(r'^\s*:([\w-]+\+?):(?:[ \t]+(.*?))?\s*$')
+COMMENT_RE = re.compile(r'^\s*#(?:\s|$)')
+
+
+def parse_headline(line):
+    """Split a headline into (level, todo, title, tags), or return None."""
+    match = HEADLINE_RE.match(line)
+    if not match:
+        return None
+
+    level = len(match.group(1))
+    text = match.group(2) or ''
+
+    # Trailing :tag1:tag2: block
+    tags = []
+    tag_match = TAGS_RE.search(text)
+    if tag_match:
+        tags = [t for t in tag_match.group(1).split(':') if t]
+        text = text[:tag_match.start()]
+
+    # Leading TODO keyword
+    todo = None
+    keyword, _, rest = text.partition(' ')
+    if keyword in TODO_KEYWORDS:
+        todo = keyword
+        text = rest
+
+    return level, todo, text.strip(), tags
+
+
+def _new_section(line_no, level, todo, title, tags):
+    """Create the mutable state for one headline section."""
+    return {
+        'line': line_no,
+        'level': level,
+        'todo': todo,
+        'title': title,
+        'tags': tags,
+        'properties': {},
+        'planning': {},
+        'body': [],
+    }
+
+
+def _finish_card(card, children):
+    """Assemble question/answer text from a card section and its children."""
+    question = '\n'.join(card['body']).strip()
+    answers = ['\n'.join(child['body']).strip() for child in children]
+
+    # Two-sided cards keep the question in a "Front" child instead of the body
+    if not question and len(answers) > 1:
+        question, answers = answers[0], answers[1:]
+
+    return {
+        'line': card['line'],
+        'level': card['level'],
+        'todo': card['todo'],
+        'title': card['title'],
+        'tags': card['tags'],
+        'properties': card['properties'],
+        'planning': card['planning'],
+        'question': question,
+        'answer': '\n\n'.join(a for a in answers if a),
+    }
+
+
+def scan_lines(lines, drill_tag='drill', first_line=1):
+    """Classify every line of an org-drill file; yield (line_no, line, kind, value).
+
+    This is the one headline/drawer state machine behind iter_drill_cards,
+    split_shards and section_headings, so they always agree on where
+    cards start and end. ``kind`` is one of:
+
+        card      a headline tagged ``drill_tag``; closes any open card
+        heading   any other headline outside a card; closes any open card
+        answer    a direct child headline of the open card
+        planning  a SCHEDULED/DEADLINE/CLOSED line; value (keyword, timestamp)
+        property  a line of a :PROPERTIES: drawer; value (NAME, text)
+        text      a body line of the card or answer (deeper headlines too)
+        skip      anything else: drawer lines, comments, lines outside cards
+
+    Headlines carry their parse_headline tuple as ``value``. Drawers are
+    only recognised directly below a card or answer headline, and an
+    unterminated one ends at the next headline.
+    """
+    card_level = None   # level of the open card
+    child_level = None  # level of its first answer section
+    in_section = False  # lines belong to a card or answer section
+    in_drawer = None    # name of the drawer being skipped, if any
+    preamble = False    # still directly below a headline
+
+    for line_no, raw_line in enumerate(lines, first_line):
+        line = raw_line.rstrip('\r\n')
+
+        if line.startswith('*'):
+            headline = parse_headline(line)
+        else:
+            headline = None
+
+        if in_drawer is not None:
+            if headline is None:
+                if DRAWER_END_RE.match(line):
+                    in_drawer = None
+                elif in_drawer == 'PROPERTIES':
+                    prop = PROPERTY_RE.match(line)
+                    if prop:
+                        yield line_no, line, 'property', (prop.group(1).upper(), prop.group(2) or '')
+                        continue
+                yield line_no, line, 'skip', None
+                continue
+            in_drawer = None
+
+        if headline is not None:
+            level = headline[0]
+            if card_level is not None and level <= card_level:
+                card_level = None
+
+            if card_level is not None:
+                if child_level is not None and level > child_level:
+                    # Deeper headlines inside an answer are kept as text
+                    yield line_no, line, 'text', None
+                    continue
+                child_level = child_level or level
+                kind = 'answer'
+            elif drill_tag in headline[3]:
+                card_level, child_level = level, None
+                kind = 'card'
+            else:
+                kind = 'heading'
+
+            in_section = kind != 'heading'
+            preamble = True
+            yield line_no, line, kind, headline
+            continue
+
+        if not in_section or COMMENT_RE.match(line):
+            yield line_no, line, 'skip', None
+            continue
+
+        if preamble:
+            planning = PLANNING_RE.match(line)
+            if planning:
+                yield line_no, line, 'planning', (planning.group(1), planning.group(2))
+                continue
+            drawer = DRAWER_START_RE.match(line)
+            if drawer:
+                in_drawer = drawer.group(1).upper()
+                yield line_no, line, 'skip', None
+                continue
+            if line.strip():
+                preamble = False
+
+        yield line_no, line, 'text', None
+
+
+def iter_drill_cards(lines, drill_tag='drill', first_line=1):
+    """Yield one dict per headline tagged with ``drill_tag``, in source order.
+
+    ``lines`` may be any iterable of text lines (an open file, a list, or the
+    result of ``str.splitlines``). Each yielded card carries the headline
+    line number, level, TODO keyword, title, tags, property drawer and
+    planning lines, plus the raw question and answer text. ``first_line``
+    is the line number of the first line, for parsing a shard of a file.
+    """
+    card = None        # section of the card currently being collected
+    children = []      # direct child sections (answer separators)
+    section = None     # section currently receiving body lines
+
+    for line_no, line, kind, value in scan_lines(lines, drill_tag, first_line):
+        if kind == 'text':
+            section['body'].append(line)
+        elif kind == 'property':
+            section['properties'][value[0]] = value[1]
+        elif kind == 'planning':
+            section['planning'][value[0]] = value[1]
+        elif kind == 'answer':
+            section = _new_section(line_no, *value)
+            children.append(section)
+        elif kind != 'skip':
+            if card is not None:
+                yield _finish_card(card, children)
+                card, children = None, []
+            if kind == 'card':
+                card = section = _new_section(line_no, *value)
+
+    if card is not None:
+        yield _finish_card(card, children)
+
+
+def card_number(card, index):
+    """Return the identifier used for numbering/tagging a parsed card.
+
+    Exam cards are titled with their problem number; other cards fall back to
+    their :ID: property and finally to their position in the file.
+    """
+    if card['title'].isdigit():
+        return card['title']
+    return card['properties'].get('ID') or str(index)
+
+
+def split_shards(lines, shard_count, drill_tag='drill'):
+    """Split a file's lines into up to ``shard_count`` independently parsable shards.
+
+    Shards are cut only at headlines where the parser holds no state: no
+    card is open, or the headline closes the open card (same or higher
+    level). Cuts are placed at the first such headline after each even
+    share of the lines, so top-level ``** Exam N`` headings and card
+    headlines both qualify but answer sections never do.
+
+    Returns a list of (first_line, card_offset, lines) where
+    ``card_offset`` is the number of cards iter_drill_cards yields before
+    the shard, so ``card_number`` indexes match a serial parse.
+    """
+    lines = list(lines)
+    target = max(1, -(-len(lines) // max(1, shard_count)))
+
+    shards = []
+    start = 0
+    start_offset = 0
+    cards_seen = 0
+
+    for line_no, _, kind, _ in scan_lines(lines, drill_tag):
+        if kind != 'card' and kind != 'heading':
+            continue  # answer sections and everything inside the open card
+
+        # Parser state resets here, so this is a safe place to cut
+        i = line_no - 1
+        if i - start >= target and len(shards) < shard_count - 1:
+            shards.append((start + 1, start_offset, lines[start:i]))
+            start, start_offset = i, cards_seen
+
+        if kind == 'card':
+            cards_seen += 1
+
+    shards.append((start + 1, start_offset, lines[start:]))
+    return shards
+
+
+def section_headings(lines, drill_tag='drill'):
+    """Return (line_no, level, title) for every headline outside the drill cards.
+
+    These are the headings cards are filed under (``** Exam 1``); answer
+    sections and deeper headlines inside a card are skipped the way
+    iter_drill_cards skips them. Line numbers are 1-based, like a card's.
+    """
+    return [(line_no, value[0], value[2]) for line_no, _, kind, value in scan_lines(lines, drill_tag)
+            if kind == 'heading']
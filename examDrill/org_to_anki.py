@@ -10,119 +10,121 @@ Key improvements:
 5. Comprehensive validation of converted content
 """
 
-import re
+import argparse
+import logging
 import os
 import sys
 import csv
 # Removed unused import: shutil
 from html import escape  # Kept for potential future use
 
-def extract_drill_cards(org_content):
-    """Extract cards with precise format validation."""
-    # Modified pattern to match the specific org-mode format provided
-    # Improved pattern to handle various property block formats
-    # org_content = re.sub(r'```.*?```', '', org_content, flags=re.DOTALL)
-    org_content = re.sub(
-        r'(\*\*\* \d+\s*:drill:)[\s\S]*?:END:\s*\n',
-        r'\1\n',
-        org_content
-    )
-    # card_pattern = (
-    #     r'\*\*\* (\d+)\s*:drill:'                       # card header
-    #     r'(?:\s*:PROPERTIES:.*?:END:)?\n'              # optional properties block, then newline
-    #     r'(.*?)\n\*{4}\s*'                             # question up to "****"
-    #     r'(.*?)(?=(?:\*\*\* \d+\s*:drill:|\Z))'        # answer until next "*** N :drill:" or EOF
-    # )
-    card_pattern = (
-        r'\*\*\* (\d+)\s*:drill:\s*'       # header
-        r'(.*?)\n\*{4}\s*'                # question up to "****"
-        r'(.*?)(?=(?:\*\*\* \d+\s*:drill:|\Z))'
-    )
+from blob_store import default_store_dir
+from build_manifest import (
+    cached_card, code_fingerprint, diff_cards, inputs_digest, load_manifest, mark_output,
+    new_manifest, note_guid, output_is_current, print_change_summary, record_card, save_manifest, source_hash,
+)
+from hash_cache import default_cache_path, file_sha256, load_hash_cache, save_hash_cache
+from markup import render_markup, find_images
+from org_parser import iter_drill_cards, card_number
+from profiling import add_arguments, new_profile, setup_logging, stage, write_report
+
+logger = logging.getLogger(__name__)
+
+# Every module whose code shapes a card or an output of this converter
+FINGERPRINT_MODULES = ('markup', 'org_parser', 'build_manifest', 'blob_store', __name__)
 
+def extract_drill_cards(org_content, previous=None, profile=None):
+    """Extract cards with precise format validation."""
+    # Single streaming pass over the file; see org_parser for the grammar.
+    # Profiled runs parse everything first so the two stages time apart
+    parsed_cards = enumerate(iter_drill_cards(org_content.splitlines()))
+    if profile is not None:
+        with stage(profile, 'parse'):
+            parsed_cards = list(parsed_cards)
+    with stage(profile, 'transform'):
+        return _process_cards(parsed_cards, previous)
+
+def _process_cards(parsed_cards, previous):
     cards = []
 
-    for match in re.finditer(card_pattern, org_content, re.DOTALL):
-        card_num, question, answer = match.groups()
+    for index, parsed in parsed_cards:
+        card_num = card_number(parsed, index)
+        org_id = parsed['properties'].get('ID')
+        src_hash = source_hash(parsed, card_num)
+
+        # Unchanged since the last build: reuse the processed card
+        if previous is not None:
+            cached = cached_card(previous, org_id or f'number:{card_num}', src_hash)
+            if cached is not None:
+                cards.append(cached)
+                continue
 
         # Clean up question and answer for consistent processing
-        cleaned_question = question.strip()
-        cleaned_answer = answer.strip()
+        cleaned_question = parsed['question']
+        cleaned_answer = parsed['answer']
 
         # Process the content
         cards.append({
-            'id': card_num.strip(),
+            'id': card_num,
+            'org_id': org_id,
+            'guid': note_guid(org_id, cleaned_question),
+            'source_hash': src_hash,
             'front': process_content(cleaned_question),
             'back': process_content(cleaned_answer),
-            'tags': f"ME_Exam,Problem_{card_num.strip()}",
+            'tags': f"ME_Exam,Problem_{card_num}",
             'media': extract_media(cleaned_question + cleaned_answer)
         })
 
         # Debugging verification
-        print(f"Processed card #{card_num.strip()}")
+        logger.debug("Processed card #%s", card_num)
 
     return cards
 
 def process_content(text):
     """Convert content to Anki-compatible HTML with proper escaping."""
-    # Fix LaTeX formatting for Anki compatibility
-    # Anki uses $...$ for inline LaTeX and $$...$$ for display mode
-
-    # inline math: \(...\) → $...$
-    text = re.sub(r'\\\((.+?)\\\)', r'$\1$', text)
-
-    # display math: \[...\] → $$...$$
-    text = re.sub(r'\\\[(.+?)\\\]', r'$$\1$$', text)
-
-    # Process \(X\) format (standard LaTeX delimiters) to $X$
-    text = re.sub(r'\\(\((.+?)\))', r'$\2$', text)
-
-    # Further cleanup - remove any remaining LaTeX markers
-    text = re.sub(r'\\\(([A-D])\\\)', r'($\1$)', text)
-
-    # Cleanup backup - remove any remaining backslashes before parentheses
-    text = re.sub(r'\\([\(\)])', r'\1', text)
-
-    # Convert image references to Anki format
-    text = re.sub(r'\[\[\.\/images\/(\d+\.png)\]\]', r'<img src="\1">', text)
-
-    # Process formatting (italics, etc.) - handle multi-word spans correctly
-    text = re.sub(r'\*([^*]+)\*', r'<em>\1</em>', text)
-
-    # Identify and mark step headings with bold formatting
-    text = re.sub(r'\*\*([^*]+):\s*\*\*', r'<strong>\1:</strong> ', text)
-
-    # Fix answer indicator formatting
-    text = re.sub(r'\*\*\*The answer is \\?\(([A-D])\)\\?\.\*\*\*', r'<strong>The answer is (\1).</strong>', text)
-
-    # Process line breaks for proper HTML rendering
-    text = text.replace('\n', '<br>')
-
-    return text
+    # Math becomes $...$ / $$...$$, emphasis <em>, step headings and the
+    # answer line <strong>, image links <img>, newlines <br> -- all in one
+    # pass over the field (see markup.py)
+    return render_markup(text, 'html')
 
 def extract_media(text):
     """Identify media files with validation checking."""
-    return list(set(re.findall(r'\[\[\.\/images\/(\d+\.png)\]\]', text)))
+    return list(set(find_images(text)))
 
-def create_anki_csv(cards, output_dir):
+def create_anki_csv(cards, output_dir, filename='anki_import.csv'):
     """Create strictly compliant CSV file according to Anki specifications."""
-    csv_path = os.path.join(output_dir, 'anki_import.csv')
+    csv_path = os.path.join(output_dir, filename)
 
     with open(csv_path, 'w', encoding='utf-8', newline='') as f:
         # Using proper CSV quoting to handle fields with commas, quotes, or newlines
         writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
 
-        # Header row as specified in documentation
-        writer.writerow(['Front', 'Back', 'Tags'])
+        # Review state columns only when the cards were scheduled
+        scheduled = any('schedule' in card for card in cards)
+
+        # Anki's file headers (2.1.55+) instead of a header row: with a GUID
+        # column a re-import updates the matching notes in place
+        columns = ['GUID', 'Front', 'Back', 'Tags']
+        if scheduled:
+            columns += ['Due', 'Interval', 'Ease', 'NextInterval']
+        f.write('#separator:Comma\n#html:true\n')
+        f.write(f"#columns:{','.join(columns)}\n#guid column:1\n#tags column:4\n")
 
         for card in cards:
-            writer.writerow([
+            row = [
+                card['guid'],
                 card['front'],
                 card['back'],
                 card['tags']
-            ])
-
-    print(f"CSV file created: {csv_path}")
-    print(f"Total cards: {len(cards)}")
+            ]
+            if scheduled:
+                schedule = card.get('schedule', {})
+                row += [schedule.get('due', ''), schedule.get('interval', ''),
+                        schedule.get('ease', ''), schedule.get('next_interval', '')]
+            writer.writerow(row)
+
+    logger.info("CSV file created: %s", csv_path)
+    logger.info("Total cards: %s", len(cards))
     return csv_path
 
 def generate_media_report(cards, output_dir):
@@ -147,7 +149,7 @@ def generate_media_report(cards, output_dir):
         f.write("\nIMPORTANT: Do not create subdirectories in the collection.media folder.\n")
         f.write("Simply copy all files directly into that directory.\n")
 
-    print(f"Media report created: {media_report_path}")
+    logger.info("Media report created: %s", media_report_path)
     return media_report_path
 
 def generate_import_guide(output_dir):
@@ -163,20 +165,24 @@ def generate_import_guide(output_dir):
         f.write("2. In Anki, select 'Import File' from the File menu\n\n")
         f.write("3. Select the 'anki_import.csv' file\n\n")
         f.write("4. In the import dialog, ensure:\n")
-        f.write("   - 'Fields separated by: Comma' is selected\n")
-        f.write("   - 'Allow HTML in fields' is CHECKED\n")
-        f.write("   - Field mapping is correctly set (Front → Front, Back → Back, Tags → Tags)\n")
+        f.write("   - The separator (Comma), HTML and the GUID and Tags columns are read from the\n")
+        f.write("     file's header lines (Anki 2.1.55 or later)\n")
+        f.write("   - Field mapping is correctly set (Front → Front, Back → Back)\n")
+        f.write("   - 'Existing notes' is set to 'Update'\n")
         f.write("   - Choose your target deck\n\n")
-        f.write("5. Click 'Import' to complete the process\n")
+        f.write("5. Click 'Import' to complete the process\n\n")
+        f.write("Re-importing after editing the org file updates the existing notes (matched by GUID)\n")
+        f.write("and keeps their review history. If 'anki_update.csv' is present it holds only the\n")
+        f.write("cards added or changed since the previous export; import it the same way.\n")
 
-    print(f"Import guide created: {guide_path}")
+    logger.info("Import guide created: %s", guide_path)
     return guide_path
 
 def validate_cards(cards):
     """Perform validation checks on processed cards."""
-    print("\nValidation Report:")
-    print("=================")
-    print(f"Total cards found: {len(cards)}")
+    logger.info("Validation Report:")
+    logger.info("=================")
+    logger.info("Total cards found: %s", len(cards))
 
     # Check for potential issues
     latex_issues = 0
@@ -186,7 +192,7 @@ def validate_cards(cards):
         # Check for potentially problematic LaTeX
         if r'\(' in card['front'] or r'\)' in card['front'] or r'\(' in card['back'] or r'\)' in card['back']:
             latex_issues += 1
-            print(f"Warning: Card {card['id']} may have unprocessed LaTeX expressions")
+            logger.warning("Card %s may have unprocessed LaTeX expressions", card['id'])
 
         # Count media references
         media_count = len(card['media'])
@@ -194,51 +200,103 @@ def validate_cards(cards):
 
         # Verify if front/back content isn't too short (possible parsing issues)
         if len(card['front']) < 10:
-            print(f"Warning: Card {card['id']} has a very short front side, check for parsing issues")
+            logger.warning("Card %s has a very short front side, check for parsing issues", card['id'])
 
-    print(f"Media references found: {media_refs}")
+    logger.info("Media references found: %s", media_refs)
     if latex_issues > 0:
-        print(f"Warning: {latex_issues} cards may have LaTeX formatting issues")
-    print("Validation complete.\n")
+        logger.warning("%s cards may have LaTeX formatting issues", latex_issues)
+    logger.info("Validation complete.")
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python anki_converter.py input.org output_dir")
-        sys.exit(1)
+def write_sample_cards(cards, output_dir):
+    """Export the first few cards for review before importing."""
+    sample_path = os.path.join(output_dir, 'sample_cards.txt')
+    with open(sample_path, 'w', encoding='utf-8') as f:
+        for card in cards[:3]:  # First three cards, removed unused variable 'i'
+            f.write(f"==== CARD {card['id']} ====\n")
+            f.write(f"FRONT:\n{card['front']}\n\n")
+            f.write(f"BACK:\n{card['back']}\n\n")
+            f.write("="*40 + "\n\n")
+    return sample_path
+
+def media_hashes(media, source_image_dir, cache):
+    """Content hashes of a card's media, or the bare name when the file is missing."""
+    hashes = []
+    for filename in media:
+        path = os.path.join(source_image_dir, filename)
+        hashes.append(file_sha256(path, cache) if os.path.exists(path) else filename)
+    return hashes
 
-    input_file, output_dir = sys.argv[1], sys.argv[2]
+def main():
+    parser = argparse.ArgumentParser(description="Convert an org-drill file to an Anki CSV import.")
+    parser.add_argument('input_file', help="org-drill file")
+    parser.add_argument('output_dir', help="directory for the generated files")
+    add_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(-1 if args.quiet else args.verbose)
+
+    input_file, output_dir = args.input_file, args.output_dir
     os.makedirs(output_dir, exist_ok=True)
+    profile = new_profile(output_dir, args.profile_stage) if args.profile else None
 
-    with open(input_file, 'r', encoding='utf-8') as f:
-        org_content = f.read()
+    with stage(profile, 'read'):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            org_content = f.read()
 
-    print("Extracting and processing cards...")
-    cards = extract_drill_cards(org_content)
+        # Previous build, if any, lets unchanged cards and outputs be skipped
+        fingerprint = code_fingerprint(*FINGERPRINT_MODULES)
+        previous = load_manifest(output_dir, 'csv', fingerprint)
+        manifest = new_manifest(fingerprint)
+
+    logger.info("Extracting and processing cards...")
+    cards = extract_drill_cards(org_content, previous, profile)
 
     if not cards:
-        print("ERROR: No cards found in the input file. Check the format.")
+        logger.error("No cards found in the input file. Check the format.")
         sys.exit(1)
 
-    # Validate the processed cards
-    validate_cards(cards)
+    with stage(profile, 'blobs'):
+        source_image_dir = os.path.join(os.path.dirname(input_file), 'images')
+        cache_path = default_cache_path(default_store_dir())
+        hash_cache = load_hash_cache(cache_path)
+        for card in cards:
+            record_card(manifest, card, media_hashes(card['media'], source_image_dir, hash_cache))
+        save_hash_cache(hash_cache, cache_path)
 
-    # Export sample cards for review
-    sample_path = os.path.join(output_dir, 'sample_cards.txt')
-    with open(sample_path, 'w', encoding='utf-8') as f:
-        for card in cards[:3]:  # First three cards, removed unused variable 'i'
-            f.write(f"==== CARD {card['id']} ====\n")
-            f.write(f"FRONT:\n{card['front']}\n\n")
-            f.write(f"BACK:\n{card['back']}\n\n")
-            f.write("="*40 + "\n\n")
+    added, changed, removed = diff_cards(previous, manifest)
+    print_change_summary(previous, manifest, added, changed, removed)
 
-    create_anki_csv(cards, output_dir)
-    generate_media_report(cards, output_dir)
-    generate_import_guide(output_dir)
+    # Validate the processed cards
+    with stage(profile, 'validate'):
+        validate_cards(cards)
+
+    # Each output is rewritten only when the inputs it depends on changed
+    with stage(profile, 'csv'):
+        deck_digest = inputs_digest([[card['front'], card['back'], card['tags']] for card in cards])
+        outputs = [
+            ('sample_cards.txt', inputs_digest([[c['id'], c['front'], c['back']] for c in cards[:3]]),
+             lambda: write_sample_cards(cards, output_dir)),
+            ('anki_import.csv', deck_digest, lambda: create_anki_csv(cards, output_dir)),
+            ('media_files_needed.txt', inputs_digest(sorted({m for c in cards for m in c['media']})),
+             lambda: generate_media_report(cards, output_dir)),
+            ('import_instructions.txt', inputs_digest('static'), lambda: generate_import_guide(output_dir)),
+        ]
+        for name, digest, write in outputs:
+            if output_is_current(previous, name, digest, [os.path.join(output_dir, name)]):
+                logger.info("Unchanged, skipped: %s", name)
+            else:
+                write()
+            mark_output(manifest, name, digest)
+
+        save_manifest(manifest, output_dir, 'csv')
+    sample_path = os.path.join(output_dir, 'sample_cards.txt')
 
-    print("\nConversion completed successfully!")
-    print(f"Output files are in: {output_dir}")
-    print(f"Sample cards saved to: {sample_path} - please review before importing")
-    print("Follow the instructions in 'import_instructions.txt' to complete the import process.")
+    logger.info("Conversion completed successfully!")
+    logger.info("Output files are in: %s", output_dir)
+    logger.info("Sample cards saved to: %s - please review before importing", sample_path)
+    logger.info("Follow the instructions in 'import_instructions.txt' to complete the import process.")
+    if profile is not None:
+        json_path, text_path = write_report(profile)
+        logger.info("Profile report: %s (%s)", text_path, json_path)
 
 if __name__ == "__main__":
     main()
@@ -6,7 +6,12 @@ This script converts Org-drill formatted flashcards to AnkiApp-compatible XML fo
 with precise implementation of AnkiApp's required schema structure and LaTeX handling.
 
 Usage:
-    python org_to_anki_xml.py input.org output_directory
+    python org_to_anki_xml.py [--no-stream] [--split SPEC] input.org output_directory
+
+By default the ZIP is streamed in a single pass (deflated XML, stored PNG
+blobs, no intermediate files); --no-stream also writes anki_import.xml and
+blobs/ to the output directory. --split heading,bytes=25M writes the deck
+as several smaller packages instead (see deck_shards.py).
 
 Requirements:
     - Python 3.6+
@@ -25,37 +30,66 @@ import sys
 # import zipfile
 import xml.sax.saxutils as saxutils
 from pathlib import Path
-import os, re, shutil, zipfile
-from hashlib import sha256
-
-def extract_drill_cards(org_content):
+import argparse, io, logging, os, re, shutil, zipfile
+from xml.parsers import expat
+from concurrent.futures import ThreadPoolExecutor
+
+import blob_store
+import deck_lint
+import deck_shards
+import html_preview
+from build_manifest import (
+    cached_card, code_fingerprint, diff_cards, inputs_digest, load_manifest, mark_output,
+    new_manifest, output_is_current, print_change_summary, record_card, save_manifest, source_hash,
+)
+from hash_cache import file_sha256, default_cache_path, load_hash_cache, save_hash_cache
+from markup import render_markup, find_images
+from org_parser import iter_drill_cards, card_number
+from profiling import add_arguments, new_profile, setup_logging, stage, write_report
+
+logger = logging.getLogger(__name__)
+
+# Image tags as rendered by markup.py before their blob hashes are known
+IMG_ID_RE = re.compile(r'<img id="([\w-]+)\.(?:png|svg)" />')
+
+# Copy buffer for moving blobs from the store into the ZIP
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Every module whose code shapes a card or an output of this converter
+FINGERPRINT_MODULES = ('markup', 'org_parser', 'build_manifest', 'blob_store', 'html_preview', 'handbook_index',
+                       'deck_shards', 'deck_lint', __name__)
+
+def extract_drill_cards(org_content, previous=None, profile=None):
     """Extract individual drill cards from org file with engineering precision."""
-    # Pattern to capture the structure of engineering exam questions
-    drill_pattern = r'(?:\*+\s+(?:TODO\s+)?(\d+).*?:drill:.*?(?=\*+\s+(?:TODO\s+)?\d+.*?:drill:|$))'
-
-    # Process each card
+    # Single streaming pass over the file; see org_parser for the grammar.
+    # Profiled runs parse everything first so the two stages time apart
+    parsed_cards = enumerate(iter_drill_cards(org_content.splitlines()))
+    if profile is not None:
+        with stage(profile, 'parse'):
+            parsed_cards = list(parsed_cards)
+    with stage(profile, 'transform'):
+        return _process_cards(parsed_cards, previous)
+
+def _process_cards(parsed_cards, previous):
     processed_cards = []
-    for card_match in re.finditer(drill_pattern, org_content, re.DOTALL):
-        card_text = card_match.group(0)
+    for index, parsed in parsed_cards:
+        card_num = card_number(parsed, index)
+        org_id = parsed['properties'].get('ID')
+        src_hash = source_hash(parsed, card_num)
 
-        # Extract card number with robust error handling
-        card_num_match = re.search(r'\*+\s+(?:TODO\s+)?(\d+)', card_text)
-        card_num = card_num_match.group(1) if card_num_match else "unknown"
-
-        # Split into question and answer
-        parts = card_text.split('****', 1)
-        if len(parts) < 2:
+        # Cards without a "****" answer section cannot be drilled
+        if not parsed['answer']:
             continue
 
-        question = parts[0]
-        answer = parts[1]
-
-        # Extract question content - remove headers and properties
-        question = re.sub(r'\*+\s+(?:TODO\s+)?\d+.*?:drill:.*?:END:', '', question, flags=re.DOTALL)
-        question = question.strip()
+        # Unchanged since the last build: reuse the processed card
+        if previous is not None:
+            cached = cached_card(previous, org_id or f'number:{card_num}', src_hash)
+            if cached is not None:
+                processed_cards.append(cached)
+                continue
 
-        # Clean up answer
-        answer = answer.strip()
+        question = parsed['question']
+        answer = parsed['answer']
 
         # Extract image references - using a more comprehensive pattern
         front_images = extract_images(question)
@@ -72,6 +106,9 @@ def extract_drill_cards(org_content):
         # Format the card data for XML export
         card_data = {
             'id': card_num,
+            'org_id': org_id,
+            'source_hash': src_hash,
+            'line': parsed['line'],
             'front': question,
             'back': answer,
             'tags': f"ME_Exam,Problem_{card_num}",
@@ -89,90 +126,87 @@ def extract_drill_cards(org_content):
 
 def extract_images(text):
     """Extract image references from text with improved pattern matching."""
-    # More flexible pattern to catch various image reference formats
-    # image_pattern = r'\[\[\.?\/?(images\/)?(\d+)\.png\]\]'
-    image_pattern = r'\[\[\.?\/?(images\/)?([\w-]+)\.png\]\]'
-    return [match.group(2) + '.png' for match in re.finditer(image_pattern, text)]
+    return find_images(text)
 
 def process_latex_for_xml(text):
     """Convert Org-mode LaTeX to AnkiApp XML-compatible format."""
-    # First escape XML special characters properly
-    text = saxutils.escape(text)
-
-    # Handle multiple choice options formatting with proper XML structure
-    # Convert (A), (B), etc. in LaTeX to proper formatting
-    text = re.sub(r'\\[(]([A-D])\\[)]', r'<b>\1</b>', text)
-
-    # Convert $A$, $B$, etc. to proper formatting
-    text = re.sub(r'\$([A-D])\$', r'<b>\1</b>', text)
-
-    # Convert inline LaTeX: \(...\) to proper XML LaTeX format
-    text = re.sub(r'\\[(](.*?)\\[)]', r'<tex>\1</tex>', text)
-
-    # Convert $...$ to proper XML LaTeX format
-    text = re.sub(r'\$(.*?)\$', r'<tex>\1</tex>', text)
+    # XML-escapes the field, then rewrites math to <tex>, (A)-(D) choices and
+    # emphasis to <b>, newlines to <br></br> and image links to <img id>
+    # in a single pass (see markup.py)
+    return render_markup(text, 'xml')
 
-    # Handle emphasized variables with proper XML formatting
-    text = re.sub(r'\*([a-zA-Z0-9]+)\*', r'<b>\1</b>', text)
-
-    # Preserve newlines as <br/> tags (self-closing XML tags) for proper display
-    text = text.replace('\n\n', '<br></br><br></br>')
-    text = text.replace('\n', '<br></br>')
-
-    # Handle image references for XML format - preserve image filenames
-    text = re.sub(r'\[\[\.?\/?(images\/)?(\d+)\.png\]\]', r'<img id="\2.png" />', text)
-
-    return text
-
-def calculate_sha256(path):
+def calculate_sha256(path, cache=None):
     """Calculate SHA256 hash in base16 (hexadecimal) format as required by AnkiApp."""
-    h = sha256()
-    with open(path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            h.update(chunk)
-    return h.hexdigest()  # Ensure we return the hexadecimal representation
+    # 1 MiB reads, skipped entirely when the hash cache knows the file
+    return file_sha256(path, cache)
+
+def image_worker_count():
+    """Bounded thread count for hashing and linking images."""
+    return min(8, (os.cpu_count() or 1) * 2)
+
+def resolve_image_ids(text, image_reference_map):
+    """Point <img id="NAME.png" /> tags at blob hashes in one pass over the field."""
+    def replace(match):
+        reference_info = image_reference_map.get(match.group(1))
+        if reference_info is None:
+            return match.group(0)
+        return f'<img id="{reference_info["hash_id"]}" />'
+    return IMG_ID_RE.sub(replace, text)
+
+def card_xml(card, image_reference_map=None):
+    """One <card> element of the deck XML, image ids resolved if a map is given."""
+    front = card["front"]
+    back = card["back"]
+    if image_reference_map:
+        front = resolve_image_ids(front, image_reference_map)
+        back = resolve_image_ids(back, image_reference_map)
+    return (f'    <card tags={saxutils.quoteattr(card["tags"])}>\n'
+            f'      <rich-text name="Front">{front}</rich-text>\n'
+            f'      <rich-text name="Back">{back}</rich-text>\n'
+            f'    </card>\n')
+
+def write_anki_xml(write, cards, image_reference_map=None):
+    """Write the AnkiApp deck XML through ``write``, resolving image ids if a map is given."""
+    write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    write('<deck name="Mechanical Engineering Exam" tags="ME_Exam,EIT">\n')
+
+    # Define fields structure
+    write('  <fields>\n')
+    write('    <rich-text lang="en-US" name="Front" sides="11"></rich-text>\n')
+    write('    <rich-text lang="en-US" name="Back" sides="01"></rich-text>\n')
+    write('  </fields>\n')
+
+    write('  <cards>\n')
+    for card in cards:
+        write(card_xml(card, image_reference_map))
+
+    write('  </cards>\n')
+    write('</deck>\n')
 
 def create_anki_xml(cards, output_dir):
-    """Create AnkiApp-compatible XML with diagnostic test elements."""
+    """Create AnkiApp-compatible XML (for a deck without images)."""
     # Ensure output directory exists
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     xml_path = os.path.join(output_dir, 'anki_import.xml')
     with open(xml_path, 'w', encoding='utf-8') as f:
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write('<deck name="Mechanical Engineering Exam" tags="ME_Exam,EIT">\n')
-
-        # Define fields structure
-        f.write('  <fields>\n')
-        f.write('    <rich-text lang="en-US" name="Front" sides="11"></rich-text>\n')
-        f.write('    <rich-text lang="en-US" name="Back" sides="01"></rich-text>\n')
-        f.write('  </fields>\n')
-
-        # Add a test card with basic image (for diagnostic purposes)
-        f.write('  <cards>\n')
-
-        # Add diagnostic test card
-        f.write('    <card tags="TEST">\n')
-        f.write('      <rich-text name="Front">This is a test card with hardcoded image reference</rich-text>\n')
-        f.write('      <rich-text name="Back">The image should appear below if the format is correct:<br></br><img id="TEST_HASH" /></rich-text>\n')
-        f.write('    </card>\n')
-
-        # Add regular cards
-        for card in cards:
-            f.write(f'    <card tags="{card["tags"]}">\n')
-            f.write(f'      <rich-text name="Front">{card["front"]}</rich-text>\n')
-            f.write(f'      <rich-text name="Back">{card["back"]}</rich-text>\n')
-            f.write(f'    </card>\n')
-
-        f.write('  </cards>\n')
-        f.write('</deck>\n')
+        write_anki_xml(f.write, cards)
 
     return xml_path
 
-def process_images_for_anki(cards, source_image_dir, output_dir):
-    """Process images with multiple storage strategies to ensure compatibility."""
+def process_images_for_anki(cards, source_image_dir, output_dir, store_dir=None, stats=None, cache=None,
+                            link_blobs=True):
+    """Store each unique image once and link it into blobs/ under its hash.
+
+    With ``link_blobs`` False the images are only resolved to their hashes
+    and stored; the streaming ZIP writer reads them from the store directly.
+    """
     blobs_dir = os.path.join(output_dir, 'blobs')
-    os.makedirs(blobs_dir, exist_ok=True)
+    if link_blobs:
+        os.makedirs(blobs_dir, exist_ok=True)
+    store_dir = store_dir or blob_store.default_store_dir()
+    if stats is None:
+        stats = blob_store.new_size_stats()
 
     image_reference_map = {}
     all_images = set()
@@ -180,38 +214,61 @@ def process_images_for_anki(cards, source_image_dir, output_dir):
         all_images.update(card.get('front_images', []))
         all_images.update(card.get('back_images', []))
 
-    print(f"Processing {len(all_images)} unique binary assets for blob storage")
+    logger.info("Processing %s unique binary assets for blob storage", len(all_images))
 
-    for image_filename in all_images:
+    def store_image(image_filename):
         source_path = os.path.join(source_image_dir, image_filename)
+        if not os.path.exists(source_path):
+            return image_filename, None
+        # Hash (via the cache) and add to the shared content-addressed store
+        return image_filename, blob_store.put_file(store_dir, source_path, cache)
+
+    # Hashing and copying are I/O bound, so a small thread pool overlaps them
+    with ThreadPoolExecutor(max_workers=image_worker_count()) as pool:
+        stored = list(pool.map(store_image, sorted(all_images)))
+
+    to_link = {}
+    for image_filename, result in stored:
+        if result is None:
+            logger.warning("%s not found", image_filename)
+            continue
 
-        if os.path.exists(source_path):
-            # Calculate SHA256 hash in hexadecimal format
-            binary_hash = calculate_sha256(source_path)
-            file_ext = os.path.splitext(image_filename)[1]  # Get the file extension
-
-            # Store with multiple strategies to ensure one works:
-
-            # 1. Store with original filename (for backward compatibility)
-            shutil.copy(source_path, os.path.join(blobs_dir, image_filename))
-
-            # 2. Store with hash as filename without extension
-            shutil.copy(source_path, os.path.join(blobs_dir, binary_hash))
+        binary_hash, stored_path, added = result
+        file_ext = os.path.splitext(image_filename)[1]  # Get the file extension
+        size = os.path.getsize(stored_path)
+
+        stats['referenced_files'] += 1
+        stats['referenced_bytes'] += size
+        if added:
+            stats['bytes_added_to_store'] += size
+
+        # AnkiApp resolves <img id="{hash}" /> against blobs/{hash}; identical
+        # images under different names share the one blob
+        if binary_hash not in to_link:
+            to_link[binary_hash] = (stored_path, size)
+            stats['unique_blobs'] += 1
+            stats['unique_bytes'] += size
+
+        # Create reference mapping
+        image_base = os.path.splitext(image_filename)[0]
+        image_reference_map[image_base] = {
+            'original_filename': image_filename,
+            'hash_id': binary_hash,
+            'file_extension': file_ext,
+            'stored_path': stored_path
+        }
 
-            # 3. Store with hash as filename with extension
-            shutil.copy(source_path, os.path.join(blobs_dir, binary_hash + file_ext))
+    def link_blob(item):
+        binary_hash, (stored_path, size) = item
+        return blob_store.materialize(stored_path, os.path.join(blobs_dir, binary_hash)), size
 
-            # Create reference mapping
-            image_base = os.path.splitext(image_filename)[0]
-            image_reference_map[image_base] = {
-                'original_filename': image_filename,
-                'hash_id': binary_hash,
-                'file_extension': file_ext
-            }
-        else:
-            print(f"Warning: {image_filename} not found")
+    if link_blobs:
+        with ThreadPoolExecutor(max_workers=image_worker_count()) as pool:
+            for method, size in pool.map(link_blob, sorted(to_link.items())):
+                blob_store.record_materialized(stats, method, size)
 
-    print(f"Completed blob processing: {len(image_reference_map)} unique assets stored with multiple filename strategies")
+    logger.info("Completed blob processing: %s images stored as %s unique blobs",
+                len(image_reference_map), len(to_link))
 
     return image_reference_map
 
@@ -234,31 +291,96 @@ def update_xml_with_blob_references(xml_path, image_reference_map):
 
     return xml_content
 
-def create_anki_zip_with_verification(xml_path, blobs_dir, output_dir):
+def create_anki_zip_with_verification(xml_path, blobs_dir, output_dir, image_reference_map=None):
     """Create AnkiApp-compatible ZIP with precise directory structure."""
     zip_path = os.path.join(output_dir, 'anki_import.zip')
 
+    # Exactly one entry per unique blob; stale files left in blobs/ by older
+    # runs are only picked up when no reference map is given
+    if image_reference_map is not None:
+        blob_filenames = sorted({info['hash_id'] for info in image_reference_map.values()})
+    else:
+        blob_filenames = sorted(os.listdir(blobs_dir))
+
     with zipfile.ZipFile(zip_path, 'w') as zip_file:
         # Add XML directly to root
         zip_file.write(xml_path, os.path.basename(xml_path))
 
         # Create blobs directory in the ZIP
-        for blob_filename in os.listdir(blobs_dir):
+        for blob_filename in blob_filenames:
             blob_path = os.path.join(blobs_dir, blob_filename)
             if os.path.isfile(blob_path):
                 # Store with path "blobs/filename" - ensure this exact structure
-                zip_file.write(blob_path, os.path.join('blobs', blob_filename))
+                zip_file.write(blob_path, 'blobs/' + blob_filename)
 
     # Verify the structure
     with zipfile.ZipFile(zip_path, 'r') as verify_zip:
         files = verify_zip.namelist()
-        print("ZIP file structure verification:")
-        print(f"- XML file in root: {os.path.basename(xml_path) in files}")
-        print(f"- 'blobs/' directory present: {any(f.startswith('blobs/') for f in files)}")
-        print(f"- Number of files in blobs: {sum(1 for f in files if f.startswith('blobs/'))}")
+        logger.info("ZIP file structure verification:")
+        logger.info("- XML file in root: %s", os.path.basename(xml_path) in files)
+        logger.info("- 'blobs/' directory present: %s", any(f.startswith('blobs/') for f in files))
+        logger.info("- Number of files in blobs: %s", sum(1 for f in files if f.startswith('blobs/')))
 
     return zip_path
 
+def stream_anki_zip(cards, output_dir, image_reference_map):
+    """Write the deck XML and its blobs straight into the AnkiApp ZIP.
+
+    The XML is rendered into a deflated entry with image ids already
+    resolved, and checked for well-formedness by an expat parser fed the
+    same chunks; each blob is copied once from the store into a
+    ZIP_STORED entry (PNG data does not deflate). Nothing is written to
+    disk besides the ZIP itself, and the ZIP is not reopened afterwards.
+    """
+    zip_path = os.path.join(output_dir, 'anki_import.zip')
+    xml_name = 'anki_import.xml'
+
+    blobs = {}
+    for reference_info in image_reference_map.values():
+        blobs.setdefault(reference_info['hash_id'], reference_info['stored_path'])
+
+    parser = expat.ParserCreate('UTF-8')
+    errors = []
+    with zipfile.ZipFile(zip_path, 'w') as zip_file:
+        xml_info = zipfile.ZipInfo(xml_name)
+        xml_info.compress_type = zipfile.ZIP_DEFLATED
+        with zip_file.open(xml_info, 'w') as raw:
+            xml_stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+            def write(chunk):
+                xml_stream.write(chunk)
+                # After the first error the parser is spent; keep writing the ZIP
+                if not errors:
+                    try:
+                        parser.Parse(chunk, False)
+                    except expat.ExpatError as e:
+                        errors.append(e)
+
+            write_anki_xml(write, cards, image_reference_map)
+            xml_stream.flush()
+            xml_stream.detach()
+
+        for hash_id in sorted(blobs):
+            blob_info = zipfile.ZipInfo('blobs/' + hash_id)
+            blob_info.compress_type = zipfile.ZIP_STORED
+            blob_info.file_size = os.path.getsize(blobs[hash_id])
+            with open(blobs[hash_id], 'rb') as src, zip_file.open(blob_info, 'w') as dst:
+                shutil.copyfileobj(src, dst, STREAM_CHUNK_SIZE)
+
+    if not errors:
+        try:
+            parser.Parse('', True)
+        except expat.ExpatError as e:
+            errors.append(e)
+    is_valid, message = (False, str(errors[0])) if errors else (True, "XML is well-formed")
+
+    logger.info("ZIP file structure verification:")
+    logger.info("- XML file in root: True (deflated, %s)", message)
+    logger.info("- 'blobs/' directory present: %s", bool(blobs))
+    logger.info("- Number of files in blobs: %s (stored uncompressed)", len(blobs))
+
+    return zip_path, is_valid, message
+
 # def main_processing_workflow(input_file, output_dir):
 #     """
 #     Integrated workflow for AnkiApp-compatible conversion with technical precision.
@@ -293,101 +415,48 @@ def create_anki_zip_with_verification(xml_path, blobs_dir, output_dir):
 #     print(f"Conversion complete: {zip_path}")
 #     print(f"Technical verification complete - binary asset reference integrity confirmed")
 
-def create_html_preview(cards, output_dir, image_id_map=None):
-    """Create HTML preview for verification with proper LaTeX rendering."""
-    preview_path = os.path.join(output_dir, 'preview.html')
-    with open(preview_path, 'w', encoding='utf-8') as f:
-        f.write('''<!DOCTYPE html>
-<html>
-<head>
-    <title>Engineering Exam Cards Preview</title>
-    <style>
-        body { font-family: 'Helvetica', sans-serif; margin: 20px; background: #f5f5f5; }
-        .card { border: 1px solid #ccc; margin: 15px 0; padding: 15px; background: white; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-        .card-header { background: #2c3e50; color: white; padding: 10px; margin: -15px -15px 15px; }
-        .question { margin-bottom: 20px; }
-        .answer { background: #f9f9f9; padding: 15px; border-left: 4px solid #2980b9; }
-        img { max-width: 100%; border: 1px solid #ddd; }
-        hr { border: 0; height: 1px; background: #ddd; margin: 20px 0; }
-        .option { font-weight: bold; }
-        .image-placeholder { color: #cc0000; font-style: italic; padding: 5px; border: 1px dashed #cc0000; display: inline-block; }
-    </style>
-    <script type="text/x-mathjax-config">
-        MathJax.Hub.Config({
-            tex2jax: {inlineMath: [['$','$'], ['\\\\(','\\\\)']]}
-        });
-    </script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.5/MathJax.js?config=TeX-AMS_HTML"></script>
-</head>
-<body>
-    <h1>Mechanical Engineering Exam Flashcards</h1>
-    <p>Preview of converted flashcards with LaTeX equations and technical diagrams</p>
-''')
-
-        # Create a directory to store images for preview
-        preview_images_dir = os.path.join(output_dir, 'preview_images')
-        os.makedirs(preview_images_dir, exist_ok=True)
-
-        for card in cards:
-            # We'll use the original content for the preview to better preserve formatting
-            front = card['original_front']
-            back = card['original_back']
-
-            # Process for preview - replace image references
-            for img in card['front_images']:
-                img_num = img.split('.')[0]
-                img_tag = f'<img src="preview_images/{img}" alt="Question diagram">'
-                front = re.sub(r'\[\[\.?\/?(images\/)?{}\.png\]\]'.format(img_num), img_tag, front)
-
-            for img in card['back_images']:
-                img_num = img.split('.')[0]
-                img_tag = f'<img src="preview_images/{img}" alt="Solution diagram">'
-                back = re.sub(r'\[\[\.?\/?(images\/)?{}\.png\]\]'.format(img_num), img_tag, back)
-
-            # Handle LaTeX for preview
-            front = re.sub(r'\\[(](.*?)\\[)]', r'\\(\1\\)', front)
-            back = re.sub(r'\\[(](.*?)\\[)]', r'\\(\1\\)', back)
-
-            # Format paragraphs
-            front = front.replace('\n\n', '<br><br>')
-            back = back.replace('\n\n', '<br><br>')
-
-            # Write card to HTML
-            f.write(f'<div class="card">')
-            f.write(f'<div class="card-header"><h3>Problem {card["id"]}</h3></div>')
-            f.write(f'<div class="question"><strong>Question:</strong><br>{front}</div><hr>')
-            f.write(f'<div class="answer"><strong>Solution:</strong><br>{back}</div>')
-            f.write('</div>')
-
-        f.write('</body></html>')
+def create_html_preview(cards, output_dir):
+    """Create the paginated, offline HTML preview (see html_preview.py).
 
+    Callers link the images into preview_images (copy_images_for_preview)
+    beforehand, so the pages can read their sizes.
+    """
+    preview_images_dir = os.path.join(output_dir, 'preview_images')
+    os.makedirs(preview_images_dir, exist_ok=True)
+    preview_path, stats = html_preview.write_preview(cards, output_dir)
+    logger.info("Preview pages: %s (%s written, %s unchanged)", stats['pages'], stats['written'], stats['unchanged'])
     return preview_path, preview_images_dir
 
-def copy_images_for_preview(cards, source_image_dir, preview_images_dir):
-    """Copy images for HTML preview with proper path handling."""
-    copied_images = set()
-    missing_images = set()
+def copy_images_for_preview(cards, source_image_dir, preview_images_dir, image_reference_map=None, stats=None):
+    """Link images for HTML preview from the blob store, copying as a fallback."""
+    image_reference_map = image_reference_map or {}
 
+    wanted = set()
     for card in cards:
-        # Process all front images
-        for img in card['front_images']:
-            source_path = os.path.join(source_image_dir, img)
-            if os.path.exists(source_path):
-                target_path = os.path.join(preview_images_dir, img)
-                shutil.copy(source_path, target_path)
-                copied_images.add(img)
-            else:
-                missing_images.add(img)
+        wanted.update(html_preview.card_images(card))
 
-        # Process all back images
-        for img in card['back_images']:
-            source_path = os.path.join(source_image_dir, img)
-            if os.path.exists(source_path):
-                target_path = os.path.join(preview_images_dir, img)
-                shutil.copy(source_path, target_path)
-                copied_images.add(img)
-            else:
+    def place_image(img):
+        target_path = os.path.join(preview_images_dir, img)
+        reference_info = image_reference_map.get(os.path.splitext(img)[0])
+        source_path = os.path.join(source_image_dir, img)
+
+        if reference_info:
+            return img, blob_store.materialize(reference_info['stored_path'], target_path)
+        if os.path.exists(source_path):
+            shutil.copyfile(source_path, target_path)
+            return img, 'copy'
+        return img, None
+
+    copied_images = set()
+    missing_images = set()
+    with ThreadPoolExecutor(max_workers=image_worker_count()) as pool:
+        for img, method in pool.map(place_image, sorted(wanted)):
+            if method is None:
                 missing_images.add(img)
+                continue
+            copied_images.add(img)
+            if stats is not None:
+                blob_store.record_materialized(stats, method, os.path.getsize(os.path.join(preview_images_dir, img)))
 
     return copied_images, missing_images
 
@@ -447,99 +516,205 @@ def create_image_report(output_dir, copied_images, missing_images):
         f.write('3. For missing images in the preview, check the image_report.txt file\n')
 
 def validate_xml(xml_path):
-    """Validate the XML file against XML syntax rules."""
-    # Simple validation - doesn't check against schema but ensures well-formed XML
-    try:
-        from xml.etree import ElementTree
-        ElementTree.parse(xml_path)
-        return True, "XML is well-formed"
-    except Exception as e:
-        return False, str(e)
+    """Validate the deck XML (or ZIP) card by card, streaming it (see deck_lint.py)."""
+    findings = deck_lint.lint_xml(xml_path)
+    errors = [item for item in findings if item['severity'] == 'error']
+    if errors:
+        more = f" (and {len(errors) - 1} more)" if len(errors) > 1 else ''
+        return False, deck_lint.format_finding(errors[0]) + more
+    return True, f"XML is well-formed ({deck_lint.summarize(findings)})"
+
+def card_media_hashes(card, image_reference_map):
+    """Blob hashes of a card's images, or the bare name when unresolved."""
+    hashes = []
+    for img in card['front_images'] + card['back_images']:
+        reference_info = image_reference_map.get(os.path.splitext(img)[0])
+        hashes.append(reference_info['hash_id'] if reference_info else img)
+    return hashes
 
 def main():
     """Main function implementing the conversion workflow with robust error handling."""
-    if len(sys.argv) != 3:
-        print("Usage: python org_to_anki_xml.py input.org output_directory")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2]
+    parser = argparse.ArgumentParser(description="Convert an org-drill file to an AnkiApp XML/ZIP import.")
+    parser.add_argument('input_file', help="org-drill file")
+    parser.add_argument('output_dir', help="directory for the generated files")
+    parser.add_argument('--no-stream', action='store_true',
+                        help="also write anki_import.xml and blobs/ instead of streaming the ZIP")
+    parser.add_argument('--split', type=deck_shards.parse_split, default=None, metavar='SPEC',
+                        help="split the deck into packages: heading, cards=N and/or bytes=SIZE (e.g. heading,bytes=25M)")
+    add_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(-1 if args.quiet else args.verbose)
+
+    input_file, output_dir = args.input_file, args.output_dir
+    # Streaming writes the ZIP in one pass; --no-stream keeps the loose
+    # anki_import.xml and blobs/ on disk as well
+    streaming = not args.no_stream
 
     try:
-        print("=== Engineering Flashcard XML Conversion Process ===")
+        logger.info("=== Engineering Flashcard XML Conversion Process ===")
 
         # Create output directory if it doesn't exist
         Path(output_dir).mkdir(parents=True, exist_ok=True)
+        profile = new_profile(output_dir, args.profile_stage) if args.profile else None
 
-        # Read input file
-        print(f"Reading source file: {input_file}")
-        with open(input_file, 'r', encoding='utf-8') as f:
-            org_content = f.read()
+        with stage(profile, 'read'):
+            # Read input file
+            logger.info("Reading source file: %s", input_file)
+            with open(input_file, 'r', encoding='utf-8') as f:
+                org_content = f.read()
+
+            # Previous build, if any, lets unchanged cards and outputs be skipped
+            fingerprint = code_fingerprint(*FINGERPRINT_MODULES)
+            previous = load_manifest(output_dir, 'xml', fingerprint)
+            manifest = new_manifest(fingerprint)
 
         # Extract cards
-        print("Extracting and processing flashcards...")
-        cards = extract_drill_cards(org_content)
-        print(f"Successfully extracted {len(cards)} engineering problem cards")
+        logger.info("Extracting and processing flashcards...")
+        cards = extract_drill_cards(org_content, previous, profile)
+        logger.info("Successfully extracted %s engineering problem cards", len(cards))
 
         # Determine if we have images
         has_images = any(card['front_images'] or card['back_images'] for card in cards)
 
-        # Create XML file - ensure directory exists
-        print("Generating AnkiApp-compatible XML...")
-        xml_path = create_anki_xml(cards, output_dir)
-
-        # Validate XML
-        is_valid, message = validate_xml(xml_path)
-        if is_valid:
-            print(f"XML file created and validated: {xml_path}")
-        else:
-            print(f"WARNING: XML file created but validation failed: {message}")
-
         # Handle images if present
         source_image_dir = os.path.join(os.path.dirname(input_file), "images")
+        images_available = has_images and os.path.exists(source_image_dir)
+        image_reference_map = {}
+        blob_stats = blob_store.new_size_stats()
         copied_images = set()
         missing_images = set()
 
         if has_images:
-            print(f"Looking for engineering diagrams in {source_image_dir}")
-
-            if os.path.exists(source_image_dir):
-                print(f"Processing engineering diagrams with enhanced blob protocol...")
-
-                # Implement enhanced binary asset processing
-                image_reference_map = process_images_for_anki(cards, source_image_dir, output_dir)
-
-                # Update XML with correct hash-based references
-                update_xml_with_blob_references(xml_path, image_reference_map)
-
-                # Create technically verified ZIP archive
-                blobs_dir = os.path.join(output_dir, 'blobs')
-                zip_path = create_anki_zip_with_verification(xml_path, blobs_dir, output_dir)
-
-                print(f"ZIP archive created with technical verification: {zip_path}")
+            logger.info("Looking for engineering diagrams in %s", source_image_dir)
+            if images_available:
+                logger.info("Processing engineering diagrams with enhanced blob protocol...")
+
+                # Store each unique image once in the shared blob store; the
+                # hash cache lets unchanged images skip re-hashing entirely
+                with stage(profile, 'blobs'):
+                    store_dir = blob_store.default_store_dir()
+                    cache_path = default_cache_path(store_dir)
+                    hash_cache = load_hash_cache(cache_path)
+                    image_reference_map = process_images_for_anki(
+                        cards, source_image_dir, output_dir, store_dir, blob_stats, hash_cache,
+                        link_blobs=not streaming)
+                    save_hash_cache(hash_cache, cache_path)
+            else:
+                logger.warning("Image directory not found at %s", source_image_dir)
+        else:
+            logger.info("No image references found in the cards")
 
-                # Create HTML preview with resolved image references
-                preview_path, preview_images_dir = create_html_preview(cards, output_dir)
-                copied_images, missing_images = copy_images_for_preview(cards, source_image_dir, preview_images_dir)
-                print(f"HTML preview created: {preview_path}")
+        for card in cards:
+            record_card(manifest, card, card_media_hashes(card, image_reference_map))
+        added, changed, removed = diff_cards(previous, manifest)
+        print_change_summary(previous, manifest, added, changed, removed)
+
+        # XML and ZIP depend on the rendered cards and the blob hashes only
+        xml_path = os.path.join(output_dir, 'anki_import.xml')
+        zip_path = os.path.join(output_dir, 'anki_import.zip')
+        image_hashes = sorted((base, info['hash_id']) for base, info in image_reference_map.items())
+        deck_digest = inputs_digest([streaming, [[c['front'], c['back'], c['tags']] for c in cards], image_hashes,
+                                     args.split, deck_shards.card_headings(cards, org_content)
+                                     if args.split and args.split['heading'] else None])
+        shards_path = os.path.join(output_dir, deck_shards.SHARD_MANIFEST)
+        if args.split:
+            deck_outputs = [shards_path]
+        elif streaming and images_available:
+            deck_outputs = [zip_path]
+        elif images_available:
+            deck_outputs = [xml_path, zip_path]
+        else:
+            deck_outputs = [xml_path]
+
+        deck_current = output_is_current(previous, 'deck', deck_digest, deck_outputs)
+        if deck_current:
+            logger.info("Unchanged, skipped: %s", ', '.join(os.path.basename(p) for p in deck_outputs))
+        elif args.split:
+            # Each package is streamed from its own cards and blobs
+            logger.info("Splitting the deck into AnkiApp packages...")
+            with stage(profile, 'zip'):
+                _, shards_path, is_valid, message = deck_shards.write_shards(
+                    cards, output_dir, image_reference_map, args.split, org_content)
+            if not is_valid:
+                logger.warning("Packages created but XML validation failed: %s", message)
+        elif streaming and images_available:
+            # Hashes are already resolved, so XML and blobs go straight into the ZIP
+            # (the XML is checked by the same pass, so this stage covers all three)
+            logger.info("Streaming AnkiApp-compatible XML and blobs into ZIP...")
+            with stage(profile, 'zip'):
+                zip_path, is_valid, message = stream_anki_zip(cards, output_dir, image_reference_map)
+            if is_valid:
+                logger.info("ZIP archive created with technical verification: %s", zip_path)
             else:
-                print(f"WARNING: Image directory not found at {source_image_dir}")
-                preview_path, _ = create_html_preview(cards, output_dir)
+                logger.warning("ZIP archive created but XML validation failed: %s", message)
         else:
-            print("No image references found in the cards")
-            preview_path, _ = create_html_preview(cards, output_dir)
-            print(f"Text-only HTML preview created: {preview_path}")
+            # Create XML file - ensure directory exists
+            logger.info("Generating AnkiApp-compatible XML...")
+            with stage(profile, 'xml'):
+                xml_path = create_anki_xml(cards, output_dir)
+
+            # Validate XML
+            with stage(profile, 'validate'):
+                is_valid, message = validate_xml(xml_path)
+            if is_valid:
+                logger.info("XML file created and validated: %s", xml_path)
+            else:
+                logger.warning("XML file created but validation failed: %s", message)
+
+            if images_available:
+                with stage(profile, 'zip'):
+                    # Update XML with correct hash-based references
+                    update_xml_with_blob_references(xml_path, image_reference_map)
+
+                    # Create technically verified ZIP archive
+                    blobs_dir = os.path.join(output_dir, 'blobs')
+                    zip_path = create_anki_zip_with_verification(xml_path, blobs_dir, output_dir, image_reference_map)
+                logger.info("ZIP archive created with technical verification: %s", zip_path)
+        if not deck_current:
+            # Media references, <tex>, tags and fields of every card as written
+            with stage(profile, 'lint'):
+                findings = deck_lint.lint_cards(cards, image_reference_map)
+                deck_lint.log_findings(findings, deck_lint.write_report(findings, output_dir))
+        mark_output(manifest, 'deck', deck_digest)
+
+        with stage(profile, 'preview'):
+            preview_path = os.path.join(output_dir, 'preview.html')
+            preview_images_dir = os.path.join(output_dir, 'preview_images')
+            os.makedirs(preview_images_dir, exist_ok=True)
+            if images_available:
+                # Linking from the store is idempotent, so this is cheap when unchanged
+                copied_images, missing_images = copy_images_for_preview(
+                    cards, source_image_dir, preview_images_dir, image_reference_map, blob_stats)
+
+                report_path = blob_store.write_size_report(blob_stats, output_dir)
+                logger.info("Blob size report created: %s", report_path)
+
+            # Create HTML preview with resolved image references
+            preview_digest = inputs_digest([[c['id'], c['original_front'], c['original_back'],
+                                             c['front_images'], c['back_images']] for c in cards])
+            if output_is_current(previous, 'preview', preview_digest, [preview_path]):
+                logger.info("Unchanged, skipped: %s", os.path.basename(preview_path))
+            else:
+                preview_path, preview_images_dir = create_html_preview(cards, output_dir)
+                logger.info("HTML preview created: %s", preview_path)
+            mark_output(manifest, 'preview', preview_digest)
 
         # Create instructions and reports
-        create_instructions(output_dir)
-        if has_images:
-            create_image_report(output_dir, copied_images, missing_images)
+        with stage(profile, 'reports'):
+            create_instructions(output_dir)
+            if has_images:
+                create_image_report(output_dir, copied_images, missing_images)
+
+            save_manifest(manifest, output_dir, 'xml')
 
-        print("\n=== Conversion Complete ===")
-        print(f"Output files available in: {output_dir}")
+        logger.info("=== Conversion Complete ===")
+        logger.info("Output files available in: %s", output_dir)
+        if profile is not None:
+            json_path, text_path = write_report(profile)
+            logger.info("Profile report: %s (%s)", text_path, json_path)
 
     except Exception as e:
-        print(f"Error processing engineering content: {str(e)}")
+        logger.error("Error processing engineering content: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+Org-drill Deck Builder: Parse Once, Emit Many
+
+Single entry point for every artifact the converters produce. The org file
+is parsed once into a shared card model, images are resolved against the
+blob store once, and the selected emitters then build their outputs from
+that same card stream on a thread pool, so their file I/O overlaps:
+
+    csv      anki_import.csv, sample_cards.txt, import_instructions.txt
+             (and anki_update.csv with --diff)
+    apkg     anki_import.apkg (collection and media; imports in one step)
+    xml      anki_import.zip (streamed; anki_import.xml without images), README.txt,
+             lint_report.txt
+             (or set1/, set2/, ... and shards.json with --split; see deck_shards.py)
+    preview  preview.html, preview_images/, blob_report.txt
+    media    media_files_needed.txt, image_report.txt
+
+Every emitter renders from the same parsed cards with the same image
+references and card-splitting rule (a card needs an answer section), so
+the CSV and XML decks always contain the same cards.
+
+Anki notes carry a GUID derived from the card's :ID: property (else its
+question), so a re-import updates notes in place. --diff also writes
+anki_update.csv with only the cards added or changed since a previous
+build's manifest (by default this output directory's): after editing five
+cards it has five rows.
+
+Usage:
+    python org_to_deck.py input.org output_directory [--emit csv,apkg,xml,preview,media]
+    python org_to_deck.py --batch 'exam_drill*.org' output_root [--jobs N]
+    python org_to_deck.py --batch inputs.txt output_root
+    python org_to_deck.py huge.org output_directory --shards 0
+    python org_to_deck.py input.org output_directory --render-math latex
+    python org_to_deck.py input.org output_directory --emit csv --diff [old_output/build_manifest.json]
+    python org_to_deck.py input.org output_directory --emit xml --split heading,bytes=25M
+    python org_to_deck.py input.org output_directory --handbook [studyMaterials]
+    python org_to_deck.py input.org output_directory --schedule sm2 [--write-schedule]
+    python org_to_deck.py input.org output_directory --dedup drop [--dedup-against other.org]
+    python org_to_deck.py input.org output_directory --recolor [--palette '#000000=#bbc2cf,#ffffff=#282c34']
+    python org_to_deck.py input.org output_directory -q --profile [--profile-stage emit]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import apkg_export
+import blob_store
+import card_cache
+import dedup
+import handbook_index
+import deck_lint
+import deck_shards
+import image_index
+import latex_cache
+import org_to_anki
+import org_to_anki_xml
+import recolor
+import scheduling
+from build_manifest import (
+    code_fingerprint, diff_cards, inputs_digest, load_manifest, mark_output,
+    new_manifest, note_guid, output_is_current, print_change_summary, record_card, save_manifest, source_hash,
+)
+from hash_cache import default_cache_path, file_sha256, load_hash_cache, save_hash_cache
+from markup import render_markup, find_images
+from org_parser import iter_drill_cards, card_number, split_shards
+from profiling import add_arguments, new_profile, setup_logging, stage, write_report
+
+# Smaller files parse faster serially than they can be shipped to workers
+MIN_SHARD_LINES = 20000
+
+UPDATE_NAME = 'anki_update.csv'
+
+# Every module whose code shapes a card or an output of build_deck
+FINGERPRINT_MODULES = (
+    'markup', 'org_parser', 'build_manifest', 'blob_store', 'org_to_anki', 'org_to_anki_xml', 'apkg_export',
+    'html_preview', 'scheduling', 'latex_cache', 'recolor', 'image_index', 'handbook_index', 'dedup',
+    'deck_shards', 'deck_lint', __name__,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _deck_cards(lines, first_line=1, card_offset=0, dialects=(), render_cache=None):
+    """Parse and render the cards in ``lines`` (a whole file or one shard).
+
+    ``render_cache`` is an optional (previous, current) pair of dicts:
+    fields found in ``previous`` are not rendered again, and every field
+    used is recorded in ``current``.
+    """
+    previous_renders, current_renders = render_cache if render_cache else ({}, None)
+    cards = []
+    for index, parsed in enumerate(iter_drill_cards(lines, first_line=first_line), card_offset):
+        # Cards without a "****" answer section cannot be drilled
+        if not parsed['answer']:
+            continue
+
+        card_num = card_number(parsed, index)
+        front_images = find_images(parsed['question'])
+        back_images = find_images(parsed['answer'])
+        card = {
+            'id': card_num,
+            'org_id': parsed['properties'].get('ID'),
+            'source_hash': source_hash(parsed, card_num),
+            'question': parsed['question'],
+            'answer': parsed['answer'],
+            'tags': f"ME_Exam,Problem_{card_num}",
+            'front_images': front_images,
+            'back_images': back_images,
+            'media': sorted(set(front_images + back_images)),
+            'line': parsed['line'],
+            'review': {
+                'properties': {k: v for k, v in parsed['properties'].items() if k.startswith('DRILL_')},
+                'scheduled': parsed['planning'].get('SCHEDULED'),
+            },
+        }
+        for dialect in dialects:
+            key = (dialect, parsed['question'], parsed['answer'])
+            fields = previous_renders.get(key)
+            if fields is None:
+                fields = (render_markup(parsed['question'], dialect), render_markup(parsed['answer'], dialect))
+            if current_renders is not None:
+                current_renders[key] = fields
+            card[dialect] = fields
+        cards.append(card)
+    return cards
+
+
+def shard_count_for(lines, shards):
+    """Number of shards worth using: ``shards`` (0 = one per CPU), capped by file size."""
+    if shards == 0:
+        shards = os.cpu_count() or 1
+    return max(1, min(shards, len(lines) // MIN_SHARD_LINES))
+
+
+def load_deck(org_content, dialects=(), shards=1, render_cache=None):
+    """Parse an org-drill file once into the shared card model.
+
+    Fields are pre-rendered for each of ``dialects``. With more than one
+    shard the file is cut at safe headline boundaries (org_parser.split_shards)
+    and shards are parsed and rendered in worker processes; the cards come
+    back in source order with the same numbering and tags as a serial parse.
+    ``render_cache`` (see _deck_cards) is only used by a serial parse.
+    """
+    lines = org_content.splitlines()
+    shard_count = shard_count_for(lines, shards)
+    if shard_count == 1:
+        return _deck_cards(lines, dialects=dialects, render_cache=render_cache)
+
+    parts = split_shards(lines, shard_count)
+    with ProcessPoolExecutor(max_workers=len(parts)) as pool:
+        futures = [pool.submit(_deck_cards, shard_lines, first_line, card_offset, tuple(dialects))
+                   for first_line, card_offset, shard_lines in parts]
+        cards = []
+        for future in futures:
+            cards.extend(future.result())
+    logger.info("Parsed in %s shards", len(parts))
+    return cards
+
+
+def resolve_images(cards, source_image_dir, output_dir, stats, hash_cache=None):
+    """Store every referenced image once and map image names to blob hashes.
+
+    A caller-supplied ``hash_cache`` is used as is and left for the caller
+    to save; otherwise the store's cache file is loaded and saved here.
+    """
+    if not os.path.exists(source_image_dir):
+        return {}
+    store_dir = blob_store.default_store_dir()
+    cache_path = default_cache_path(store_dir)
+    owns_cache = hash_cache is None
+    if owns_cache:
+        hash_cache = load_hash_cache(cache_path)
+    image_reference_map = org_to_anki_xml.process_images_for_anki(
+        cards, source_image_dir, output_dir, store_dir, stats, hash_cache, link_blobs=False)
+    if owns_cache:
+        save_hash_cache(hash_cache, cache_path)
+    return image_reference_map
+
+
+def rendered(card, dialect):
+    """(front, back) of a shared card in ``dialect``, pre-rendered when available."""
+    if dialect in card:
+        return card[dialect]
+    math_images = card.get('math_images')
+    return (render_markup(card['question'], dialect, math_images),
+            render_markup(card['answer'], dialect, math_images))
+
+
+def prerender_math(cards, renderer, image_reference_map, dialects, hash_cache=None):
+    """Replace math in the cards with cached renders, referenced as media.
+
+    Renders are added to ``image_reference_map`` (so the ZIP and .apkg
+    carry them) and to each card's ``media``; pre-rendered fields are
+    rendered again with the images in place of the math.
+    """
+    fragments = latex_cache.collect_fragments(
+        text for card in cards for text in (card['question'], card['answer']))
+    store_dir = blob_store.default_store_dir()
+    math_paths, stats = latex_cache.render_fragments(fragments, renderer, store_dir)
+    logger.info("Math fragments: %s (%s cached, %s rendered, %s left as math)",
+                stats['fragments'], stats['hits'], stats['rendered'], stats['failed'])
+
+    math_images = {fragment: os.path.basename(path) for fragment, path in math_paths.items()}
+    for path in math_paths.values():
+        name = os.path.basename(path)
+        image_reference_map[os.path.splitext(name)[0]] = {
+            'original_filename': name,
+            'hash_id': file_sha256(path, hash_cache),
+            'file_extension': os.path.splitext(name)[1],
+            'stored_path': path,
+        }
+
+    for card in cards:
+        used = {f: math_images[f] for f in latex_cache.collect_fragments((card['question'], card['answer']))
+                if f in math_images}
+        card['media'] = sorted(set(card['media']) | set(used.values()))
+        card['math_images'] = used or None
+        for dialect in dialects:
+            card[dialect] = (render_markup(card['question'], dialect, card['math_images']),
+                             render_markup(card['answer'], dialect, card['math_images']))
+    return stats
+
+
+def schedule_deck(cards, input_file, algorithm, write_back=False):
+    """Attach due date, interval, ease and projected next interval to every card.
+
+    With ``write_back`` the computed due dates of reviewed cards are written
+    to the SCHEDULED lines of ``input_file``.
+    """
+    today = date.today().toordinal()
+    store = scheduling.load_store(cards, today)
+    index = scheduling.build_due_index(store, today)
+    next_intervals, _ = scheduling.project(store, 4, algorithm)
+
+    for row, card in enumerate(cards):
+        card['schedule'] = dict(scheduling.card_schedule(store, row, today),
+                                next_interval=round(float(next_intervals[row]), 2))
+    logger.info('%s', scheduling.describe_due(store, index, today))
+
+    if write_back:
+        due_by_line = {card['line']: store['due'][row] for row, card in enumerate(cards)
+                       if store['due'][row] != scheduling.NEW_CARD}
+        changed = scheduling.write_back(input_file, due_by_line)
+        logger.info("Updated SCHEDULED on %s cards in %s", changed, input_file)
+    return store, index
+
+
+def csv_cards(cards):
+    """Shared cards rendered into the shape org_to_anki.py writes."""
+    result = []
+    for card in cards:
+        front, back = rendered(card, 'html')
+        result.append({
+            'id': card['id'],
+            'org_id': card['org_id'],
+            'guid': note_guid(card['org_id'], card['question']),
+            'front': front,
+            'back': back,
+            'tags': card['tags'],
+            'media': card['media'],
+        })
+        if 'schedule' in card:
+            result[-1]['schedule'] = card['schedule']
+    return result
+
+
+def preview_cards(cards):
+    """Shared cards in the shape the HTML preview reads (no rendering needed)."""
+    return [{
+        'id': card['id'],
+        'front_images': card['front_images'],
+        'back_images': card['back_images'],
+        'original_front': card['question'],
+        'original_back': card['answer'],
+        'math_images': card.get('math_images'),
+        'handbook': card.get('handbook'),
+    } for card in cards]
+
+
+def xml_cards(cards):
+    """Shared cards rendered into the shape org_to_anki_xml.py writes."""
+    result = preview_cards(cards)
+    for card, xml_card in zip(cards, result):
+        xml_card['front'], xml_card['back'] = rendered(card, 'xml')
+        xml_card['tags'] = card['tags']
+        xml_card['org_id'] = card['org_id']
+        xml_card['line'] = card['line']
+    return result
+
+
+def emit_csv(deck, output_dir):
+    """Anki CSV deck plus its sample and import guide."""
+    cards = csv_cards(deck['cards'])
+    org_to_anki.validate_cards(cards)
+    org_to_anki.write_sample_cards(cards, output_dir)
+    org_to_anki.generate_import_guide(output_dir)
+    return [org_to_anki.create_anki_csv(cards, output_dir)]
+
+
+def write_update(cards, baseline, manifest, output_dir):
+    """Write anki_update.csv with the cards added or changed since the ``baseline`` manifest."""
+    added, changed, removed = diff_cards(baseline, manifest)
+    wanted = set(added) | set(changed)
+    # Manifest keys follow the cards, duplicate :ID:s included
+    update = [card for key, card in zip(manifest['order'], cards) if key in wanted]
+    path = org_to_anki.create_anki_csv(csv_cards(update), output_dir, UPDATE_NAME)
+    logger.info("Update: %s added and %s changed cards in %s", len(added), len(changed), path)
+    if removed:
+        logger.warning("Update: %s cards were removed since the baseline; delete them in Anki by hand", len(removed))
+    return path
+
+
+def emit_apkg(deck, output_dir):
+    """Anki package with the collection and media embedded; imports in one step."""
+    cards = csv_cards(deck['cards'])
+    return [apkg_export.write_apkg(cards, output_dir, deck['source_image_dir'], deck['image_reference_map'])]
+
+
+def emit_xml(deck, output_dir):
+    """AnkiApp deck: a streamed ZIP when there are images, plain XML otherwise."""
+    cards = xml_cards(deck['cards'])
+    org_to_anki_xml.create_instructions(output_dir)
+    if deck['split']:
+        outputs, manifest_path, is_valid, message = deck_shards.write_shards(
+            cards, output_dir, deck['image_reference_map'], deck['split'], deck['org_content'])
+        outputs.append(manifest_path)
+    elif deck['image_reference_map']:
+        zip_path, is_valid, message = org_to_anki_xml.stream_anki_zip(
+            cards, output_dir, deck['image_reference_map'])
+        outputs = [zip_path]
+    else:
+        xml_path = org_to_anki_xml.create_anki_xml(cards, output_dir)
+        is_valid, message = org_to_anki_xml.validate_xml(xml_path)
+        outputs = [xml_path]
+    if not is_valid:
+        logger.warning("AnkiApp XML validation failed: %s", message)
+    findings = deck_lint.lint_cards(cards, deck['image_reference_map'])
+    report_path = deck_lint.write_report(findings, output_dir)
+    deck_lint.log_findings(findings, report_path)
+    return outputs + [report_path]
+
+
+def emit_preview(deck, output_dir):
+    """Paginated offline HTML preview with images linked from the blob store."""
+    cards = preview_cards(deck['cards'])
+    preview_images_dir = os.path.join(output_dir, 'preview_images')
+    os.makedirs(preview_images_dir, exist_ok=True)
+    # Images first, so the pages can read their sizes
+    org_to_anki_xml.copy_images_for_preview(
+        cards, deck['source_image_dir'], preview_images_dir, deck['image_reference_map'], deck['stats'])
+    preview_path, _ = org_to_anki_xml.create_html_preview(cards, output_dir)
+    if deck['image_reference_map']:
+        # Only this emitter materializes files, so it owns the size report
+        return [preview_path, blob_store.write_size_report(deck['stats'], output_dir)]
+    return [preview_path]
+
+
+def emit_media(deck, output_dir):
+    """Reports on referenced, found and missing media."""
+    cards = deck['cards']
+    referenced = {img for card in cards for img in card['media']}
+    found = {img for img in referenced if os.path.splitext(img)[0] in deck['image_reference_map']}
+    org_to_anki_xml.create_image_report(output_dir, found, referenced - found)
+    return [org_to_anki.generate_media_report(cards, output_dir), os.path.join(output_dir, 'image_report.txt')]
+
+
+# Markup dialect each emitter renders, pre-rendered while parsing
+EMITTER_DIALECTS = {'csv': 'html', 'apkg': 'html', 'xml': 'xml'}
+
+EMITTERS = {
+    'csv': (emit_csv, ['anki_import.csv']),
+    'apkg': (emit_apkg, ['anki_import.apkg']),
+    'xml': (emit_xml, ['README.txt', 'lint_report.txt']),
+    'preview': (emit_preview, ['preview.html']),
+    'media': (emit_media, ['media_files_needed.txt', 'image_report.txt']),
+}
+
+
+def parse_emitters(value):
+    """Parse the comma-separated --emit list."""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in EMITTERS]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(
+            f"unknown emitter(s): {', '.join(unknown) or '(none)'}; choose from {', '.join(EMITTERS)}")
+    return names
+
+
+def build_deck(input_file, output_dir, emitters, hash_cache=None, shards=1, render_math=None, recolor_palette=None,
+               recolor_fuzz=recolor.DEFAULT_FUZZ, schedule=None, write_schedule=False, dedup_mode=None,
+               dedup_threshold=dedup.DEFAULT_THRESHOLD, dedup_against=(), collapse_images=False, diff_against=None, split=None, handbook=None,
+               warm=None, profile=None):
+    """Parse ``input_file`` once and run the selected emitters concurrently.
+
+    ``shards`` > 1 (or 0 for one per CPU) parses a large file in parallel
+    shards; see load_deck. ``render_math`` names a latex_cache renderer to
+    replace math with cached image renders. ``recolor_palette`` swaps every
+    PNG for its recolored blob (see recolor.py); sources are not touched.
+    ``schedule`` ('sm2' or 'fsrs') exports review state from the DRILL_*
+    properties, and ``write_schedule`` writes due dates back to the org file.
+    ``dedup_mode`` ('report', 'drop' or 'merge') finds near-duplicate
+    questions, also against the cards of the ``dedup_against`` files.
+    ``collapse_images`` points visually identical diagrams at one blob
+    (see image_index.py). ``diff_against`` (an output directory or its
+    build_manifest.json) also writes anki_update.csv with only the cards
+    added or changed since that build. ``split`` (a deck_shards.parse_split
+    spec) splits the AnkiApp deck into size-bounded packages. ``handbook``
+    (a studyMaterials directory) tags cards with the NCEES Handbook
+    sections they mention (see handbook_index.py).
+
+    Cards come from the compiled cache (card_cache.py, cards.bin in
+    ``output_dir``) while it matches the org file; otherwise the file is
+    parsed and the cache rewritten.
+
+    ``warm`` is a dict a resident caller (watch.py) passes to every build.
+    It keeps the previous manifest, rendered fields and resolved images in
+    memory, so a rebuild re-renders only edited cards and skips image
+    resolution unless the referenced images or ``warm['images_dirty']``
+    changed; the manifest is then saved on a background thread.
+
+    ``profile`` (a profiling.new_profile dict) times the parse, blobs and
+    emit stages.
+
+    Returns a summary dict: input, output_dir, cards, images, changes
+    (added, changed, removed counts), emitted and skipped emitter names.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        org_content = f.read()
+
+    fingerprint = code_fingerprint(*FINGERPRINT_MODULES)
+    if warm is not None and warm.get('fingerprint') == fingerprint:
+        previous = warm['previous']
+    else:
+        previous = load_manifest(output_dir, 'deck', fingerprint)
+    manifest = new_manifest(fingerprint)
+    if diff_against is not None:
+        # Any code version's manifest will do: cards are compared by content
+        baseline_dir = os.path.dirname(diff_against) if os.path.isfile(diff_against) else diff_against
+        baseline = load_manifest(baseline_dir, 'deck', None)
+
+    dialects = sorted({EMITTER_DIALECTS[name] for name in emitters if name in EMITTER_DIALECTS})
+    cache_path = os.path.join(output_dir, card_cache.CACHE_NAME)
+    with stage(profile, 'parse'):
+        cards = card_cache.load_current(cache_path, org_content, dialects) if warm is None else None
+        if cards is not None:
+            logger.info("Loaded %s cards from %s", len(cards), cache_path)
+        else:
+            render_cache = (warm.get('renders', {}), {}) if warm is not None else None
+            cards = load_deck(org_content, dialects, shards, render_cache)
+            if warm is not None:
+                warm['renders'] = render_cache[1]
+            card_cache.write_cache(cache_path, cards, org_content)
+            logger.info("Parsed %s cards from %s", len(cards), input_file)
+
+    if dedup_mode:
+        reference = []
+        for path in dedup_against:
+            with open(path, 'r', encoding='utf-8') as f:
+                reference.extend(dict(card, source=path) for card in load_deck(f.read()))
+        kept, clusters = dedup.dedup_cards(cards, dedup_mode, dedup_threshold, reference)
+        report_path = dedup.write_report(clusters, os.path.join(output_dir, 'duplicates_report.txt'),
+                                         dedup_threshold)
+        logger.info("Duplicates: %s clusters, %s cards dropped (%s)", len(clusters), len(cards) - len(kept),
+                    report_path)
+        cards = kept
+
+    if handbook:
+        tagged = handbook_index.tag_cards(cards, handbook_index.load_handbook(handbook))
+        report_path = handbook_index.write_report(cards, os.path.join(output_dir, handbook_index.REPORT_NAME))
+        logger.info("Handbook references: %s of %s cards (%s)", tagged, len(cards), report_path)
+
+    if schedule:
+        schedule_deck(cards, input_file, schedule, write_schedule)
+
+    source_image_dir = os.path.join(os.path.dirname(input_file), 'images')
+    referenced = sorted({img for card in cards for img in card['media']})
+    if warm is not None and not warm.get('images_dirty') and warm.get('images', (None,))[0] == referenced:
+        stats = dict(warm['images'][2])
+        image_reference_map = dict(warm['images'][1])
+    else:
+        stats = blob_store.new_size_stats()
+        with stage(profile, 'blobs'):
+            image_reference_map = resolve_images(cards, source_image_dir, output_dir, stats, hash_cache)
+        if warm is not None:
+            warm['images'] = (referenced, dict(image_reference_map), dict(stats))
+            warm['images_dirty'] = False
+    if collapse_images and image_reference_map:
+        image_reference_map, collapse_stats = image_index.collapse_reference_map(
+            image_reference_map, cache=hash_cache)
+        logger.info("Collapsed images: %s onto %s blobs (%s look-alikes kept apart)",
+                    collapse_stats['collapsed'], collapse_stats['groups'], collapse_stats['rejected'])
+    if recolor_palette and image_reference_map:
+        image_reference_map, recolor_stats = recolor.recolor_reference_map(
+            image_reference_map, recolor_palette, recolor_fuzz)
+        logger.info("Recolored images: %s (%s cached, %s new)",
+                    recolor_stats['images'], recolor_stats['cached'], recolor_stats['recolored'])
+    if render_math:
+        prerender_math(cards, render_math, image_reference_map, dialects, hash_cache)
+
+    for card in cards:
+        record_card(manifest, dict(card, front=card['question'], back=card['answer']),
+                    org_to_anki_xml.card_media_hashes(card, image_reference_map))
+    added, changed, removed = diff_cards(previous, manifest)
+    print_change_summary(previous, manifest, added, changed, removed)
+    if diff_against is not None:
+        write_update(cards, baseline, manifest, output_dir)
+
+    deck = {
+        'cards': cards,
+        'source_image_dir': source_image_dir,
+        'image_reference_map': image_reference_map,
+        'stats': stats,
+        'split': split,
+        'org_content': org_content,
+    }
+    image_hashes = sorted((base, info['hash_id']) for base, info in image_reference_map.items())
+    deck_digest = [[card['source_hash'] for card in cards], image_hashes,
+                   [card.get('schedule') for card in cards], [card['tags'] for card in cards],
+                   [card.get('handbook') for card in cards],
+                   [split, deck_shards.card_headings(cards, org_content) if split and split['heading'] else None]]
+
+    # Emitters only read the shared deck, so they can run side by side
+    pending = {}
+    skipped = []
+    with stage(profile, 'emit'), ThreadPoolExecutor(max_workers=len(emitters)) as pool:
+        for name in emitters:
+            emit, outputs = EMITTERS[name]
+            digest = inputs_digest([name] + deck_digest)
+            if output_is_current(previous, name, digest, [os.path.join(output_dir, p) for p in outputs]):
+                logger.info("Unchanged, skipped: %s", name)
+                mark_output(manifest, name, digest)
+                skipped.append(name)
+            else:
+                pending[name] = (digest, pool.submit(emit, deck, output_dir))
+
+        # An emitter that raised is left unmarked so the next run retries it
+        for name, (digest, future) in pending.items():
+            for path in future.result():
+                logger.info("%s: %s", name, path)
+            mark_output(manifest, name, digest)
+
+    if warm is None:
+        save_manifest(manifest, output_dir, 'deck')
+    else:
+        warm['fingerprint'] = fingerprint
+        warm['previous'] = manifest
+        if warm.get('saver'):
+            warm['saver'].join()
+        warm['saver'] = threading.Thread(target=save_manifest, args=(manifest, output_dir, 'deck'))
+        warm['saver'].start()
+    return {
+        'input': input_file,
+        'output_dir': output_dir,
+        'cards': len(cards),
+        'images': len(image_reference_map),
+        'changes': [len(added), len(changed), len(removed)],
+        'emitted': list(pending),
+        'skipped': skipped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build Anki and AnkiApp decks from an org-drill file.")
+    parser.add_argument('input_file', help="org-drill file (with --batch: a glob or a list file of inputs)")
+    parser.add_argument('output_dir', help="directory for the generated artifacts")
+    parser.add_argument('--emit', type=parse_emitters, default=list(EMITTERS),
+                        help=f"comma-separated emitters to run (default: {','.join(EMITTERS)})")
+    parser.add_argument('--batch', action='store_true',
+                        help="convert every matching input in a process pool, one subdirectory each")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="worker processes for --batch (default: CPU count)")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="parse one large file in N parallel shards (0 = one per CPU)")
+    parser.add_argument('--recolor', action='store_true',
+                        help="recolor PNG diagrams for a dark theme (needs numpy and Pillow)")
+    parser.add_argument('--palette', type=recolor.parse_palette, default=recolor.DEFAULT_PALETTE,
+                        help="OLD=NEW colour substitutions for --recolor (default: update_images.sh colours)")
+    parser.add_argument('--fuzz', type=float, default=recolor.DEFAULT_FUZZ,
+                        help="--recolor match tolerance in percent (default 20)")
+    parser.add_argument('--schedule', choices=scheduling.ALGORITHMS, default=None,
+                        help="export due dates and intervals from the DRILL_* review state")
+    parser.add_argument('--write-schedule', action='store_true',
+                        help="with --schedule, write computed due dates back to the org file")
+    parser.add_argument('--dedup', choices=('report', 'drop', 'merge'), default=None,
+                        help="find near-duplicate questions; drop them or merge their tags into the first")
+    parser.add_argument('--dedup-threshold', type=float, default=dedup.DEFAULT_THRESHOLD,
+                        help=f"--dedup similarity threshold (default {dedup.DEFAULT_THRESHOLD})")
+    parser.add_argument('--dedup-against', nargs='+', default=(), metavar='ORG',
+                        help="with --dedup, also drop cards duplicating these already exported decks")
+    parser.add_argument('--collapse-images', action='store_true',
+                        help="store visually identical diagrams once (needs numpy and Pillow)")
+    parser.add_argument('--diff', nargs='?', const='', default=None, metavar='MANIFEST',
+                        help=f"also write {UPDATE_NAME} with only the cards added or changed since MANIFEST "
+                             "(a build_manifest.json or output directory; default: this output directory)")
+    parser.add_argument('--split', type=deck_shards.parse_split, default=None, metavar='SPEC',
+                        help="split the AnkiApp deck into packages: heading, cards=N and/or bytes=SIZE "
+                             "(e.g. heading,bytes=25M)")
+    parser.add_argument('--handbook', nargs='?', const=handbook_index.DEFAULT_HANDBOOK_DIR, default=None,
+                        metavar='DIR', help="tag cards with the NCEES Handbook sections they mention "
+                                            "(default DIR: studyMaterials)")
+    parser.add_argument('--watch', action='store_true',
+                        help="stay resident and rebuild when the org file or images change")
+    parser.add_argument('--poll', action='store_true',
+                        help="with --watch, poll for changes instead of using inotify")
+    parser.add_argument('--render-math', choices=latex_cache.RENDERERS, default=None,
+                        help="pre-render math to cached images with this renderer")
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.batch and args.watch:
+        parser.error("--watch follows a single input file; it cannot be combined with --batch")
+    if args.batch and args.diff:
+        parser.error("with --batch, --diff compares each input against its own output directory "
+                     "and takes no MANIFEST")
+    if args.profile and (args.batch or args.watch):
+        parser.error("--profile measures a single build; it cannot be combined with --batch or --watch")
+    # The converters' stage messages go through logging
+    setup_logging(-1 if args.quiet else args.verbose)
+
+    options = dict(shards=args.shards, render_math=args.render_math,
+                   recolor_palette=args.palette if args.recolor else None, recolor_fuzz=args.fuzz,
+                   schedule=args.schedule, write_schedule=args.write_schedule, dedup_mode=args.dedup,
+                   dedup_threshold=args.dedup_threshold, dedup_against=args.dedup_against,
+                   collapse_images=args.collapse_images, split=args.split, handbook=args.handbook,
+                   diff_against=args.diff)
+    try:
+        if args.batch:
+            import batch_build
+            summaries = batch_build.run_batch(args.input_file, args.output_dir, args.emit, args.jobs, **options)
+            if any(summary.get('error') for summary in summaries):
+                sys.exit(1)
+        else:
+            if args.diff == '':
+                options['diff_against'] = args.output_dir
+            if args.watch:
+                import watch
+                watch.run_watch(args.input_file, args.output_dir, args.emit, args.poll, **options)
+                return
+            profile = new_profile(args.output_dir, args.profile_stage) if args.profile else None
+            build_deck(args.input_file, args.output_dir, args.emit, profile=profile, **options)
+            if profile is not None:
+                json_path, text_path = write_report(profile)
+                logger.info("Profile report: %s (%s)", text_path, json_path)
+    except Exception as e:
+        logger.error("Error building deck: %s", e)
+        sys.exit(1)
+
+    logger.info("=== Deck Build Complete ===")
+    logger.info("Output files available in: %s", args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Logging and Per-stage Profiling
+
+The converters log their progress through ``logging`` instead of print:
+INFO is the usual narration, DEBUG adds per-card detail (-v), and -q
+keeps only warnings and errors. setup_logging sends records to whatever
+sys.stdout is at the time, so callers that capture stdout (batch_build,
+watch) capture log output too.
+
+With --profile each stage of a run (parse, transform, blobs, xml,
+validate, zip, preview, ...) records:
+
+    wall       elapsed time (time.perf_counter)
+    cpu        process CPU time, all threads (time.process_time)
+    read       bytes read by the process (rchar of /proc/self/io)
+    written    bytes written by the process (wchar of /proc/self/io)
+    peak       tracemalloc peak of Python allocations during the stage,
+               above what was already allocated when it started
+
+Tracing allocations slows Python code, so wall and CPU times are higher
+than in an unprofiled run; compare profiled runs with each other. Byte
+counts are only available where /proc/self/io exists (Linux).
+
+The report is written as profile_report.json and profile_report.txt in
+the output directory. --profile-stage NAME also runs that stage under
+cProfile and writes profile_NAME.prof (read it with ``python -m pstats``).
+
+Usage:
+    profile = new_profile(output_dir, cprofile_stage='transform')
+    with stage(profile, 'parse'):
+        ...
+    write_report(profile)
+"""
+
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+REPORT_NAME = 'profile_report'
+PROC_IO = '/proc/self/io'
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """StreamHandler that always writes to the current sys.stdout."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def setup_logging(verbosity=0):
+    """Log bare messages to stdout: WARNING at -1, INFO at 0, DEBUG at 1 and above."""
+    level = logging.WARNING if verbosity < 0 else logging.DEBUG if verbosity > 0 else logging.INFO
+    root = logging.getLogger()
+    if not any(isinstance(handler, _StdoutHandler) for handler in root.handlers):
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def add_arguments(parser):
+    """Add -v/-q, --profile and --profile-stage to an argparse parser."""
+    parser.add_argument('-v', '--verbose', action='count', default=0, help="more detail (per-card progress)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only warnings and errors")
+    parser.add_argument('--profile', action='store_true',
+                        help="record time, CPU, I/O and peak memory per stage and write profile_report.*")
+    parser.add_argument('--profile-stage', default=None, metavar='STAGE',
+                        help="with --profile, also run STAGE under cProfile (profile_STAGE.prof)")
+
+
+def io_counters():
+    """(bytes read, bytes written) by this process so far, or (None, None)."""
+    try:
+        with open(PROC_IO, 'r') as f:
+            counters = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def new_profile(output_dir, cprofile_stage=None):
+    """Start profiling a run whose report goes to ``output_dir``."""
+    tracemalloc.start()
+    return {'output_dir': output_dir, 'cprofile_stage': cprofile_stage, 'stages': {}, 'peak_bytes': 0,
+            'started': time.perf_counter(), 'cpu_started': time.process_time()}
+
+
+@contextlib.contextmanager
+def stage(profile, name):
+    """Measure the enclosed block as stage ``name``; does nothing when ``profile`` is None.
+
+    A stage entered more than once accumulates its times and byte counts
+    and keeps its highest peak.
+    """
+    if profile is None:
+        yield
+        return
+    profiler = cProfile.Profile() if name == profile['cprofile_stage'] else None
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    read, written = io_counters()
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        absolute_peak = tracemalloc.get_traced_memory()[1]
+        profile['peak_bytes'] = max(profile['peak_bytes'], absolute_peak)
+        peak = absolute_peak - baseline
+        read_after, written_after = io_counters()
+        entry = profile['stages'].setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'read_bytes': None,
+                                                    'written_bytes': None, 'peak_bytes': 0, 'calls': 0})
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        if read is not None and read_after is not None:
+            entry['read_bytes'] = (entry['read_bytes'] or 0) + read_after - read
+            entry['written_bytes'] = (entry['written_bytes'] or 0) + written_after - written
+        entry['peak_bytes'] = max(entry['peak_bytes'], peak)
+        entry['calls'] += 1
+        if profiler:
+            dump_path = os.path.join(profile['output_dir'], f'profile_{name}.prof')
+            profiler.dump_stats(dump_path)
+            profile['cprofile_dump'] = dump_path
+
+
+def _kib(value):
+    return '-' if value is None else f'{value / 1024:.1f}'
+
+
+def write_report(profile):
+    """Stop profiling and write the JSON and text reports; return their paths."""
+    total_wall = time.perf_counter() - profile['started']
+    total_cpu = time.process_time() - profile['cpu_started']
+    total_peak = max(profile['peak_bytes'], tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    stages = profile['stages']
+    hottest = max(stages, key=lambda name: stages[name]['wall']) if stages else None
+    report = {
+        'total': {'wall': total_wall, 'cpu': total_cpu, 'peak_bytes': total_peak},
+        'stages': stages,
+        'hottest': hottest,
+        'cprofile_dump': profile.get('cprofile_dump'),
+    }
+    json_path = os.path.join(profile['output_dir'], REPORT_NAME + '.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+
+    text_path = os.path.join(profile['output_dir'], REPORT_NAME + '.txt')
+    with open(text_path, 'w', encoding='utf-8') as f:
+        f.write('# Profile Report\n\n')
+        f.write(f"{'Stage':<12} {'Wall ms':>10} {'CPU ms':>10} {'Share':>6} {'Read KiB':>10} "
+                f"{'Written KiB':>12} {'Peak KiB':>10}\n")
+        for name, entry in stages.items():
+            share = entry['wall'] / total_wall * 100 if total_wall else 0.0
+            f.write(f"{name:<12} {entry['wall'] * 1000:>10.1f} {entry['cpu'] * 1000:>10.1f} {share:>5.1f}% "
+                    f"{_kib(entry['read_bytes']):>10} {_kib(entry['written_bytes']):>12} "
+                    f"{_kib(entry['peak_bytes']):>10}\n")
+        f.write(f"{'total':<12} {total_wall * 1000:>10.1f} {total_cpu * 1000:>10.1f} {'':>6} {'':>10} {'':>12} "
+                f"{_kib(total_peak):>10}\n\n")
+        f.write('Wall and CPU times include tracemalloc overhead.\n')
+        if hottest:
+            f.write(f'Hottest stage: {hottest}\n')
+        if profile.get('cprofile_dump'):
+            f.write(f"cProfile dump: {profile['cprofile_dump']} (python -m pstats {profile['cprofile_dump']})\n")
+        elif hottest:
+            f.write(f'Rerun with --profile-stage {hottest} for a cProfile dump of it.\n')
+    return json_path, text_path
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Dark-theme Image Recolor Stage
+
+In-process replacement for studyMaterials/update_images.sh. The script
+ran two ImageMagick ``convert -fuzz 20% -fill NEW -opaque OLD`` passes per
+image and overwrote the originals. Here each substitution is one array
+operation over the decoded pixels, applied in palette order exactly like
+the chained convert calls. A pixel matches when its RMS distance to the
+original colour over R, G and B is within ``fuzz`` of full scale, which
+is ImageMagick's fuzz test for RGB images; alpha is left untouched.
+
+Sources are never modified. Results go into the content-addressed blob
+store, and a small index maps (source hash, palette, fuzz) to the result
+blob, so switching themes or rebuilding only recolors images it has not
+seen with that palette. Images are recolored in a process pool.
+
+Requirements (optional, only for this stage):
+    - numpy
+    - Pillow
+
+Usage:
+    python recolor.py image_dir output_dir [--palette OLD=NEW,...] [--fuzz 20]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+
+import blob_store
+from hash_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Same colours and fuzz as update_images.sh: foreground first, then background
+DEFAULT_PALETTE = (('#000000', '#bbc2cf'), ('#ffffff', '#282c34'))
+DEFAULT_FUZZ = 20.0
+
+INDEX_VERSION = 1
+_index_lock = threading.Lock()
+
+
+def parse_palette(value):
+    """Parse 'OLD=NEW,OLD=NEW' into a tuple of (old, new) colour pairs."""
+    pairs = []
+    for item in value.split(','):
+        old, sep, new = item.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"palette entry {item!r} is not OLD=NEW")
+        parse_color(old)
+        parse_color(new)
+        pairs.append((old.strip().lower(), new.strip().lower()))
+    return tuple(pairs)
+
+
+def parse_color(value):
+    """'#rrggbb' to an (r, g, b) tuple of ints."""
+    value = value.strip().lstrip('#')
+    if len(value) != 6:
+        raise argparse.ArgumentTypeError(f"colour {value!r} is not #rrggbb")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def recolor_key(source_hash, palette, fuzz):
+    """Cache key for one source image under one palette and fuzz."""
+    return sha256(json.dumps([source_hash, list(map(list, palette)), fuzz]).encode('utf-8')).hexdigest()
+
+
+def recolor_pixels(pixels, palette, fuzz):
+    """Apply each (old, new) substitution in order to an RGB(A) uint8 array."""
+    import numpy as np
+
+    rgb = pixels[..., :3]
+    # ImageMagick matches when sum of squared channel differences <= 3 * fuzz^2
+    limit = 3.0 * (fuzz / 100.0 * 255.0) ** 2
+    for old, new in palette:
+        diff = rgb.astype(np.int32) - np.array(parse_color(old), dtype=np.int32)
+        mask = np.einsum('...i,...i->...', diff, diff) <= limit
+        rgb[mask] = parse_color(new)
+    return pixels
+
+
+def recolor_file(source_path, target_path, palette, fuzz):
+    """Decode one PNG, recolor it and write the result to ``target_path``."""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        mode = 'RGBA' if image.mode in ('RGBA', 'LA') or 'transparency' in image.info else 'RGB'
+        pixels = np.array(image.convert(mode))
+    recolor_pixels(pixels, palette, fuzz)
+    Image.fromarray(pixels, mode).save(target_path, format='PNG', optimize=False)
+
+
+def _recolor_to_store(source_path, store_dir, palette, fuzz):
+    """Worker: recolor one image into the store and return the result hash."""
+    fd, temp_path = tempfile.mkstemp(dir=store_dir, prefix='.recolor-', suffix='.png')
+    os.close(fd)
+    try:
+        recolor_file(source_path, temp_path, palette, fuzz)
+        hash_id, _, _ = blob_store.put_file(store_dir, temp_path)
+    finally:
+        os.unlink(temp_path)
+    return hash_id
+
+
+def index_path(store_dir):
+    """Location of the (source, palette, fuzz) -> result index."""
+    return os.path.join(store_dir, 'recolor_index.json')
+
+
+def load_index(store_dir):
+    """Load the recolor index, or an empty one."""
+    try:
+        with open(index_path(store_dir), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get('entries', {}) if data.get('version') == INDEX_VERSION else {}
+
+
+def save_index(index, store_dir):
+    """Atomically write the index, merged with entries saved by others."""
+    with _index_lock:
+        merged = load_index(store_dir)
+        merged.update(index)
+        fd, temp_path = tempfile.mkstemp(dir=store_dir, prefix='.recolor_index-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'entries': merged}, f, separators=(',', ':'), sort_keys=True)
+        os.replace(temp_path, index_path(store_dir))
+
+
+def recolor_sources(sources, palette=DEFAULT_PALETTE, fuzz=DEFAULT_FUZZ, store_dir=None, jobs=None):
+    """Recolor images given as {source_hash: path}; return ({source_hash: result_hash}, stats).
+
+    Cached results are reused; only misses are decoded, in a process pool.
+    """
+    store_dir = store_dir or blob_store.default_store_dir()
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_index(store_dir)
+
+    results = {}
+    misses = []
+    for source_hash in sorted(sources):
+        result_hash = index.get(recolor_key(source_hash, palette, fuzz))
+        if result_hash and os.path.exists(blob_store.blob_path(store_dir, result_hash)):
+            results[source_hash] = result_hash
+        else:
+            misses.append(source_hash)
+
+    stats = {'images': len(sources), 'cached': len(results), 'recolored': 0}
+    if misses:
+        try:
+            import numpy  # noqa: F401
+            import PIL  # noqa: F401
+        except ImportError:
+            raise RuntimeError("recoloring needs numpy and Pillow (pip install numpy pillow)")
+
+        new_entries = {}
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {h: pool.submit(_recolor_to_store, sources[h], store_dir, palette, fuzz) for h in misses}
+            for source_hash, future in futures.items():
+                results[source_hash] = future.result()
+                new_entries[recolor_key(source_hash, palette, fuzz)] = results[source_hash]
+        save_index(new_entries, store_dir)
+        stats['recolored'] = len(misses)
+
+    return results, stats
+
+
+def recolor_reference_map(image_reference_map, palette=DEFAULT_PALETTE, fuzz=DEFAULT_FUZZ, store_dir=None):
+    """Point every PNG in an image reference map at its recolored blob."""
+    store_dir = store_dir or blob_store.default_store_dir()
+    sources = {info['hash_id']: info['stored_path'] for info in image_reference_map.values()
+               if info['file_extension'].lower() == '.png'}
+    results, stats = recolor_sources(sources, palette, fuzz, store_dir)
+
+    recolored = {}
+    for image_base, info in image_reference_map.items():
+        result_hash = results.get(info['hash_id'])
+        if result_hash is None:
+            recolored[image_base] = info
+        else:
+            recolored[image_base] = dict(info, hash_id=result_hash,
+                                         stored_path=blob_store.blob_path(store_dir, result_hash))
+    return recolored, stats
+
+
+def main():
+    from profiling import setup_logging
+    parser = argparse.ArgumentParser(description="Recolor PNG diagrams for a dark theme without touching the sources.")
+    parser.add_argument('image_dir', help="directory of source PNGs (left unchanged)")
+    parser.add_argument('output_dir', help="directory to receive the recolored PNGs")
+    parser.add_argument('--palette', type=parse_palette, default=DEFAULT_PALETTE,
+                        help="comma-separated OLD=NEW colour substitutions, applied in order")
+    parser.add_argument('--fuzz', type=float, default=DEFAULT_FUZZ, help="match tolerance in percent (default 20)")
+    args = parser.parse_args()
+    setup_logging()
+
+    store_dir = blob_store.default_store_dir()
+    names = sorted(n for n in os.listdir(args.image_dir) if n.lower().endswith('.png'))
+    sources = {}
+    hash_by_name = {}
+    for name in names:
+        path = os.path.join(args.image_dir, name)
+        hash_by_name[name] = file_sha256(path)
+        sources[hash_by_name[name]] = path
+
+    try:
+        results, stats = recolor_sources(sources, args.palette, args.fuzz, store_dir)
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in names:
+        stored_path = blob_store.blob_path(store_dir, results[hash_by_name[name]])
+        blob_store.materialize(stored_path, os.path.join(args.output_dir, name))
+
+    logger.info("Recolored %s images (%s cached, %s new) into %s",
+                stats['images'], stats['cached'], stats['recolored'], args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
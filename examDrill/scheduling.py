@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Org-drill Review Scheduling
+
+Reads the review state org-drill keeps on each card (the SCHEDULED
+planning line and the DRILL_* properties) into a compact column store,
+projects next intervals for the whole deck in one vectorized batch, and
+keeps a heap-ordered due index for queue queries.
+
+Store: a dict of parallel ``array`` columns, one row per card:
+
+    ease      DRILL_EASE (2.5 for new cards)
+    interval  DRILL_LAST_INTERVAL in days (0 for new, < 0 after a failure)
+    repeats   DRILL_REPEATS_SINCE_FAIL
+    failures  DRILL_FAILURE_COUNT
+    quality   DRILL_LAST_QUALITY (0-5, -1 for new)
+    due       due day as a date ordinal, NEW_CARD for never-reviewed cards
+
+A card's due day is its SCHEDULED date, else its last review plus its
+interval; new cards are due today. Projections follow org-drill's SM-2
+(org-drill-determine-next-interval-sm2) or FSRS-4.5 with its default
+weights. FSRS stability and difficulty are seeded from the SM-2 state,
+since that is all org-drill records. numpy is used when installed and
+reads the arrays in place; otherwise the same maths runs per row.
+
+Due index: a binary heap of (due, row) plus a count of cards per due day.
+"Next N due" and "due by day D" walk the heap with a small frontier
+heap, so they cost O(k log k) for k results regardless of deck size;
+"how many are due" sums the per-day counts. Rescheduling pushes a new
+entry and stale ones are skipped.
+"""
+
+import heapq
+import math
+import re
+from array import array
+from datetime import date
+
+NEW_CARD = 2 ** 31 - 1
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+FAILURE_QUALITY = 2
+
+# FSRS-4.5 default parameters
+FSRS_WEIGHTS = (0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+                0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755)
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 19 / 81
+REQUEST_RETENTION = 0.9
+
+ALGORITHMS = ('sm2', 'fsrs')
+
+ORG_DATE_RE = re.compile(r'[<\[](\d{4})-(\d{2})-(\d{2})[^>\]]*[>\]]')
+# The SCHEDULED keyword and its timestamp; group 1 is set only for an active one
+SCHEDULED_RE = re.compile(r'SCHEDULED:[ \t]*(?:(<[^>\n]*>)|\[[^\]\n]*\])?')
+
+
+def parse_org_date(timestamp):
+    """Date ordinal of an org timestamp like <2024-06-28 Fri> or [2024-06-23 Sun 14:05], or None."""
+    match = ORG_DATE_RE.search(timestamp or '')
+    if not match:
+        return None
+    try:
+        return date(*map(int, match.groups())).toordinal()
+    except ValueError:
+        return None
+
+
+def format_org_date(ordinal):
+    """An active org timestamp for a date ordinal: <2024-06-28 Fri>."""
+    day = date.fromordinal(ordinal)
+    return f'<{day.isoformat()} {day.strftime("%a")}>'
+
+
+def _number(properties, name, default, convert=float):
+    try:
+        return convert(properties.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def new_store():
+    """Empty column store."""
+    return {
+        'keys': [],
+        'ease': array('d'),
+        'interval': array('d'),
+        'repeats': array('i'),
+        'failures': array('i'),
+        'quality': array('i'),
+        'due': array('q'),
+    }
+
+
+def add_card(store, key, properties, scheduled, today):
+    """Append one card's review state; returns its row."""
+    interval = _number(properties, 'DRILL_LAST_INTERVAL', 0.0)
+    reviewed = 'DRILL_LAST_INTERVAL' in properties or scheduled
+
+    due = parse_org_date(scheduled)
+    if due is None and reviewed:
+        # Some org-drill versions wrote DRILL_LAST_REVIEWED as "[Y-06-23 Sun 14:%]",
+        # so fall back to treating the card as reviewed today
+        last_reviewed = parse_org_date(properties.get('DRILL_LAST_REVIEWED')) or today
+        due = last_reviewed + max(0, round(interval))
+    elif due is None:
+        due = NEW_CARD
+
+    store['keys'].append(key)
+    store['ease'].append(_number(properties, 'DRILL_EASE', DEFAULT_EASE))
+    store['interval'].append(interval)
+    store['repeats'].append(_number(properties, 'DRILL_REPEATS_SINCE_FAIL', 0, int))
+    store['failures'].append(_number(properties, 'DRILL_FAILURE_COUNT', 0, int))
+    store['quality'].append(_number(properties, 'DRILL_LAST_QUALITY', -1, int) if reviewed else -1)
+    store['due'].append(due)
+    return len(store['keys']) - 1
+
+
+def load_store(cards, today=None):
+    """Build the store from shared cards carrying ``review`` state (see org_to_deck)."""
+    today = today or date.today().toordinal()
+    store = new_store()
+    for card in cards:
+        review = card.get('review') or {}
+        add_card(store, card.get('org_id') or card['id'], review.get('properties', {}),
+                 review.get('scheduled'), today)
+    return store
+
+
+def effective_due(store, row, today):
+    """Due day of a row, with new cards due ``today``."""
+    due = store['due'][row]
+    return today if due == NEW_CARD else due
+
+
+# ---------------------------------------------------------------------------
+# Batch projections
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def sm2_project(store, quality):
+    """Next (interval, ease) per row for a review of the given quality.
+
+    ``quality`` is an int for every row or a sequence with one per row.
+    Matches org-drill: a failure (quality <= 2) resets the interval to -1
+    and keeps the ease; otherwise the ease is adjusted, and the interval is
+    1 day while DRILL_REPEATS_SINCE_FAIL is at most 1, 6 days at 2, and
+    the last interval times the new ease after that.
+    """
+    np = _numpy()
+    if np is not None:
+        ease = np.frombuffer(store['ease'], dtype=np.float64)
+        last = np.frombuffer(store['interval'], dtype=np.float64)
+        n = np.frombuffer(store['repeats'], dtype=np.int32)
+        q = np.broadcast_to(np.asarray(quality, dtype=np.float64), ease.shape)
+
+        miss = 5.0 - q
+        next_ease = np.where(ease < MIN_EASE, MIN_EASE, ease + (0.1 - miss * (0.08 + miss * 0.02)))
+        interval = np.where(n <= 1, 1.0, np.where(n == 2, 6.0, last * next_ease))
+        failed = q <= FAILURE_QUALITY
+        return np.where(failed, -1.0, interval), np.where(failed, ease, next_ease)
+
+    qualities = [quality] * len(store['keys']) if isinstance(quality, int) else list(quality)
+    intervals, eases = array('d'), array('d')
+    for ease, last, repeats, q in zip(store['ease'], store['interval'], store['repeats'], qualities):
+        if q <= FAILURE_QUALITY:
+            intervals.append(-1.0)
+            eases.append(ease)
+            continue
+        miss = 5.0 - q
+        next_ease = MIN_EASE if ease < MIN_EASE else ease + (0.1 - miss * (0.08 + miss * 0.02))
+        intervals.append(1.0 if repeats <= 1 else 6.0 if repeats == 2 else last * next_ease)
+        eases.append(next_ease)
+    return intervals, eases
+
+
+def _fsrs_grade(quality):
+    """Org-drill quality 0-5 to an FSRS grade 1-4 (Again, Hard, Good, Easy)."""
+    return 1 if quality <= FAILURE_QUALITY else quality - 1
+
+
+def _fsrs_difficulty_from_ease(ease):
+    """Seed FSRS difficulty from an SM-2 ease: 2.5 is average, 1.3 is hardest."""
+    w = FSRS_WEIGHTS
+    return min(10.0, max(1.0, w[4] + (DEFAULT_EASE - ease) * (10.0 - w[4]) / (DEFAULT_EASE - MIN_EASE)))
+
+
+def _fsrs_next(stability, difficulty, grade, new):
+    """One FSRS-4.5 step reviewed at the due date; returns (stability, difficulty)."""
+    w = FSRS_WEIGHTS
+    if new:
+        return w[grade - 1], min(10.0, max(1.0, w[4] - (grade - 3) * w[5]))
+
+    d0_good = w[4]
+    difficulty = difficulty - w[6] * (grade - 3)
+    difficulty = min(10.0, max(1.0, w[7] * d0_good + (1 - w[7]) * difficulty))
+    retrievability = REQUEST_RETENTION
+    if grade == 1:
+        stability = (w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+                     * math.exp(w[14] * (1 - retrievability)))
+    else:
+        hard = w[15] if grade == 2 else 1.0
+        easy = w[16] if grade == 4 else 1.0
+        stability = stability * (math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                                 * (math.exp(w[10] * (1 - retrievability)) - 1) * hard * easy + 1)
+    return stability, difficulty
+
+
+def fsrs_interval(stability):
+    """Days until retrievability falls to REQUEST_RETENTION."""
+    return max(1.0, stability / FSRS_FACTOR * (REQUEST_RETENTION ** (1 / FSRS_DECAY) - 1))
+
+
+def fsrs_project(store, quality):
+    """Next (interval, difficulty) per row with FSRS-4.5, seeded from the SM-2 state."""
+    np = _numpy()
+    if np is not None:
+        w = FSRS_WEIGHTS
+        ease = np.frombuffer(store['ease'], dtype=np.float64)
+        new = np.frombuffer(store['due'], dtype=np.int64) == NEW_CARD
+        stability = np.maximum(0.1, np.frombuffer(store['interval'], dtype=np.float64))
+        q = np.broadcast_to(np.asarray(quality, dtype=np.int64), ease.shape)
+        grade = np.where(q <= FAILURE_QUALITY, 1, q - 1)
+
+        difficulty = np.clip(w[4] + (DEFAULT_EASE - ease) * (10.0 - w[4]) / (DEFAULT_EASE - MIN_EASE), 1.0, 10.0)
+        difficulty = np.clip(w[7] * w[4] + (1 - w[7]) * (difficulty - w[6] * (grade - 3)), 1.0, 10.0)
+        lapse = 1 - REQUEST_RETENTION
+        forget = w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1) * math.exp(w[14] * lapse)
+        bonus = np.where(grade == 2, w[15], 1.0) * np.where(grade == 4, w[16], 1.0)
+        recall = stability * (math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                              * (math.exp(w[10] * lapse) - 1) * bonus + 1)
+        stability = np.where(grade == 1, forget, recall)
+
+        first = np.asarray(w[:4])[grade - 1]
+        stability = np.where(new, first, stability)
+        difficulty = np.where(new, np.clip(w[4] - (grade - 3) * w[5], 1.0, 10.0), difficulty)
+        interval = np.maximum(1.0, stability / FSRS_FACTOR * (REQUEST_RETENTION ** (1 / FSRS_DECAY) - 1))
+        return interval, difficulty
+
+    qualities = [quality] * len(store['keys']) if isinstance(quality, int) else list(quality)
+    intervals, difficulties = array('d'), array('d')
+    for ease, last, q, due in zip(store['ease'], store['interval'], qualities, store['due']):
+        new = due == NEW_CARD
+        stability = max(0.1, last)
+        stability, difficulty = _fsrs_next(stability, _fsrs_difficulty_from_ease(ease), _fsrs_grade(q), new)
+        intervals.append(fsrs_interval(stability))
+        difficulties.append(difficulty)
+    return intervals, difficulties
+
+
+def project(store, quality=4, algorithm='sm2'):
+    """Next intervals for every row if reviewed at its due date with ``quality``."""
+    if algorithm == 'fsrs':
+        return fsrs_project(store, quality)
+    return sm2_project(store, quality)
+
+
+# ---------------------------------------------------------------------------
+# Due index
+
+def build_due_index(store, today=None):
+    """Heap of (due, row) over the whole store, plus a per-day card count."""
+    today = today or date.today().toordinal()
+    heap = [(effective_due(store, row, today), row) for row in range(len(store['keys']))]
+    counts = {}
+    for due, _ in heap:
+        counts[due] = counts.get(due, 0) + 1
+    heapq.heapify(heap)
+    return {'heap': heap, 'counts': counts, 'today': today}
+
+
+def reschedule(store, index, row, due):
+    """Move a row to a new due day; the old heap entry becomes stale."""
+    counts = index['counts']
+    old = effective_due(store, row, index['today'])
+    counts[old] -= 1
+    if not counts[old]:
+        del counts[old]
+    counts[due] = counts.get(due, 0) + 1
+    store['due'][row] = due
+    heapq.heappush(index['heap'], (due, row))
+
+
+def _walk(store, index, limit=None, until=None):
+    """Yield live (due, row) entries in due order without popping the heap."""
+    heap = index['heap']
+    if not heap:
+        return
+    today = index['today']
+    frontier = [(heap[0], 0)]
+    seen = set()
+    produced = 0
+    while frontier:
+        (due, row), position = heapq.heappop(frontier)
+        if until is not None and due > until:
+            return
+        for child in (2 * position + 1, 2 * position + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+        if row in seen or effective_due(store, row, today) != due:
+            continue  # stale entry left by reschedule
+        seen.add(row)
+        yield due, row
+        produced += 1
+        if limit is not None and produced >= limit:
+            return
+
+
+def next_due(store, index, n):
+    """The ``n`` earliest-due rows as [(due, row)]."""
+    return list(_walk(store, index, limit=n))
+
+
+def due_by(store, index, day):
+    """Every row due on or before ``day`` as [(due, row)]."""
+    return list(_walk(store, index, until=day))
+
+
+def due_count(index, day):
+    """Number of rows due on or before ``day``; cost grows with distinct due days only."""
+    return sum(count for due, count in index['counts'].items() if due <= day)
+
+
+# ---------------------------------------------------------------------------
+# Export and write-back
+
+def card_schedule(store, row, today):
+    """Export fields for one row: due date (ISO), interval in days and ease."""
+    due = store['due'][row]
+    return {
+        'due': date.fromordinal(effective_due(store, row, today)).isoformat(),
+        'interval': max(0, round(store['interval'][row])),
+        'ease': store['ease'][row],
+        'new': due == NEW_CARD,
+    }
+
+
+def write_back(path, due_by_line):
+    """Set the SCHEDULED date under each given card headline in an org file.
+
+    ``due_by_line`` maps 1-based headline line numbers to date ordinals.
+    An existing SCHEDULED timestamp is replaced (keeping other planning
+    keywords on the line), a SCHEDULED: keyword without an active timestamp
+    gets one, and otherwise a planning line is inserted. Returns
+    the number of cards whose date changed. Line endings are preserved.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        lines = f.readlines()
+    eol = '\r\n' if lines and lines[0].endswith('\r\n') else '\n'
+
+    changed = 0
+    for line_no in sorted(due_by_line, reverse=True):
+        stamp = format_org_date(due_by_line[line_no])
+        below = line_no  # index of the line after the headline
+        if below < len(lines) and 'SCHEDULED:' in lines[below] and not lines[below].lstrip().startswith('*'):
+            old = lines[below]
+            scheduled = SCHEDULED_RE.search(old)
+            if parse_org_date(scheduled.group(1)) != due_by_line[line_no]:
+                lines[below] = old[:scheduled.start()] + f'SCHEDULED: {stamp}' + old[scheduled.end():]
+                changed += 1
+        else:
+            lines.insert(below, f'SCHEDULED: {stamp}{eol}')
+            changed += 1
+
+    if changed:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(lines)
+    return changed
+
+
+def describe_due(store, index, today, count=5):
+    """Short text summary: cards due today and the next few due."""
+    lines = [f"Due today or overdue: {due_count(index, today)} of {len(store['keys'])} cards"]
+    for due, row in next_due(store, index, count):
+        lines.append(f"  {date.fromordinal(due).isoformat()}  {store['keys'][row]}")
+    return '\n'.join(lines)
+
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Card Search Index
+
+A persistent inverted index over card fronts, backs, tags and math, so
+"every card about the slope of a line" or "every card using \\Delta h" is
+one query instead of a grep through raw org files. Results come back as
+ranked cards with their Problem_N tag and source file.
+
+Cards come from org_to_deck.load_deck, the same extraction the converters
+use. Terms are:
+
+    front, back   words and numbers outside math, lowercased (Problem_5
+                  stays one word)
+    tags          each tag, lowercased
+    math          tokens inside math fragments plus each adjacent pair
+                  ("\\Delta h"), so formula queries match the formula
+
+LaTeX control sequences are terms of their own and keep their case
+(\\Delta is not \\delta). Greek letters typed as Unicode are read as
+their control sequence, so Δh in prose and \\(\\Delta h\\) both match
+a query for \\Delta h; in prose, pairs next to a symbol are terms too.
+
+The index is a SQLite file of (term, card, field, tf) postings clustered
+by term. It is updated per card: a card whose source hash (see
+build_manifest.py) is unchanged is left alone, changed cards have their
+postings replaced, and cards gone from a file are dropped. Queries are
+ranked with BM25 over the field-weighted term frequencies.
+
+Usage:
+    python search_index.py build input.org [more.org ...] [--index search_index.sqlite]
+    python search_index.py query "slope of a line" [--index search_index.sqlite] [-n 10]
+    python search_index.py query '\\Delta h'
+"""
+
+import argparse
+import logging
+import math
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from collections import Counter
+
+from build_manifest import card_key
+from markup import IMAGE_RE, find_math
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX = 'search_index.sqlite'
+INDEX_VERSION = '1'
+
+FIELDS = ('front', 'back', 'tags', 'math')
+FRONT, BACK, TAGS, MATH = range(len(FIELDS))
+FIELD_WEIGHTS = (1.0, 0.7, 2.0, 1.5)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TERM_RE = re.compile(r'\\[A-Za-z]+|[^\W\d_]\w*|\d+(?:\.\d+)?')
+MATH_DELIMITERS_RE = re.compile(r'^(?:\\\(|\\\[|\$)|(?:\\\)|\\\]|\$)$')
+SNIPPET_LENGTH = 100
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, source TEXT NOT NULL,
+    number INTEGER NOT NULL, org_id TEXT, tag TEXT NOT NULL, source_hash TEXT NOT NULL,
+    length REAL NOT NULL, snippet TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cards_source ON cards (source);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL, card INTEGER NOT NULL, field INTEGER NOT NULL, tf INTEGER NOT NULL,
+    PRIMARY KEY (term, card, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_card ON postings (card);
+'''
+
+
+def greek_sequences():
+    """Map Greek letters to their LaTeX control sequences (Δ -> \\Delta)."""
+    table = {}
+    for code in range(0x391, 0x3ca):
+        name = unicodedata.name(chr(code), '')
+        if name.startswith('GREEK CAPITAL LETTER ') and ' ' not in name[21:]:
+            table[chr(code)] = ' \\' + name[21:].capitalize() + ' '
+        elif name.startswith('GREEK SMALL LETTER ') and ' ' not in name[19:]:
+            table[chr(code)] = ' \\' + name[19:].lower() + ' '
+    return str.maketrans(table)
+
+
+GREEK = greek_sequences()
+
+
+def tokens(text):
+    """Word, number and control-sequence tokens; only control sequences keep their case."""
+    return [t if t.startswith('\\') else t.lower() for t in TERM_RE.findall(text.translate(GREEK))]
+
+
+def text_terms(text):
+    """Terms of prose: its tokens, plus the pairs that start or end with a symbol."""
+    words = tokens(text)
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:]) if a[0] == '\\' or b[0] == '\\']
+
+
+def math_terms(fragment):
+    """Terms of one math fragment: its tokens and every adjacent pair."""
+    words = tokens(MATH_DELIMITERS_RE.sub('', fragment))
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def split_field(text):
+    """(text terms, math terms) of a raw org field."""
+    text = IMAGE_RE.sub(' ', text)
+    terms = []
+    for fragment in find_math(text):
+        terms.extend(math_terms(fragment))
+        text = text.replace(fragment, ' ', 1)
+    return text_terms(text), terms
+
+
+def card_terms(card):
+    """Counter of (term, field) for one shared card."""
+    front, front_math = split_field(card['question'])
+    back, back_math = split_field(card['answer'])
+    counts = Counter()
+    counts.update((t, FRONT) for t in front)
+    counts.update((t, BACK) for t in back)
+    counts.update((t.lower(), TAGS) for t in card['tags'].split(',') if t)
+    counts.update((t, MATH) for t in front_math + back_math)
+    return counts
+
+
+def query_terms(query):
+    """Terms of a query. A query with a bare control sequence and no math
+    delimiters (``\\Delta h``) is read as one formula.
+    """
+    text, terms = split_field(query)
+    if not terms and '\\' in query:
+        return math_terms(query)
+    return text + terms
+
+
+def snippet(text):
+    """Short one-line preview of a card front."""
+    text = ' '.join(IMAGE_RE.sub('[image]', text).split())
+    return text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 3] + '...'
+
+
+def open_index(index_path):
+    """Open (creating if needed) the index; a different version is rebuilt."""
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if row is None or row[0] != INDEX_VERSION:
+        with conn:
+            conn.execute('DELETE FROM postings')
+            conn.execute('DELETE FROM cards')
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+    return conn
+
+
+def _delete_cards(conn, ids):
+    conn.executemany('DELETE FROM postings WHERE card = ?', [(i,) for i in ids])
+    conn.executemany('DELETE FROM cards WHERE id = ?', [(i,) for i in ids])
+
+
+def update_index(index_path, input_file, cards=None):
+    """Bring the index up to date with one org file; return (added, changed, removed, unchanged).
+
+    ``cards`` may be passed when the caller already parsed the file.
+    """
+    if cards is None:
+        import org_to_deck
+        with open(input_file, 'r', encoding='utf-8') as f:
+            cards = org_to_deck.load_deck(f.read())
+    source = os.path.abspath(input_file)
+
+    conn = open_index(index_path)
+    try:
+        existing = {key: (card_id, digest) for card_id, key, digest in
+                    conn.execute('SELECT id, key, source_hash FROM cards WHERE source = ?', (source,))}
+        current = {f'{source}::{card_key(card)}': card for card in cards}
+
+        added = changed = unchanged = 0
+        stale = [existing[key][0] for key in existing.keys() - current.keys()]
+        with conn:
+            _delete_cards(conn, stale)
+            for key, card in current.items():
+                previous = existing.get(key)
+                if previous and previous[1] == card['source_hash']:
+                    unchanged += 1
+                    continue
+                if previous:
+                    _delete_cards(conn, [previous[0]])
+                    changed += 1
+                else:
+                    added += 1
+
+                counts = card_terms(card)
+                length = sum(FIELD_WEIGHTS[field] * tf for (_, field), tf in counts.items())
+                cursor = conn.execute(
+                    'INSERT INTO cards (key, source, number, org_id, tag, source_hash, length, snippet) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, source, card['id'], card['org_id'], f"Problem_{card['id']}",
+                     card['source_hash'], length, snippet(card['question'])))
+                conn.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)',
+                                 [(term, cursor.lastrowid, field, tf) for (term, field), tf in counts.items()])
+    finally:
+        conn.close()
+    return added, changed, len(stale), unchanged
+
+
+def search(index_path, query, limit=10):
+    """Rank cards for ``query``; return a list of result dicts, best first."""
+    wanted = list(dict.fromkeys(query_terms(query)))
+    if not wanted:
+        return []
+
+    conn = sqlite3.connect(index_path)
+    try:
+        card_count, total_length = conn.execute('SELECT COUNT(*), TOTAL(length) FROM cards').fetchone()
+        if not card_count:
+            return []
+        average_length = total_length / card_count
+        lengths = {}
+
+        scores = Counter()
+        for term in wanted:
+            weighted = Counter()
+            for card_id, field, tf in conn.execute('SELECT card, field, tf FROM postings WHERE term = ?', (term,)):
+                weighted[card_id] += FIELD_WEIGHTS[field] * tf
+            if not weighted:
+                continue
+            idf = math.log(1 + (card_count - len(weighted) + 0.5) / (len(weighted) + 0.5))
+            missing = [c for c in weighted if c not in lengths]
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                lengths.update(conn.execute(
+                    f'SELECT id, length FROM cards WHERE id IN ({",".join("?" * len(chunk))})', chunk))
+            for card_id, wtf in weighted.items():
+                norm = K1 * (1 - B + B * lengths[card_id] / average_length)
+                scores[card_id] += idf * wtf * (K1 + 1) / (wtf + norm)
+
+        results = []
+        for card_id, score in scores.most_common(limit):
+            key, source, number, org_id, tag, text_snippet = conn.execute(
+                'SELECT key, source, number, org_id, tag, snippet FROM cards WHERE id = ?', (card_id,)).fetchone()
+            results.append({'key': key, 'source': source, 'id': number, 'org_id': org_id, 'tag': tag,
+                            'score': round(score, 4), 'snippet': text_snippet})
+        return results
+    finally:
+        conn.close()
+
+
+def main():
+    from profiling import setup_logging
+
+    parser = argparse.ArgumentParser(description="Build and query the card search index.")
+    parser.add_argument('--index', default=DEFAULT_INDEX, help=f"index file (default {DEFAULT_INDEX})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="index or re-index org files")
+    build.add_argument('inputs', nargs='+', help="org-drill files")
+    query = commands.add_parser('query', help="search the index")
+    query.add_argument('query', help="words, tags or math, e.g. 'slope of a line' or '\\Delta h'")
+    query.add_argument('-n', '--limit', type=int, default=10, help="number of results (default 10)")
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.command == 'build':
+        for input_file in args.inputs:
+            if not os.path.exists(input_file):
+                logger.error("Error: Input file %s not found", input_file)
+                sys.exit(1)
+            added, changed, removed, unchanged = update_index(args.index, input_file)
+            logger.info("%s: %s added, %s changed, %s removed, %s unchanged",
+                        input_file, added, changed, removed, unchanged)
+        return
+
+    if not os.path.exists(args.index):
+        logger.error("Error: Index %s not found; run 'build' first", args.index)
+        sys.exit(1)
+    start = time.perf_counter()
+    results = search(args.index, args.query, args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for result in results:
+        logger.info("%8.3f  %-12s %s  %s", result['score'], result['tag'], os.path.basename(result['source']),
+                    result['snippet'])
+    logger.info("%s result(s) in %.1f ms", len(results), elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Checks for the .apkg package apkg_export writes.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apkg_export import stable_id, write_apkg
+
+CARDS = [
+    {'front': 'Slope of <b>y = 2x</b>?', 'back': '2', 'tags': 'Problem_1,Math', 'guid': 'g1',
+     'media': ['slope.png']},
+    {'front': 'Units of stress?', 'back': 'Pa', 'tags': 'Problem_2', 'guid': 'g2', 'media': ['missing.png']},
+    {'front': 'Due soon', 'back': 'Yes', 'tags': 'Problem_3', 'guid': 'g3', 'media': [],
+     'schedule': {'due': '2030-01-02', 'interval': 6, 'ease': 2.5, 'new': False}},
+]
+
+
+def test_package_has_schema_11_collection_and_media(tmp_path):
+    images = tmp_path / 'images'
+    images.mkdir()
+    (images / 'slope.png').write_bytes(b'\x89PNG slope')
+
+    apkg_path = write_apkg(CARDS, str(tmp_path), str(images))
+    assert sorted(os.listdir(tmp_path)) == ['anki_import.apkg', 'images']
+    with zipfile.ZipFile(apkg_path) as apkg:
+        assert json.loads(apkg.read('media')) == {'0': 'slope.png'}
+        assert apkg.read('0') == b'\x89PNG slope'
+        (tmp_path / 'collection.anki2').write_bytes(apkg.read('collection.anki2'))
+
+    conn = sqlite3.connect(str(tmp_path / 'collection.anki2'))
+    try:
+        assert conn.execute('SELECT ver FROM col').fetchone() == (11,)
+        assert str(stable_id('Mechanical Engineering Exam')) in json.loads(
+            conn.execute('SELECT decks FROM col').fetchone()[0])
+        notes = conn.execute('SELECT guid, tags, flds, sfld FROM notes ORDER BY id').fetchall()
+        assert len(notes) == len(CARDS)
+        assert notes[0] == ('g1', ' Problem_1 Math ', 'Slope of <b>y = 2x</b>?\x1f2', 'Slope of y = 2x?')
+        assert conn.execute('SELECT type, queue, ivl, factor FROM cards ORDER BY id').fetchall() == [
+            (0, 0, 0, 0), (0, 0, 0, 0), (2, 2, 6, 2500)]
+    finally:
+        conn.close()
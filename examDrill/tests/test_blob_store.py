@@ -0,0 +1,42 @@
+"""
+Checks for blob_store's content addressing and materialization.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+from hashlib import sha256
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_store import blob_path, materialize, put_file
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = str(tmp_path / 'store')
+    first, second = tmp_path / 'a.png', tmp_path / 'b.png'
+    first.write_bytes(b'\x89PNG same bytes')
+    second.write_bytes(b'\x89PNG same bytes')
+
+    hash_id, stored_path, added = put_file(store, str(first))
+    assert hash_id == sha256(b'\x89PNG same bytes').hexdigest()
+    assert stored_path == blob_path(store, hash_id) == os.path.join(store, hash_id[:2], hash_id)
+    assert added
+    assert put_file(store, str(second)) == (hash_id, stored_path, False)
+    assert os.stat(stored_path).st_mode & 0o777 == 0o444
+
+
+def test_materialize_links_and_is_idempotent(tmp_path):
+    source = tmp_path / 'diagram.png'
+    source.write_bytes(b'diagram')
+    _, stored_path, _ = put_file(str(tmp_path / 'store'), str(source))
+
+    target = str(tmp_path / 'out' / 'diagram.png')
+    os.makedirs(os.path.dirname(target))
+    # Store and output share a filesystem here, so the blob is hardlinked
+    assert materialize(stored_path, target) == 'hardlink'
+    assert materialize(stored_path, target) == 'existing'
+    with open(target, 'rb') as f:
+        assert f.read() == b'diagram'
@@ -0,0 +1,49 @@
+"""
+Checks for card_cache's cards.bin format.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from card_cache import (DIALECTS, close_cache, find_card, is_current, iter_cards, load_current, open_cache,
+                        read_card, write_cache)
+from org_to_deck import load_deck
+
+ORG = (':PROPERTIES:\n:ID:       deck\n:END:\n'
+       '*** 1 :drill:\n:PROPERTIES:\n:ID:       id-1\n:DRILL_EASE: 2.5\n:END:\n\n'
+       'Find \\(\\Delta h\\) for [[file:images/000001.png]].\n\n**** \n\n*Answer* 1.\n\n'
+       '*** 2 :drill:\n\nNo ID, ünïcode question?\n\n**** \n\nAnswer 2.\n')
+
+
+def test_cards_round_trip_and_are_found_by_key(tmp_path):
+    cards = load_deck(ORG, DIALECTS)
+    path = str(tmp_path / 'cards.bin')
+    write_cache(path, cards, ORG)
+
+    cache = open_cache(path)
+    try:
+        assert list(iter_cards(cache)) == cards
+        assert read_card(cache, 1) == cards[1]
+        assert cards[1]['org_id'] is None
+        assert find_card(cache, 'id-1') == cards[0]
+        assert find_card(cache, f"number:{cards[1]['id']}") == cards[1]
+        assert find_card(cache, 'id-404') is None
+        assert is_current(cache, ORG, DIALECTS)
+        assert not is_current(cache, ORG + '\n', DIALECTS)
+    finally:
+        close_cache(cache)
+
+    assert load_current(path, ORG, DIALECTS) == cards
+    assert load_current(path, ORG.replace('Answer 2', 'Answer two'), DIALECTS) is None
+
+
+def test_garbage_is_not_a_cache(tmp_path):
+    path = tmp_path / 'cards.bin'
+    path.write_bytes(b'not a card cache')
+    assert open_cache(str(path)) is None
+    assert load_current(str(tmp_path / 'missing.bin'), ORG) is None
@@ -0,0 +1,46 @@
+"""
+Checks for deck_lint on generated AnkiApp packages.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deck_lint import lint_cards, lint_xml
+from org_to_anki_xml import write_anki_xml
+
+
+def codes(findings):
+    return sorted((item['code'], item['card']) for item in findings)
+
+
+def test_zip_with_a_missing_blob(tmp_path):
+    cards = [{'front': 'Beam <img id="aaa" />', 'back': 'A', 'tags': 'Problem_1'},
+             {'front': 'Truss <img id="bbb" />', 'back': 'B', 'tags': 'Problem_2'},
+             {'front': 'Clean', 'back': '<tex>x^2</tex>', 'tags': 'Problem_3'}]
+    chunks = []
+    write_anki_xml(chunks.append, cards)
+    zip_path = str(tmp_path / 'anki_import.zip')
+    with zipfile.ZipFile(zip_path, 'w') as zip_file:
+        zip_file.writestr('anki_import.xml', ''.join(chunks))
+        zip_file.writestr('blobs/aaa', b'png')
+        zip_file.writestr('blobs/ccc', b'png')
+
+    findings = lint_xml(zip_path, card_lines={'2': 40})
+    assert codes(findings) == [('missing-blob', '2'), ('unused-blob', None)]
+    missing = [item for item in findings if item['code'] == 'missing-blob'][0]
+    assert (missing['severity'], missing['line']) == ('error', 40)
+
+
+def test_card_stream_flags_unresolved_images_and_math():
+    references = {'000001': {'hash_id': 'aaa', 'stored_path': '/store/aa/aaa'}}
+    cards = [{'id': '1', 'line': 3, 'front': 'Found <img id="000001.png" />', 'back': 'A', 'tags': 'Problem_1'},
+             {'id': '2', 'line': 9, 'front': 'Lost <img id="000002.png" />', 'back': 'B', 'tags': 'Problem_2'},
+             {'id': '3', 'line': 15, 'front': 'Raw \\(x\\)', 'back': 'C', 'tags': 'Problem 3'}]
+    assert codes(lint_cards(cards, references)) == [
+        ('missing-image', '2'), ('tag-characters', '3'), ('unrendered-math', '3')]
@@ -0,0 +1,68 @@
+"""
+Checks for deck_shards' package planning.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deck_shards import BLOB_OVERHEAD, CARD_OVERHEAD, parse_split, plan_shards
+
+BLOB_SIZE = 1000
+
+
+def card(number, image=None):
+    front = f'Question {number} <img id="{image}.png" />' if image else f'Question {number}'
+    return {'id': number, 'front': front, 'back': f'Answer {number}'}
+
+
+def text_size(card):
+    return len(card['front']) + len(card['back']) + CARD_OVERHEAD
+
+
+def reference_map(tmp_path, *names):
+    references = {}
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(name.encode() * (BLOB_SIZE // len(name)))
+        references[name] = {'hash_id': 'hash-' + name, 'stored_path': str(path)}
+    return references
+
+
+def positions(shards):
+    return [shard['positions'] for shard in shards]
+
+
+def test_card_budget_cuts_oversized_headings_only():
+    cards = [card(n) for n in range(5)]
+    headings = ['Exam 1', 'Exam 1', 'Exam 1', 'Exam 2', 'Exam 3']
+    shards = plan_shards(cards, parse_split('heading,cards=2'), {}, headings)
+    assert positions(shards) == [[0, 1], [2, 3], [4]]
+    assert [shard['headings'] for shard in shards] == [['Exam 1'], ['Exam 1', 'Exam 2'], ['Exam 3']]
+    assert positions(plan_shards(cards, parse_split('heading'), {}, headings)) == [[0, 1, 2], [3], [4]]
+
+
+def test_byte_budget_counts_shared_blobs_once(tmp_path):
+    references = reference_map(tmp_path, 'x', 'y')
+    cards = [card(0, 'x'), card(1, 'x'), card(2, 'y')]
+    blob = BLOB_SIZE + BLOB_OVERHEAD
+    shards = plan_shards(cards, parse_split('bytes=2000'), references)
+
+    assert positions(shards) == [[0, 1], [2]]
+    assert [shard['bytes'] for shard in shards] == [text_size(cards[0]) + text_size(cards[1]) + blob,
+                                                    text_size(cards[2]) + blob]
+    assert [shard['blobs'] for shard in shards] == [{'hash-x': blob}, {'hash-y': blob}]
+    assert all(shard['bytes'] <= 2000 for shard in shards)
+
+
+def test_card_over_the_budget_gets_its_own_package(tmp_path, caplog):
+    references = reference_map(tmp_path, 'x')
+    cards = [card(0), card(1, 'x'), card(2)]
+    shards = plan_shards(cards, parse_split('bytes=500'), references)
+    assert positions(shards) == [[0], [1], [2]]
+    assert [shard['bytes'] > 500 for shard in shards] == [False, True, False]
+    assert 'over the 500 byte budget' in caplog.text
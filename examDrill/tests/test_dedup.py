@@ -0,0 +1,54 @@
+"""
+Checks for dedup's MinHash signatures and duplicate clustering.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedup
+from dedup import NUM_PERM, dedup_cards, hash_params, minhash_signatures, shingles
+
+BEAM = 'A simply supported beam of length 4 m carries a uniform load of 2 kN/m. Find the maximum moment.'
+
+
+def card(number, question, tags):
+    return {'id': number, 'question': question, 'tags': tags}
+
+
+def test_numpy_and_python_signatures_agree():
+    np = pytest.importorskip('numpy')
+    shingle_sets = [shingles(dedup.normalize(text)) for text in (BEAM, 'short', '')] + [set()]
+    params = hash_params(16)
+    assert dedup._signatures_numpy(shingle_sets, params, np) == dedup._signatures_python(shingle_sets, params)
+    assert [len(signature) for signature in minhash_signatures(shingle_sets)] == [NUM_PERM] * 4
+
+
+def test_near_duplicates_cluster_and_drop_or_merge():
+    cards = [card(1, BEAM, 'Problem_1'),
+             card(2, 'What is the slope of the line through (1, 2) and (5, 0)?', 'Problem_2'),
+             card(3, BEAM.replace('4 m', '4m') + '  ', 'Problem_3,Statics')]
+
+    kept, clusters = dedup_cards(cards, 'report')
+    assert kept == cards
+    assert [[c['id'] for c in members] for members, _ in clusters] == [[1, 3]]
+    assert 0.8 <= clusters[0][1] < 1
+
+    kept, _ = dedup_cards([dict(c) for c in cards], 'drop')
+    assert [c['id'] for c in kept] == [1, 2]
+    kept, _ = dedup_cards([dict(c) for c in cards], 'merge')
+    assert [c['tags'] for c in kept] == ['Problem_1,Problem_3,Statics', 'Problem_2']
+
+
+def test_reference_deck_cards_are_never_kept():
+    reference = [card(9, BEAM, 'Problem_9')]
+    kept, _ = dedup_cards([card(1, BEAM, 'Problem_1'), card(2, 'Units of stress?', 'Problem_2')],
+                          'merge', reference=reference)
+    assert [c['id'] for c in kept] == [2]
+    assert reference[0]['tags'] == 'Problem_9'
@@ -0,0 +1,53 @@
+"""
+Checks for handbook_index's Aho-Corasick matcher and card tagging.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handbook_index import build_automaton, normalize, outermost, scan, tag_cards
+
+TERMS = ['thevenin equivalent circuit', 'equivalent circuit', 'circuit', 'mathematics']
+
+
+def terms_found(matches):
+    return [term for _, _, term in matches]
+
+
+def test_nested_terms_keep_only_the_outermost():
+    text = normalize("Find the *Thevenin-equivalent* circuit;\nthen the circuit.")
+    assert text == 'find the thevenin equivalent circuit then the circuit'
+    matches = scan(build_automaton(TERMS), text)
+    assert sorted(terms_found(matches)) == ['circuit', 'circuit', 'equivalent circuit',
+                                            'thevenin equivalent circuit']
+    kept = outermost(matches)
+    assert terms_found(kept) == ['thevenin equivalent circuit', 'circuit']
+    assert [text[start:end] for start, end, _ in kept] == terms_found(kept)
+
+
+def test_only_whole_words_match():
+    automaton = build_automaton(TERMS)
+    assert scan(automaton, normalize('Short circuits and subcircuit design')) == []
+    assert terms_found(scan(automaton, normalize('See the NCEES Handbook, Mathematics section.'))) == [
+        'mathematics']
+
+
+def test_cards_get_section_tags_once():
+    anchors = {
+        'mathematics': {'section': 'Mathematics', 'heading': None, 'page': 21},
+        'thevenin equivalent circuit': {'section': 'Electrical and Computer Engineering',
+                                        'heading': 'Thevenin Equivalent Circuit', 'page': 355},
+    }
+    index = {'automaton': build_automaton(list(anchors)), 'terms': anchors}
+    cards = [{'question': 'Mathematics: find the Thevenin equivalent circuit.', 'answer': 'See Mathematics.',
+              'tags': 'Problem_1'},
+             {'question': 'Units of stress?', 'answer': 'Pa', 'tags': 'Problem_2'}]
+    assert tag_cards(cards, index) == 1
+    assert cards[0]['tags'] == 'Problem_1,Handbook_Mathematics,Handbook_Electrical_and_Computer_Engineering'
+    assert [anchor['page'] for anchor in cards[0]['handbook']] == [21, 355]
+    assert (cards[1]['tags'], cards[1]['handbook']) == ('Problem_2', [])
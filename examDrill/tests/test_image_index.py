@@ -0,0 +1,41 @@
+"""
+Checks for image_index's perceptual-hash grouping.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_index import MASK64, find_groups
+
+MSB = 1 << 63
+
+
+def entry(sha256, phash, dhash):
+    return {'sha256': sha256, 'width': 100, 'height': 50, 'phash': phash, 'dhash': dhash}
+
+
+def test_polarity_keeps_near_matches_across_the_msb():
+    phash, dhash = 0x7F00FF00F0F0AA55, 0x0123456789ABCDEF
+    # Two bits apart, one of them the MSB: folding would put these ~60 bits apart
+    entries = {
+        'a.png': entry('a', phash, dhash),
+        'b.png': entry('b', phash ^ MSB ^ 1, dhash ^ MSB),
+        'c.png': entry('c', 0x0F0F0F0F0F0F0F0F, 0x5555555555555555),
+    }
+    assert find_groups(entries, distance=4) == [['a.png', 'b.png']]
+    assert find_groups(entries, distance=4, polarity=True) == [['a.png', 'b.png']]
+
+
+def test_polarity_matches_inverted_images():
+    phash, dhash = 0x7F00FF00F0F0AA55, 0x0123456789ABCDEF
+    entries = {
+        'light.png': entry('a', phash, dhash),
+        'dark.png': entry('b', phash ^ MASK64 ^ 2, dhash ^ MASK64),
+    }
+    assert find_groups(entries, distance=4) == []
+    assert find_groups(entries, distance=4, polarity=True) == [['dark.png', 'light.png']]
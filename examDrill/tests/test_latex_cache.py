@@ -0,0 +1,32 @@
+"""
+Checks for latex_cache's render naming and cache reuse.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import latex_cache
+from latex_cache import collect_fragments, fragment_name, render_fragments
+
+
+def test_second_run_hits_the_cache(tmp_path):
+    fragments = collect_fragments(['Find \\(x^2\\) and \\(y\\).', 'Again \\(x^2\\).'])
+    assert fragments == ['\\(x^2\\)', '\\(y\\)']
+
+    math_images, stats = render_fragments(fragments, 'stub', str(tmp_path))
+    assert stats == {'fragments': 2, 'hits': 0, 'rendered': 2, 'failed': 0}
+    assert os.path.basename(math_images['\\(y\\)']) == fragment_name('\\(y\\)') + '.svg'
+
+    again, stats = render_fragments(fragments, 'stub', str(tmp_path))
+    assert stats == {'fragments': 2, 'hits': 2, 'rendered': 0, 'failed': 0}
+    assert again == math_images
+
+
+def test_stub_renderer_is_not_offered():
+    assert 'stub' not in latex_cache.RENDERERS
+    assert latex_cache.renderer_available('stub')
@@ -0,0 +1,51 @@
+"""
+Regression checks for org_parser on malformed input.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from org_parser import card_number, iter_drill_cards, section_headings, split_shards
+
+
+def drill_file(cards=30, unterminated=(1,)):
+    """Lines of a small org-drill file; cards in ``unterminated`` lack :END:."""
+    lines = []
+    for number in range(cards):
+        lines += [f'*** {number}'.ljust(70) + ':drill:', ':PROPERTIES:', f':ID:       id-{number}']
+        if number in unterminated:
+            lines.append(':DRILL_EASE: 2.5')
+        else:
+            lines.append(':END:')
+        lines += ['', f'Question {number}?', '', '**** ', '', f'Answer {number}.', '']
+    return lines
+
+
+def card_ids(cards):
+    return [card_number(card, index) for index, card in enumerate(cards)]
+
+
+def test_unterminated_drawer_ends_at_next_headline():
+    cards = list(iter_drill_cards(drill_file()))
+    assert card_ids(cards) == [str(number) for number in range(30)]
+    assert cards[1]['properties'] == {'ID': 'id-1', 'DRILL_EASE': '2.5'}
+    assert cards[2]['properties'] == {'ID': 'id-2'}
+    assert cards[2]['question'] == 'Question 2?'
+    assert cards[2]['answer'] == 'Answer 2.'
+
+
+def test_shards_agree_with_serial_parse():
+    lines = ['** Exam 1'] + drill_file(unterminated=(1, 2, 15)) + ['** Exam 2'] + drill_file(cards=5, unterminated=())
+    serial = card_ids(iter_drill_cards(lines))
+    sharded = []
+    for first_line, card_offset, shard in split_shards(lines, 22):
+        for index, card in enumerate(iter_drill_cards(shard, first_line=first_line), card_offset):
+            sharded.append(card_number(card, index))
+    assert len(split_shards(lines, 22)) > 1
+    assert sharded == serial
+    assert section_headings(lines) == [(1, 2, 'Exam 1'), (332, 2, 'Exam 2')]
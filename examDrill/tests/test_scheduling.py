@@ -0,0 +1,67 @@
+"""
+Regression checks for scheduling's SM-2 projection and org write-back.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduling
+from scheduling import add_card, format_org_date, new_store, sm2_project, write_back
+
+TODAY = date(2024, 6, 28).toordinal()
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_sm2_interval_follows_repeats_since_fail(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(scheduling, '_numpy', lambda: None)
+    store = new_store()
+    for repeats in (0, 1, 2, 3):
+        add_card(store, f'card-{repeats}', {'DRILL_LAST_INTERVAL': '10', 'DRILL_EASE': '2.5',
+                                           'DRILL_REPEATS_SINCE_FAIL': str(repeats)}, None, TODAY)
+    intervals, eases = sm2_project(store, 5)
+    assert list(intervals)[:3] == [1.0, 1.0, 6.0]
+    assert intervals[3] == pytest.approx(10 * eases[3])
+
+
+def test_write_back_without_active_timestamp(tmp_path):
+    path = tmp_path / 'deck.org'
+    path.write_text('*** 1 :drill:\nSCHEDULED:\n\n*** 2 :drill:\nDEADLINE: <2024-07-01 Mon> SCHEDULED: [2024-06-01 Sat]\n'
+                    '\n*** 3 :drill:\nSCHEDULED: <2024-06-30 Sun>\n', encoding='utf-8')
+    due = TODAY + 2
+    assert write_back(str(path), {1: due, 4: due, 7: due}) == 2
+    stamp = format_org_date(due)
+    assert path.read_text(encoding='utf-8').splitlines() == [
+        '*** 1 :drill:', f'SCHEDULED: {stamp}', '',
+        '*** 2 :drill:', f'DEADLINE: <2024-07-01 Mon> SCHEDULED: {stamp}', '',
+        '*** 3 :drill:', f'SCHEDULED: {stamp}']
+
+
+def test_due_column_matches_its_int64_view(monkeypatch):
+    store = new_store()
+    add_card(store, 'new', {}, None, TODAY)
+    for number in range(3):
+        add_card(store, f'card-{number}', {'DRILL_LAST_INTERVAL': '4'}, format_org_date(TODAY + number), TODAY)
+    assert store['due'].itemsize == 8
+    with_numpy = scheduling.fsrs_project(store, 4)
+    monkeypatch.setattr(scheduling, '_numpy', lambda: None)
+    for column, expected in zip(with_numpy, scheduling.fsrs_project(store, 4)):
+        assert list(column) == pytest.approx(list(expected))
+
+
+def test_schedule_stays_out_of_the_ankiapp_xml():
+    from org_to_anki_xml import card_xml
+    card = {'front': 'Q', 'back': 'A', 'tags': 'Problem_1',
+            'schedule': {'due': '2024-06-30', 'interval': 6, 'ease': 2.5, 'new': False}}
+    assert card_xml(card) == ('    <card tags="Problem_1">\n'
+                              '      <rich-text name="Front">Q</rich-text>\n'
+                              '      <rich-text name="Back">A</rich-text>\n'
+                              '    </card>\n')
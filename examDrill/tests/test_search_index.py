@@ -0,0 +1,51 @@
+"""
+Checks for search_index's incremental updates and formula-aware ranking.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import search, update_index
+
+QUESTIONS = [
+    'What is the slope of the line through (1, 2) and (5, 0)?',
+    'Find the enthalpy change \\(\\Delta h\\) across the turbine.',
+    'A beam carries a uniform load; find the deflection.',
+]
+
+
+def write_deck(path, questions):
+    cards = []
+    for number, question in enumerate(questions):
+        cards.append(f'*** {number} :drill:\n:PROPERTIES:\n:ID:       id-{number}\n:END:\n\n'
+                     f'{question}\n\n**** \n\nAnswer {number}.\n')
+    path.write_text('\n'.join(cards), encoding='utf-8')
+
+
+def test_queries_rank_words_and_math(tmp_path):
+    deck, index = tmp_path / 'deck.org', str(tmp_path / 'index.sqlite')
+    write_deck(deck, QUESTIONS)
+    assert update_index(index, str(deck)) == (3, 0, 0, 0)
+
+    assert [r['tag'] for r in search(index, 'slope of a line')][0] == 'Problem_0'
+    assert [r['org_id'] for r in search(index, '\\Delta h')] == ['id-1']
+    # Unicode Greek in a query reads as its control sequence
+    assert [r['org_id'] for r in search(index, 'Δh')] == ['id-1']
+    assert search(index, 'viscosity') == []
+
+
+def test_reindex_touches_only_edited_cards(tmp_path):
+    deck, index = tmp_path / 'deck.org', str(tmp_path / 'index.sqlite')
+    write_deck(deck, QUESTIONS)
+    update_index(index, str(deck))
+    assert update_index(index, str(deck)) == (0, 0, 0, 3)
+
+    write_deck(deck, QUESTIONS[:1] + ['A shaft transmits torque; find the shear stress.'])
+    assert update_index(index, str(deck)) == (0, 1, 1, 1)
+    assert search(index, 'turbine') == []
+    assert [r['org_id'] for r in search(index, 'shear stress')] == ['id-1']
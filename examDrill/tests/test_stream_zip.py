@@ -0,0 +1,40 @@
+"""
+Checks for the AnkiApp ZIP that org_to_anki_xml streams in one pass.
+
+Usage:
+    python -m pytest examDrill/tests
+"""
+
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_store import put_file
+from org_to_anki_xml import stream_anki_zip
+
+
+def test_zip_holds_resolved_xml_and_each_blob_once(tmp_path):
+    image = tmp_path / 'beam.png'
+    image.write_bytes(b'\x89PNG beam')
+    hash_id, stored_path, _ = put_file(str(tmp_path / 'store'), str(image))
+    image_reference_map = {'beam': {'hash_id': hash_id, 'stored_path': stored_path}}
+    cards = [{'front': 'Find the load <img id="beam.png" />', 'back': 'A', 'tags': 'Problem_1'},
+             {'front': 'Again <img id="beam.png" />', 'back': 'B &amp; C', 'tags': 'Problem_2'}]
+
+    zip_path, is_valid, message = stream_anki_zip(cards, str(tmp_path), image_reference_map)
+    assert is_valid, message
+    with zipfile.ZipFile(zip_path) as zip_file:
+        assert zip_file.namelist() == ['anki_import.xml', 'blobs/' + hash_id]
+        assert zip_file.getinfo('blobs/' + hash_id).compress_type == zipfile.ZIP_STORED
+        assert zip_file.read('blobs/' + hash_id) == b'\x89PNG beam'
+        xml = zip_file.read('anki_import.xml').decode('utf-8')
+    assert xml.count(f'<img id="{hash_id}" />') == 2
+    assert 'beam.png' not in xml
+
+
+def test_malformed_xml_is_reported(tmp_path):
+    cards = [{'front': 'a < b', 'back': 'A', 'tags': 'Problem_1'}]
+    _, is_valid, _ = stream_anki_zip(cards, str(tmp_path), {})
+    assert not is_valid
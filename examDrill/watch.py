@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Watch Mode
+
+Keeps org_to_deck resident and rebuilds a deck whenever its org file or
+image directory changes (org_to_deck.py --watch):
+
+    python org_to_deck.py exam_drill.org anki_output --emit csv,preview --watch
+
+Changes are seen through inotify on Linux (loaded with ctypes, no extra
+dependency) and by polling file modification times everywhere else.
+Events arriving within DEBOUNCE seconds are handled as one change, so an
+editor's write-then-rename save triggers one rebuild.
+
+Between rebuilds the process keeps the image hash cache, the previous
+build manifest, every card's rendered fields and the resolved image map
+in memory (the ``warm`` dict of build_deck). A rebuild after editing one
+card therefore re-renders that card only, resolves images only when the
+image directory or the set of referenced images changed, and re-runs only
+the emitters whose inputs changed, so the edit shows up in the CSV and
+the preview in tens of milliseconds.
+"""
+
+import contextlib
+import ctypes
+import io
+import logging
+import os
+import select
+import struct
+import time
+
+import blob_store
+from hash_cache import default_cache_path, load_hash_cache, save_hash_cache
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE = 0.02
+POLL_INTERVAL = 0.25
+
+# inotify(7) event masks
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def open_inotify(directories):
+    """Watch ``directories`` with inotify; return (fd, {wd: directory}) or None if unavailable."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        inotify_init1, inotify_add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (AttributeError, OSError, TypeError):
+        return None
+    fd = inotify_init1(IN_NONBLOCK)
+    if fd < 0:
+        return None
+    watches = {}
+    for directory in directories:
+        wd = inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            os.close(fd)
+            return None
+        watches[wd] = directory
+    return fd, watches
+
+
+def read_events(fd, watches):
+    """Paths named by the pending inotify events on ``fd``."""
+    paths = set()
+    while True:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return paths
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if wd in watches:
+                paths.add(os.path.join(watches[wd], os.fsdecode(name)))
+
+
+def _inotify_changes(fd, watches):
+    while True:
+        select.select([fd], [], [])
+        paths = read_events(fd, watches)
+        while select.select([fd], [], [], DEBOUNCE)[0]:
+            paths |= read_events(fd, watches)
+        yield paths
+
+
+def snapshot(files, directories):
+    """{path: (mtime_ns, size)} of ``files`` and every entry of ``directories``."""
+    state = {}
+    paths = list(files)
+    for directory in directories:
+        with contextlib.suppress(OSError):
+            paths.extend(entry.path for entry in os.scandir(directory))
+    for path in paths:
+        with contextlib.suppress(OSError):
+            info = os.stat(path)
+            state[path] = (info.st_mtime_ns, info.st_size)
+    return state
+
+
+def _polled_changes(files, directories):
+    before = snapshot(files, directories)
+    while True:
+        time.sleep(POLL_INTERVAL)
+        after = snapshot(files, directories)
+        changed = {path for path in before.keys() | after.keys() if before.get(path) != after.get(path)}
+        before = after
+        if changed:
+            yield changed
+
+
+def watch_changes(files, directories, poll=False):
+    """Yield sets of changed paths among ``files`` and the contents of ``directories``.
+
+    Uses inotify on the files' directories when it is available (and
+    ``poll`` is false), otherwise polls; paths are normalized with abspath.
+    """
+    files = {os.path.abspath(path) for path in files}
+    directories = [os.path.abspath(path) for path in directories if os.path.isdir(path)]
+    inotify = None if poll else open_inotify(sorted({os.path.dirname(path) for path in files} | set(directories)))
+    if inotify is None:
+        logger.info("Watching %s file(s) and %s directory(ies) by polling", len(files), len(directories))
+        yield from _polled_changes(files, directories)
+        return
+    logger.info("Watching %s file(s) and %s directory(ies) with inotify", len(files), len(directories))
+    fd, watches = inotify
+    try:
+        for paths in _inotify_changes(fd, watches):
+            changed = {path for path in paths
+                       if path in files or os.path.dirname(path) in directories}
+            if changed:
+                yield changed
+    finally:
+        os.close(fd)
+
+
+def run_watch(input_file, output_dir, emitters, poll=False, **options):
+    """Build the deck, then rebuild it on every change until interrupted.
+
+    ``options`` are passed to org_to_deck.build_deck. The first build
+    logs its usual report; rebuilds log one line with the card changes,
+    the emitters that ran and the time taken. A failed rebuild is reported
+    and the watch goes on.
+    """
+    import org_to_deck
+
+    cache_path = default_cache_path(blob_store.default_store_dir())
+    hash_cache = load_hash_cache(cache_path)
+    warm = {}
+    image_dir = os.path.abspath(os.path.join(os.path.dirname(input_file), 'images'))
+    watched = [input_file] + list(options.get('dedup_against', ()))
+
+    org_to_deck.build_deck(input_file, output_dir, emitters, hash_cache=hash_cache, warm=warm, **options)
+    save_hash_cache(hash_cache, cache_path)
+    logger.info("Watching for changes (Ctrl-C to stop)")
+    try:
+        for changed in watch_changes(watched, [image_dir], poll):
+            if any(os.path.dirname(path) == image_dir for path in changed):
+                warm['images_dirty'] = True
+            names = ', '.join(sorted(os.path.basename(path) for path in changed))
+            start = time.perf_counter()
+            log = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(log):
+                    summary = org_to_deck.build_deck(input_file, output_dir, emitters, hash_cache=hash_cache,
+                                                     warm=warm, **options)
+            except Exception as e:
+                if log.getvalue():
+                    logger.info('%s', log.getvalue().rstrip('\n'))
+                logger.error("%s %s: error building deck: %s", time.strftime('%H:%M:%S'), names, e)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            added, changed_cards, removed = summary['changes']
+            logger.info("%s %s: %s added, %s changed, %s removed; emitted %s in %.0f ms",
+                        time.strftime('%H:%M:%S'), names, added, changed_cards, removed,
+                        ', '.join(summary['emitted']) or 'nothing', elapsed)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        if warm.get('saver'):
+            warm['saver'].join()
+        save_hash_cache(hash_cache, cache_path)
@@ -11,20 +11,13 @@ ORIGINAL_BACKGROUND_COLOR="#ffffff"
 # Define the directory containing the images
 IMAGE_DIR="./images"
 
-# Process each PNG image in the directory
-for image in "$IMAGE_DIR"/*.png; do
-    # Create a temporary image for processing
-    temp_image="${image%.png}_temp.png"
-    
-    # Convert the foreground and background colors
-    convert "$image" -fuzz 20% -fill "$TARGET_FOREGROUND_COLOR" -opaque "$ORIGINAL_FOREGROUND_COLOR" "$temp_image"
-    convert "$temp_image" -fuzz 20% -fill "$TARGET_BACKGROUND_COLOR" -opaque "$ORIGINAL_BACKGROUND_COLOR" "${image%.png}_colored.png"
-    
-    # Remove the temporary image
-    rm "$temp_image"
-    
-    # Optionally, replace the original image with the colored one
-    mv "${image%.png}_colored.png" "$image"
-done
+# Recolored copies go here; the originals are left untouched
+OUTPUT_DIR="./images_dark"
 
-echo "Images have been updated to the target colors: foreground $TARGET_FOREGROUND_COLOR and background $TARGET_BACKGROUND_COLOR"
+# Same fuzz-based substitution as the old pair of ImageMagick convert calls,
+# done in-process over all images and cached in the shared blob store
+python3 "$(dirname "$0")/../examDrill/recolor.py" "$IMAGE_DIR" "$OUTPUT_DIR" \
+    --fuzz 20 \
+    --palette "$ORIGINAL_FOREGROUND_COLOR=$TARGET_FOREGROUND_COLOR,$ORIGINAL_BACKGROUND_COLOR=$TARGET_BACKGROUND_COLOR" || exit 1
+
+echo "Images have been recolored into $OUTPUT_DIR: foreground $TARGET_FOREGROUND_COLOR and background $TARGET_BACKGROUND_COLOR"